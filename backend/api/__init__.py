@@ -1,37 +1,156 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import FileResponse
-from motor.motor_asyncio import AsyncIOMotorClient
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request, Response, Query, Depends
+from fastapi.responses import StreamingResponse
+from motor.motor_asyncio import AsyncIOMotorDatabase
 import os
 import logging
+import asyncio
+import itertools
+from contextlib import aclosing
 from pathlib import Path
-import shutil
 import uuid
 from datetime import datetime, timezone
-from typing import List
+from typing import List, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.background import BackgroundTask
 
 from models import (
-    StatusCheck, StatusCheckCreate, Project, ProjectCreate,
-    UserStyle, UserStyleCreate, LyricsRequest, LyricsResponse
+    StatusCheck, StatusCheckCreate, StatusSummary, Project, ProjectCreate, ProjectSummary,
+    UserStyle, UserStyleCreate, LyricsRequest, LyricsResponse, LyricsSelection,
+    UploadSessionCreate
 )
 from audio_processing import apply_audio_transformations
 from audio_processing.stem_separation import extract_stems_and_convert_to_midi
-from services import generate_lyrics, generate_lyrics_with_user_style
+from audio_processing.streaming_analysis import StreamingWavAnalyzer, STREAMING_ANALYSIS_AVAILABLE
+from services import generate_lyrics, generate_lyrics_with_user_style, stream_completion, lyrics_prompt, user_style_prompt
+from services import generate_variants, LYRICS_MAX_VARIANTS
+from services import resumable_uploads
+from services.llm_client import llm_pool, LLMBusyError
+from services.lyrics_cache import lyrics_cache
+from services.uploads import save_upload, save_upload_stream, UploadError
+from services.transform_jobs import TransformJobManager, TransformCancelled, SPECULATIVE_TRANSFORM
+from services.transform_lease import TransformLeases, TransformLeaseError
+from services.stems_archive import StemsArchiveCache, project_stem_entries
+from services.static_files import stored_file_response
+from services.blob_store import BlobStore, manifest_digest, parse_blob_name
+from services.blob_drivers import create_blob_driver, BLOB_URL_TTL_SECONDS
+from services.lyrics_export import LyricsDocumentCache, LYRICS_FORMATS
+from services.document_cache import DocumentCache
+from services.change_streams import ChangeStreamWatcher, MONGO_CHANGE_STREAMS
+from services.project_events import ProjectEventBus, PROJECT_STATE_FIELDS, project_state, format_sse
+from services.upload_gc import UploadsGarbageCollector
+from services.database import mongo, get_database
+from services.fast_json import list_response, FAST_JSON_RESPONSES
+from services.status_buffer import StatusCheckBuffer, status_summary, STATUS_BUCKETS
+from services.db_indexes import ensure_indexes
+from services.timestamp_migration import migrate_timestamps
+from services.pagination import (
+    paginate, set_page_headers, field_projection, InvalidCursor, InvalidFields, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+)
 
 logger = logging.getLogger(__name__)
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# MongoDB: one pooled client per process, connected in the app lifespan (see services/database.py).
+# Routes take the database with Depends(get_database) and pass it to their helpers; the long-lived
+# services below hold mongo.proxy, which resolves to the connected database when used.
 
 # Upload directory
 UPLOAD_DIR = Path(__file__).parent.parent / "uploads"
 UPLOAD_DIR.mkdir(exist_ok=True)
 
+# Content-addressed artifact storage (uploads/blobs/ab/cd/<sha256>), optionally backed by
+# remote storage selected with BLOB_STORAGE_DRIVER
+blob_store = BlobStore(UPLOAD_DIR, driver=create_blob_driver())
+
+# Decode and analyze WAV uploads while they arrive (can also be requested per upload with ?analyze=true)
+UPLOAD_STREAM_ANALYSIS = os.environ.get('UPLOAD_STREAM_ANALYSIS', 'false').lower() == 'true'
+WAV_CONTENT_TYPES = ['audio/wav', 'audio/x-wav']
+
+# Stems ZIPs are built once per stems manifest and served from here
+stems_archives = StemsArchiveCache(UPLOAD_DIR / ".cache" / "stems")
+
+# Lyrics downloads are rendered in memory, per lyrics revision
+lyrics_documents = LyricsDocumentCache()
+
+# Recently read projects and user styles; every write below invalidates what it changes
+project_cache = DocumentCache(mongo.proxy, "projects")
+user_style_cache = DocumentCache(mongo.proxy, "user_styles")
+
+# Progress pushed to clients subscribed to a project (GET /api/projects/{id}/events)
+project_events = ProjectEventBus()
+
+# One change stream per collection for this process, shared by the caches and the event bus
+project_changes = ChangeStreamWatcher(mongo.proxy, "projects", full_document_fields=PROJECT_STATE_FIELDS)
+user_style_changes = ChangeStreamWatcher(mongo.proxy, "user_styles")
+project_cache.attach(project_changes)
+project_events.attach(project_changes)
+user_style_cache.attach(user_style_changes)
+
+# Status checks are written in batches (see services/status_buffer.py)
+status_buffer = StatusCheckBuffer(mongo.proxy)
+
 # Create router
 api_router = APIRouter(prefix="/api")
 
 
+# Long-running maintenance tasks (kept referenced so they aren't garbage collected)
+background_tasks = []
+
+# Index state verified at startup (GET /api/db/indexes)
+index_report = {}
+
+
+async def _prepare_database():
+    db = mongo.proxy
+    try:
+        index_report.update(await ensure_indexes(db))
+        # Online conversion of timestamps written as ISO strings by older versions
+        if any((await migrate_timestamps(db)).values()):
+            project_cache.clear()
+            user_style_cache.clear()
+    except Exception as e:
+        logger.error(f"Error preparing database: {str(e)}")
+
+
+async def start_background_tasks():
+    """Called from the app lifespan once the database client is connected"""
+    # Run in the background so a large collection doesn't hold up startup
+    background_tasks.append(asyncio.create_task(_prepare_database()))
+    project_events.start()
+    llm_pool.start()
+    status_buffer.start()
+    transform_jobs.start()
+    background_tasks.append(asyncio.create_task(resumable_uploads.run_session_sweeper(mongo.proxy, UPLOAD_DIR)))
+    background_tasks.append(asyncio.create_task(uploads_gc.run_forever()))
+    if MONGO_CHANGE_STREAMS:
+        # Hear about writes by other processes as soon as they happen
+        for watcher in (project_changes, user_style_changes):
+            background_tasks.append(asyncio.create_task(watcher.run()))
+
+
+async def stop_background_tasks():
+    """Called from the app lifespan before the database client is closed"""
+    await transform_jobs.stop()
+    await status_buffer.stop()
+    await llm_pool.stop()
+    for task in background_tasks:
+        task.cancel()
+
+
+async def _list_page(response, collection, sort_by, sortable, order, limit, after, include_total, projection=None):
+    """One keyset-paginated page of a listing; the next cursor and total go in response headers"""
+    if sort_by not in sortable:
+        raise HTTPException(status_code=400, detail=f"Cannot sort by '{sort_by}'. Choose from: {', '.join(sortable)}")
+    try:
+        docs, next_cursor, total = await paginate(
+            collection, sort_by, order, limit, after, include_total=include_total, projection=projection or {"_id": 0}
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    set_page_headers(response, next_cursor, total)
+    return docs
+
+
 # Health check
 @api_router.get("/")
 async def root():
@@ -43,27 +162,49 @@ async def root():
 async def create_status_check(input: StatusCheckCreate):
     status_check = StatusCheck(client_name=input.client_name)
     
-    await db.status_checks.insert_one(status_check.model_dump())
-    logger.info(f"Created status check for client: {input.client_name}")
+    # Written with the next batch; listings and summaries see it after the flush
+    await status_buffer.write(status_check.model_dump())
+    logger.debug(f"Queued status check for client: {input.client_name}")
     
     return status_check
 
 
 @api_router.get("/status", response_model=List[StatusCheck])
-async def get_status_checks():
-    status_checks = await db.status_checks.find().to_list(100)
-    
-    # Convert string timestamps back to datetime if needed
-    for check in status_checks:
-        if isinstance(check.get('timestamp'), str):
-            check['timestamp'] = datetime.fromisoformat(check['timestamp'])
+async def get_status_checks(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    include_total: bool = False,
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    status_checks = await _list_page(
+        response, db.status_checks, "timestamp", ("timestamp",), order, limit, after, include_total
+    )
     
+    if FAST_JSON_RESPONSES != "off":
+        return list_response(response, status_checks, StatusCheck, FAST_JSON_RESPONSES)
     return [StatusCheck(**check) for check in status_checks]
 
 
+@api_router.get("/status/summary", response_model=StatusSummary)
+async def get_status_summary(
+    bucket: str = Query("hour", pattern=f"^({'|'.join(STATUS_BUCKETS)})$"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    client_name: Optional[str] = None,
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    try:
+        summary = await status_summary(db.status_checks, bucket, since, until, client_name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StatusSummary(**summary, pending=status_buffer.metrics()["pending"])
+
+
 # Project endpoints
 @api_router.post("/projects", response_model=Project)
-async def create_project(project: ProjectCreate):
+async def create_project(project: ProjectCreate, db: AsyncIOMotorDatabase = Depends(get_database)):
     new_project = Project(name=project.name)
     
     await db.projects.insert_one(new_project.model_dump())
@@ -72,72 +213,297 @@ async def create_project(project: ProjectCreate):
     return new_project
 
 
-@api_router.get("/projects", response_model=List[Project])
-async def get_projects():
-    projects = await db.projects.find().to_list(100)
+# The listed model is the full Project; ?view=summary and ?fields= return slimmer documents
+@api_router.get("/projects", response_model=None, responses={200: {"model": List[Project]}})
+async def get_projects(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    sort_by: str = "created_at",
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    include_total: bool = False,
+    view: str = Query("full", pattern="^(full|summary)$"),
+    fields: Optional[str] = None,
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    model = ProjectSummary if view == "summary" else Project
+    projection = None
+    try:
+        if fields:
+            projection = field_projection(fields, Project.model_fields, required=("id", sort_by))
+        elif view == "summary":
+            projection = field_projection(ProjectSummary.model_fields, ProjectSummary.model_fields)
+    except InvalidFields as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    projects = await _list_page(
+        response, db.projects, sort_by, ("created_at", "updated_at"), order, limit, after, include_total, projection
+    )
     
-    # Convert string timestamps back to datetime if needed
-    for project in projects:
-        if isinstance(project.get('created_at'), str):
-            project['created_at'] = datetime.fromisoformat(project['created_at'])
-        if isinstance(project.get('updated_at'), str):
-            project['updated_at'] = datetime.fromisoformat(project['updated_at'])
+    if fields:
+        # Exactly the requested fields, as stored
+        if FAST_JSON_RESPONSES != "off":
+            return list_response(response, projects)
+        return projects
     
-    return [Project(**project) for project in projects]
+    if FAST_JSON_RESPONSES != "off":
+        return list_response(response, projects, model, FAST_JSON_RESPONSES)
+    return [model(**project) for project in projects]
 
 
 @api_router.get("/projects/{project_id}", response_model=Project)
 async def get_project(project_id: str):
-    project = await db.projects.find_one({"id": project_id})
+    # Polled while transforms run: served from memory while cached
+    project = await project_cache.get(project_id)
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    if isinstance(project.get('created_at'), str):
-        project['created_at'] = datetime.fromisoformat(project['created_at'])
-    if isinstance(project.get('updated_at'), str):
-        project['updated_at'] = datetime.fromisoformat(project['updated_at'])
-    
     return Project(**project)
 
 
+async def _record_original_upload(db, project, filename, metadata, analysis=None):
+    """Point the project at a newly stored original file"""
+    # The previous original and its analysis are reclaimed by the uploads GC once unreferenced
+    await db.projects.update_one(
+        {"id": project['id']},
+        {
+            "$set": {
+                "original_file": filename,
+                "original_metadata": metadata,
+                "analysis": analysis,
+                "updated_at": datetime.now(timezone.utc)
+            }
+        }
+    )
+    project_cache.invalidate(project['id'])
+    
+    # Work on the replaced file is now stale
+    transform_jobs.cancel(project['id'], "original file replaced")
+    
+    if SPECULATIVE_TRANSFORM:
+        # Most projects go upload -> transform, so start it now at low priority
+        transform_jobs.submit(
+            project['id'], filename, metadata['sha256'],
+            resampled_cache=(analysis or {}).get('resampled_cache'), speculative=True
+        )
+
+
+def _stream_analyzer(content_type, total_size, analyze):
+    """Create a streaming analyzer when pipelined processing is requested"""
+    if analyze is None:
+        analyze = UPLOAD_STREAM_ANALYSIS
+    if not analyze or not STREAMING_ANALYSIS_AVAILABLE or content_type not in WAV_CONTENT_TYPES:
+        return None
+    return StreamingWavAnalyzer(total_size)
+
+
+async def _finish_stream_analysis(project_id, analyzer):
+    """Finalize streaming analysis, writing the 22050 Hz cache used by the transform"""
+    if analyzer is None or analyzer.error or analyzer.header is None:
+        return None
+    
+    cache_path = blob_store.temp_path(".npy")
+    try:
+        analysis = await run_in_threadpool(analyzer.finish, cache_path)
+        cache_name = await run_in_threadpool(blob_store.ingest, cache_path, None, ".npy")
+    except Exception as e:
+        logger.warning(f"Streaming analysis failed for project {project_id}: {str(e)}")
+        cache_path.unlink(missing_ok=True)
+        return None
+    
+    analysis["resampled_cache"] = cache_name
+    return analysis
+
+
 # File Upload
 @api_router.post("/projects/{project_id}/upload")
-async def upload_file(project_id: str, file: UploadFile = File(...)):
+async def upload_file(
+    project_id: str,
+    file: UploadFile = File(...),
+    analyze: Optional[bool] = None,
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
     # Check if project exists
     project = await db.projects.find_one({"id": project_id})
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    # Validate file type
-    allowed_types = ['audio/mpeg', 'audio/wav', 'audio/mp3', 'audio/x-wav']
-    if file.content_type not in allowed_types:
-        raise HTTPException(status_code=400, detail="Invalid file type. Please upload audio files only.")
+    # Stream to disk off the event loop, hashing and probing as it arrives
+    analyzer = _stream_analyzer(file.content_type, file.size, analyze)
+    try:
+        filename, metadata = await save_upload(file, blob_store, analyzer=analyzer)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     
-    # Save file
-    file_extension = Path(file.filename).suffix
-    filename = f"{project_id}_original{file_extension}"
-    file_path = UPLOAD_DIR / filename
+    analysis = await _finish_stream_analysis(project_id, analyzer)
+    await _record_original_upload(db, project, filename, metadata, analysis)
     
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    return {"message": "File uploaded successfully", "filename": filename, "metadata": metadata, "analysis": analysis}
+
+
+@api_router.put("/projects/{project_id}/upload")
+async def upload_file_stream(
+    project_id: str,
+    request: Request,
+    filename: Optional[str] = None,
+    analyze: Optional[bool] = None,
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Upload the raw file as the request body; decoding and analysis start as the bytes arrive"""
+    project = await db.projects.find_one({"id": project_id})
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
     
-    # Update project
-    await db.projects.update_one(
-        {"id": project_id},
-        {
-            "$set": {
-                "original_file": filename,
-                "updated_at": datetime.now(timezone.utc).isoformat()
-            }
-        }
-    )
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    content_length = request.headers.get("content-length")
+    total_size = int(content_length) if content_length and content_length.isdigit() else None
+    
+    analyzer = _stream_analyzer(content_type, total_size, analyze)
+    try:
+        stored_filename, metadata = await save_upload_stream(
+            request.stream(), blob_store, content_type, filename,
+            declared_size=total_size, analyzer=analyzer
+        )
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    
+    analysis = await _finish_stream_analysis(project_id, analyzer)
+    await _record_original_upload(db, project, stored_filename, metadata, analysis)
+    
+    return {"message": "File uploaded successfully", "filename": stored_filename, "metadata": metadata, "analysis": analysis}
+
+
+# Resumable Uploads
+@api_router.post("/projects/{project_id}/uploads")
+async def create_upload_session(project_id: str, request: UploadSessionCreate, db: AsyncIOMotorDatabase = Depends(get_database)):
+    project = await db.projects.find_one({"id": project_id})
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    
+    try:
+        session = await resumable_uploads.create_session(
+            db, UPLOAD_DIR, project_id, request.filename, request.content_type,
+            request.total_size, request.sha256
+        )
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    
+    return resumable_uploads.session_status(session)
+
+
+@api_router.get("/projects/{project_id}/uploads/{session_id}")
+async def get_upload_session(project_id: str, session_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
+    try:
+        session = await resumable_uploads.get_session(db, project_id, session_id)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     
-    return {"message": "File uploaded successfully", "filename": filename}
+    return resumable_uploads.session_status(session)
+
+
+@api_router.put("/projects/{project_id}/uploads/{session_id}")
+async def upload_chunk(project_id: str, session_id: str, offset: int, request: Request, db: AsyncIOMotorDatabase = Depends(get_database)):
+    try:
+        session = await resumable_uploads.get_session(db, project_id, session_id)
+        session = await resumable_uploads.write_chunk(db, UPLOAD_DIR, session, offset, request.stream())
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    
+    return resumable_uploads.session_status(session)
+
+
+@api_router.post("/projects/{project_id}/uploads/{session_id}/complete")
+async def complete_upload_session(project_id: str, session_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
+    project = await db.projects.find_one({"id": project_id})
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    
+    try:
+        session = await resumable_uploads.get_session(db, project_id, session_id)
+        filename, metadata = await resumable_uploads.complete_session(
+            db, UPLOAD_DIR, session, blob_store
+        )
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    
+    await _record_original_upload(db, project, filename, metadata)
+    
+    return {"message": "File uploaded successfully", "filename": filename, "metadata": metadata}
+
+
+@api_router.delete("/projects/{project_id}/uploads/{session_id}")
+async def abort_upload_session(project_id: str, session_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
+    try:
+        session = await resumable_uploads.get_session(db, project_id, session_id)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    
+    await resumable_uploads.abort_session(db, UPLOAD_DIR, session)
+    return {"message": "Upload session aborted"}
 
 
 # Beat Transformation (Advanced Audio-to-MIDI Conversion)
+def _source_revision(project, original_path):
+    """Identify the exact original file a transform was computed from"""
+    metadata = project.get('original_metadata') or {}
+    if metadata.get('sha256'):
+        return metadata['sha256']
+    return f"{project['original_file']}:{original_path.stat().st_mtime_ns}"
+
+
+def _run_transform(source_name, output_dir, resampled_cache=None, progress=None):
+    """Transform worker: fetch the inputs by name (from remote storage if needed) and convert"""
+    source_path = blob_store.local_path(source_name)
+    if source_path is None:
+        return {"success": False, "error": "Original file not found"}
+    cache_path = blob_store.local_path(resampled_cache) if resampled_cache else None
+    return extract_stems_and_convert_to_midi(
+        str(source_path), output_dir, resampled_cache=str(cache_path) if cache_path else None, progress=progress
+    )
+
+
+async def _persist_transform(job, output_dir):
+    """Store a finished transform's files as blobs and point its project at them"""
+    result = job.result
+    manifest = await run_in_threadpool(blob_store.ingest_tree, output_dir)
+    # Only the holder of the project's transform lease may publish its result
+    completed = await transform_leases.complete(job.project_id, job.id, {
+        "stems_manifest": manifest,
+        "stems_tree": manifest_digest(manifest),
+        "stems_directory": None,
+        "midi_files": result.get("stem_midis", []),
+        "musicxml_files": result.get("musicxml_files", []),
+        "main_midi": result.get("main_midi"),
+        "stems_created": result.get("stems_created", []),
+        "transformation_type": "advanced_stems_midi",
+        "transformation_complete": True,
+        "transform_revision": job.revision,
+        "updated_at": datetime.now(timezone.utc)
+    })
+    if not completed:
+        raise TransformLeaseError("Transform lease was taken over by another worker")
+
+
+# Claims projects across processes so each is transformed by one worker at a time
+transform_leases = TransformLeases(mongo.proxy, on_change=project_cache.invalidate)
+transform_jobs = TransformJobManager(
+    UPLOAD_DIR, _run_transform, on_complete=_persist_transform, leases=transform_leases, events=project_events
+)
+
+
+def _transform_response(result, job=None):
+    return {
+        "message": "Beat successfully converted to MIDI stems and MusicXML files",
+        "main_midi": result.get("main_midi"),
+        "stem_midis": result.get("stem_midis", []),
+        "musicxml_files": result.get("musicxml_files", []),
+        "stems_created": result.get("stems_created", []),
+        "job": job.to_dict() if job else None
+    }
+
+
 @api_router.post("/projects/{project_id}/transform")
-async def transform_beat(project_id: str):
+async def transform_beat(project_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
     project = await db.projects.find_one({"id": project_id})
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
@@ -145,132 +511,310 @@ async def transform_beat(project_id: str):
     if not project.get('original_file'):
         raise HTTPException(status_code=400, detail="No original file found. Please upload a file first.")
     
-    original_path = UPLOAD_DIR / project['original_file']
-    if not original_path.exists():
+    if not await run_in_threadpool(blob_store.exists, project['original_file']):
         raise HTTPException(status_code=404, detail="Original file not found")
     
+    revision = _source_revision(project, blob_store.resolve(project['original_file']))
+    
+    # A (possibly speculative) transform of this exact file already finished
+    if (project.get('transformation_complete') and project.get('transform_revision') == revision
+            and await run_in_threadpool(project_stem_entries, blob_store, project)):
+        return _transform_response({
+            "main_midi": project.get("main_midi"),
+            "stem_midis": project.get("midi_files", []),
+            "musicxml_files": project.get("musicxml_files", []),
+            "stems_created": project.get("stems_created", [])
+        }, transform_jobs.get(project_id))
+    
+    # Attach to a queued/running job for this file, or start one
+    job = transform_jobs.submit(
+        project_id, project['original_file'], revision,
+        resampled_cache=(project.get('analysis') or {}).get('resampled_cache')
+    )
+    logger.info(f"Transform request for project {project_id} attached to job {job.id} ({job.status})")
+    
     try:
-        logger.info(f"Starting advanced audio-to-MIDI transformation for project {project_id}")
-        
-        # Create transformation output directory
-        transform_dir = UPLOAD_DIR / f"{project_id}_stems"
-        transform_dir.mkdir(exist_ok=True)
-        
-        # Apply advanced audio-to-MIDI conversion
-        logger.info("Calling extract_stems_and_convert_to_midi...")
-        transformation_result = extract_stems_and_convert_to_midi(str(original_path), str(transform_dir))
-        
-        if not transformation_result.get("success"):
-            logger.error(f"Transformation failed: {transformation_result.get('error', 'Unknown error')}")
-            raise HTTPException(status_code=500, detail=f"Audio transformation failed: {transformation_result.get('error', 'Unknown error')}")
-        
-        logger.info(f"Transformation successful. Files created: {transformation_result.get('stem_midis', [])}")
-        
-        # Update project with transformation results
-        await db.projects.update_one(
-            {"id": project_id},
-            {
-                "$set": {
-                    "stems_directory": f"{project_id}_stems",
-                    "midi_files": transformation_result.get("stem_midis", []),
-                    "musicxml_files": transformation_result.get("musicxml_files", []),
-                    "main_midi": transformation_result.get("main_midi"),
-                    "transformation_type": "advanced_stems_midi",
-                    "transformation_complete": True,
-                    "updated_at": datetime.now(timezone.utc).isoformat()
-                }
-            }
-        )
-        
-        logger.info(f"Advanced transformation completed for project {project_id}")
-        return {
-            "message": "Beat successfully converted to MIDI stems and MusicXML files",
-            "main_midi": transformation_result.get("main_midi"),
-            "stem_midis": transformation_result.get("stem_midis", []),
-            "musicxml_files": transformation_result.get("musicxml_files", []),
-            "stems_created": transformation_result.get("stems_created", [])
-        }
-        
+        result = await job.wait()
+    except TransformCancelled as e:
+        raise HTTPException(status_code=409, detail=f"Beat transformation cancelled: {str(e)}")
     except Exception as e:
         logger.error(f"Error in beat transformation: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Beat transformation failed: {str(e)}")
+    
+    return _transform_response(result, job)
+
+
+@api_router.get("/projects/{project_id}/transform")
+async def get_transform_status(project_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
+    job = transform_jobs.get(project_id)
+    if job:
+        return job.to_dict()
+    
+    # Not known to this process: report the transform state shared by all workers
+    project = await db.projects.find_one(
+        {"id": project_id, "transform_state": {"$exists": True}},
+        {"_id": 0, "transform_state": 1, "transform_lease": 1, "transform_error": 1}
+    )
+    if not project:
+        raise HTTPException(status_code=404, detail="No transform job for this project")
+    lease = project.get("transform_lease") or {}
+    return {
+        "id": lease.get("job_id"),
+        "project_id": project_id,
+        "status": project["transform_state"],
+        "owner": lease.get("owner"),
+        "revision": lease.get("revision"),
+        "error": project.get("transform_error"),
+        "heartbeat_at": lease.get("heartbeat_at"),
+        "expires_at": lease.get("expires_at"),
+    }
+
+
+@api_router.get("/projects/{project_id}/events")
+async def stream_project_events(project_id: str, request: Request):
+    """Server-Sent Events: the project's current state, then job, progress, lyrics and project changes as they happen"""
+    project = await project_cache.get(project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    
+    # Subscribe before taking the snapshot so nothing in between is missed
+    subscription = project_events.subscribe(project_id)
+    initial = [project_events.event(project_id, "project", project=project_state(project))]
+    job = transform_jobs.get(project_id)
+    if job:
+        initial.append(project_events.event(project_id, "job", job=job.to_dict()))
+    
+    return StreamingResponse(
+        project_events.stream(subscription, request, initial),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@api_router.get("/events/metrics")
+async def event_metrics():
+    return {
+        **project_events.metrics(),
+        "change_streams": {"projects": project_changes.state, "user_styles": user_style_changes.state},
+    }
+
+
+def _transform_in_progress(project_id):
+    job = transform_jobs.get(project_id)
+    return bool(job and job.active)
+
+
+uploads_gc = UploadsGarbageCollector(
+    mongo.proxy, UPLOAD_DIR, store=blob_store, cache_dirs=[stems_archives.cache_dir], is_busy=_transform_in_progress,
+    on_project_change=project_cache.invalidate
+)
+
+
+# Database maintenance
+@api_router.get("/db/indexes")
+async def get_index_report():
+    return index_report
+
+
+@api_router.get("/db/pool")
+async def get_pool_stats():
+    """Connection pool settings and live counts (open, checked out, waiting) per server"""
+    return mongo.pool_stats()
+
+
+@api_router.get("/cache/metrics")
+async def cache_metrics():
+    """Hit rates, entry counts and approximate memory use of the document caches, and the lyrics cache's savings"""
+    return {
+        "projects": project_cache.metrics(),
+        "user_styles": user_style_cache.metrics(),
+        "lyrics": lyrics_cache.metrics(),
+    }
+
+
+# Storage maintenance
+@api_router.get("/storage/metrics")
+async def storage_metrics():
+    return uploads_gc.metrics()
+
+
+@api_router.post("/storage/gc")
+async def collect_storage():
+    reclaimed = await uploads_gc.run_once()
+    return {"bytes_reclaimed": reclaimed, **uploads_gc.metrics()}
 
 
 # Download stems
 @api_router.get("/projects/{project_id}/download-stems")
-async def download_stems(project_id: str):
-    project = await db.projects.find_one({"id": project_id})
+async def download_stems(project_id: str, request: Request):
+    project = await project_cache.get(project_id)
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    if not project.get('stems_directory'):
+    if not project.get('stems_manifest') and not project.get('stems_directory'):
         raise HTTPException(status_code=400, detail="No stems available for this project")
     
-    stems_dir = UPLOAD_DIR / project['stems_directory']
-    if not stems_dir.exists():
+    stems = await run_in_threadpool(project_stem_entries, blob_store, project)
+    if not stems:
         raise HTTPException(status_code=404, detail="Stems directory not found")
     
-    # Create a zip file of all stems
-    import zipfile
-    zip_path = UPLOAD_DIR / f"{project_id}_stems.zip"
-    
-    with zipfile.ZipFile(zip_path, 'w') as zipf:
-        for file_path in stems_dir.glob("*"):
-            if file_path.is_file():
-                zipf.write(file_path, file_path.name)
-    
-    return FileResponse(
-        path=zip_path,
-        filename=f"{project['name']}_stems.zip",
-        media_type="application/zip"
-    )
+    entries, manifest_hash = stems
+    return await stems_archives.response(request, project_id, entries, manifest_hash, f"{project['name']}_stems.zip")
 
 
 # Lyrics Generation
 @api_router.post("/projects/{project_id}/generate-lyrics", response_model=LyricsResponse)
-async def generate_project_lyrics(project_id: str, request: LyricsRequest):
-    project = await db.projects.find_one({"id": project_id})
+async def generate_project_lyrics(project_id: str, request: LyricsRequest, db: AsyncIOMotorDatabase = Depends(get_database)):
+    project = await project_cache.get(project_id)
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
+    if request.count > LYRICS_MAX_VARIANTS:
+        raise HTTPException(status_code=400, detail=f"At most {LYRICS_MAX_VARIANTS} variants per request")
     
     try:
+        user_style = None
         if request.user_style_id:
             # Use custom user style
-            user_style = await db.user_styles.find_one({"id": request.user_style_id})
+            user_style = await user_style_cache.get(request.user_style_id)
             if not user_style:
                 raise HTTPException(status_code=404, detail="User style not found")
-            
-            lyrics = await generate_lyrics_with_user_style(user_style, request.custom_prompt)
-            style_name = user_style['name']
+        style_name = user_style['name'] if user_style else request.style
+        
+        variants = None
+        if request.count > 1:
+            # All takes from one upstream request; the first becomes the project's lyrics
+            prompt = user_style_prompt(user_style, request.custom_prompt) if user_style else lyrics_prompt(request)
+            variants = await generate_variants(prompt, request.count, request.fresh)
+            lyrics = variants[0]
+        elif user_style:
+            lyrics = await generate_lyrics_with_user_style(user_style, request.custom_prompt, request.fresh)
         else:
             # Use predefined style
             lyrics_response = await generate_lyrics(request)
             lyrics = lyrics_response.lyrics
-            style_name = request.style
         
-        # Update project with lyrics
-        await db.projects.update_one(
-            {"id": project_id},
-            {
-                "$set": {
-                    "lyrics": lyrics,
-                    "style": style_name,
-                    "updated_at": datetime.now(timezone.utc).isoformat()
-                }
-            }
-        )
+        await _save_lyrics(db, project_id, lyrics, style_name, variants)
         
         logger.info(f"Generated lyrics for project {project_id} in {style_name} style")
-        return LyricsResponse(lyrics=lyrics, style=style_name)
+        return LyricsResponse(lyrics=lyrics, style=style_name, variants=variants)
         
+    except HTTPException:
+        raise
+    except LLMBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
         logger.error(f"Error generating lyrics: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to generate lyrics: {str(e)}")
 
 
+async def _save_lyrics(db, project_id, lyrics, style_name, variants=None):
+    await db.projects.update_one(
+        {"id": project_id},
+        {
+            "$set": {
+                "lyrics": lyrics,
+                "lyrics_variants": variants,
+                "style": style_name,
+                "updated_at": datetime.now(timezone.utc)
+            },
+            "$inc": {"lyrics_revision": 1}
+        }
+    )
+    project_cache.invalidate(project_id)
+    project_events.publish(project_id, "lyrics", style=style_name)
+
+
+@api_router.post("/projects/{project_id}/select-lyrics", response_model=LyricsResponse)
+async def select_project_lyrics(project_id: str, selection: LyricsSelection, db: AsyncIOMotorDatabase = Depends(get_database)):
+    """Make one of the project's generated variants its lyrics"""
+    project = await db.projects.find_one(
+        {"id": project_id}, {"_id": 0, "lyrics_variants": 1, "lyrics_revision": 1, "style": 1}
+    )
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    
+    variants = project.get("lyrics_variants") or []
+    if selection.variant >= len(variants):
+        raise HTTPException(status_code=400, detail=f"The project has {len(variants)} lyric variants")
+    
+    # Only if no other write replaced the lyrics since we read them
+    result = await db.projects.update_one(
+        {"id": project_id, "lyrics_revision": project.get("lyrics_revision", 0)},
+        {
+            "$set": {"lyrics": variants[selection.variant], "updated_at": datetime.now(timezone.utc)},
+            "$inc": {"lyrics_revision": 1}
+        }
+    )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=409, detail="The project's lyrics changed, reload and try again")
+    project_cache.invalidate(project_id)
+    project_events.publish(project_id, "lyrics", style=project.get("style"), variant=selection.variant)
+    
+    return LyricsResponse(lyrics=variants[selection.variant], style=project.get("style") or "", variants=variants)
+
+
+async def _lyrics_stream(db, project_id, prompt, style_name, fresh=False):
+    """SSE body: `start` at once, a `token` per chunk from the model, then `done` once the lyrics are saved (or `error`)"""
+    sequence = itertools.count(1)
+    
+    def event(event_type, **data):
+        return format_sse({"seq": next(sequence), "type": event_type, **data})
+    
+    # Sent before the model is called, so the client sees the response start right away
+    yield event("start", project_id=project_id, style=style_name)
+    chunks = []
+    try:
+        async with aclosing(stream_completion(prompt, fresh=fresh)) as deltas:
+            async for delta in deltas:
+                chunks.append(delta)
+                yield event("token", text=delta)
+        
+        lyrics = "".join(chunks).strip()
+        await _save_lyrics(db, project_id, lyrics, style_name)
+        logger.info(f"Streamed lyrics for project {project_id} in {style_name} style")
+        yield event("done", lyrics=lyrics, style=style_name)
+    except Exception as e:
+        logger.error(f"Error streaming lyrics: {str(e)}")
+        yield event("error", detail=f"Failed to generate lyrics: {str(e)}")
+
+
+@api_router.post("/projects/{project_id}/generate-lyrics/stream")
+async def stream_project_lyrics(project_id: str, request: LyricsRequest, db: AsyncIOMotorDatabase = Depends(get_database)):
+    """Like generate-lyrics, but the lyrics arrive as Server-Sent Events while the model writes them"""
+    project = await project_cache.get(project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    if request.count > 1:
+        raise HTTPException(status_code=400, detail="Streaming generates one take; use generate-lyrics for variants")
+    
+    if request.user_style_id:
+        user_style = await user_style_cache.get(request.user_style_id)
+        if not user_style:
+            raise HTTPException(status_code=404, detail="User style not found")
+        prompt = user_style_prompt(user_style, request.custom_prompt)
+        style_name = user_style['name']
+    else:
+        prompt = lyrics_prompt(request)
+        style_name = request.style
+    
+    events = _lyrics_stream(db, project_id, prompt, style_name, request.fresh)
+    # Starlette drops the body of a disconnected client without closing it; closing it frees the LLM slot
+    return StreamingResponse(
+        events,
+        background=BackgroundTask(events.aclose),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@api_router.get("/llm/metrics")
+async def llm_metrics():
+    return llm_pool.metrics()
+
+
 # User Styles
 @api_router.post("/user-styles", response_model=UserStyle)
-async def create_user_style(user_style: UserStyleCreate):
+async def create_user_style(user_style: UserStyleCreate, db: AsyncIOMotorDatabase = Depends(get_database)):
     new_style = UserStyle(**user_style.model_dump())
     
     await db.user_styles.insert_one(new_style.model_dump())
@@ -280,19 +824,27 @@ async def create_user_style(user_style: UserStyleCreate):
 
 
 @api_router.get("/user-styles", response_model=List[UserStyle])
-async def get_user_styles():
-    styles = await db.user_styles.find().to_list(100)
-    
-    for style in styles:
-        if isinstance(style.get('created_at'), str):
-            style['created_at'] = datetime.fromisoformat(style['created_at'])
+async def get_user_styles(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    include_total: bool = False,
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    styles = await _list_page(
+        response, db.user_styles, "created_at", ("created_at",), order, limit, after, include_total
+    )
     
+    if FAST_JSON_RESPONSES != "off":
+        return list_response(response, styles, UserStyle, FAST_JSON_RESPONSES)
     return [UserStyle(**style) for style in styles]
 
 
 @api_router.delete("/user-styles/{style_id}")
-async def delete_user_style(style_id: str):
+async def delete_user_style(style_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
     result = await db.user_styles.delete_one({"id": style_id})
+    user_style_cache.invalidate(style_id)
     
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="User style not found")
@@ -303,19 +855,44 @@ async def delete_user_style(style_id: str):
 
 # File serving
 @api_router.get("/files/{filename}")
-async def serve_file(filename: str):
-    file_path = UPLOAD_DIR / filename
+async def serve_file(filename: str, request: Request):
+    response = await stored_file_response(request, blob_store, filename)
+    
+    if response is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    return response
+
+
+@api_router.get("/files/{filename}/url")
+async def get_file_url(filename: str, download_name: Optional[str] = None):
+    """Expiring URL a client or worker can fetch a stored blob from directly"""
+    if not parse_blob_name(filename) or not await run_in_threadpool(blob_store.exists, filename):
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    url = await run_in_threadpool(blob_store.presigned_url, filename, download_name)
+    return {"url": url, "expires_in": BLOB_URL_TTL_SECONDS}
+
+
+@api_router.get("/blobs/{name}")
+async def serve_signed_blob(name: str, request: Request, expires: int, signature: str,
+                            filename: Optional[str] = None):
+    """Download through an HMAC-signed URL handed out by the local storage driver"""
+    if not blob_store.driver.verify_url(name, expires, signature, filename):
+        raise HTTPException(status_code=403, detail="Invalid or expired download link")
+    
+    response = await stored_file_response(request, blob_store, name, filename=filename)
     
-    if not file_path.exists():
+    if response is None:
         raise HTTPException(status_code=404, detail="File not found")
     
-    return FileResponse(path=file_path)
+    return response
 
 
 # Export project
 @api_router.get("/projects/{project_id}/export")
 async def export_project(project_id: str):
-    project = await db.projects.find_one({"id": project_id})
+    project = await project_cache.get(project_id)
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
@@ -330,25 +907,15 @@ async def export_project(project_id: str):
 
 # Download lyrics
 @api_router.get("/projects/{project_id}/download-lyrics")
-async def download_lyrics(project_id: str):
-    project = await db.projects.find_one({"id": project_id})
+async def download_lyrics(project_id: str, request: Request, format: str = "txt"):
+    if format not in LYRICS_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported lyrics format: {format}")
+    
+    project = await project_cache.get(project_id)
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
     if not project.get('lyrics'):
         raise HTTPException(status_code=400, detail="No lyrics available for this project")
     
-    # Create a text file with lyrics
-    lyrics_file = UPLOAD_DIR / f"{project_id}_lyrics.txt"
-    
-    with open(lyrics_file, 'w', encoding='utf-8') as f:
-        f.write(f"Lyrics for {project['name']}\n")
-        f.write(f"Style: {project.get('style', 'Unknown')}\n")
-        f.write("=" * 40 + "\n\n")
-        f.write(project['lyrics'])
-    
-    return FileResponse(
-        path=lyrics_file,
-        filename=f"{project['name']}_lyrics.txt",
-        media_type="text/plain"
-    )
+    return lyrics_documents.response(request, project, format, f"{project['name']}_lyrics")
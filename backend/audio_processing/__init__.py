@@ -8,11 +8,13 @@ try:
     from pathlib import Path
     import music21
     import pretty_midi
-    import basic_pitch
-    from basic_pitch.inference import predict
+    from audio_processing.inference_runtime import available_backends
     
     logger = logging.getLogger(__name__)
-    AUDIO_PROCESSING_AVAILABLE = True
+    # basic_pitch is only imported on first use, so ask the runtime whether it could load the model
+    AUDIO_PROCESSING_AVAILABLE = bool(available_backends())
+    if not AUDIO_PROCESSING_AVAILABLE:
+        logger.warning("Audio processing needs basic_pitch with onnxruntime, tflite_runtime or tensorflow")
 except ImportError as e:
     import logging
     logger = logging.getLogger(__name__)
@@ -0,0 +1,202 @@
+"""
+Inference runtimes for Basic Pitch transcription.
+
+`basic_pitch.inference.predict` loads the TensorFlow SavedModel from disk on
+every call. The runtimes below load the bundled model once per worker process
+through TensorFlow, TFLite or ONNX Runtime (whichever is installed) and reuse
+it for every prediction.
+"""
+import os
+import logging
+import threading
+import importlib.util
+from abc import ABC, abstractmethod
+
+logger = logging.getLogger(__name__)
+
+# Backend selection and threading, configurable per worker process
+TRANSCRIPTION_BACKEND = os.environ.get('TRANSCRIPTION_BACKEND', 'auto')
+INFERENCE_INTRA_OP_THREADS = int(os.environ.get('INFERENCE_INTRA_OP_THREADS', '0'))
+INFERENCE_INTER_OP_THREADS = int(os.environ.get('INFERENCE_INTER_OP_THREADS', '0'))
+
+# Preferred order when TRANSCRIPTION_BACKEND is "auto" (fastest on CPU first)
+AUTO_BACKEND_ORDER = ["onnx", "tflite", "tensorflow"]
+
+
+def _module_available(name):
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def available_backends():
+    """Return the runtime backends that can be loaded in this environment"""
+    if not _module_available("basic_pitch"):
+        return []
+
+    backends = []
+    if _module_available("onnxruntime"):
+        backends.append("onnx")
+    if _module_available("tflite_runtime") or _module_available("tensorflow"):
+        backends.append("tflite")
+    if _module_available("tensorflow"):
+        backends.append("tensorflow")
+    return backends
+
+
+class InferenceRuntime(ABC):
+    """A Basic Pitch model loaded once and shared by every prediction"""
+
+    name = None
+
+    def __init__(self, intra_op_threads=0, inter_op_threads=0):
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._load_model()
+                    logger.info(
+                        f"Loaded Basic Pitch model with {self.name} runtime "
+                        f"(intra_op_threads={self.intra_op_threads}, inter_op_threads={self.inter_op_threads})"
+                    )
+        return self._model
+
+    @abstractmethod
+    def _load_model(self):
+        """The basic_pitch Model for this runtime"""
+
+    def predict(self, audio_path):
+        """Run Basic Pitch on an audio file, returning (model_output, midi_data, note_events)"""
+        from basic_pitch.inference import predict
+        return predict(str(audio_path), self.model)
+
+
+def _wrap_model(model_type, model, interpreter=None):
+    """Build a basic_pitch Model around an already-configured runtime session"""
+    from basic_pitch.inference import Model
+
+    # Model.__init__ always loads with default session options, so bypass it
+    wrapped = Model.__new__(Model)
+    wrapped.model_type = model_type
+    wrapped.model = model
+    if interpreter is not None:
+        wrapped.interpreter = interpreter
+    return wrapped
+
+
+class TensorFlowRuntime(InferenceRuntime):
+    name = "tensorflow"
+
+    def _load_model(self):
+        import tensorflow as tf
+        from basic_pitch import FilenameSuffix, build_icassp_2022_model_path
+        from basic_pitch.inference import Model
+
+        try:
+            if self.intra_op_threads:
+                tf.config.threading.set_intra_op_parallelism_threads(self.intra_op_threads)
+            if self.inter_op_threads:
+                tf.config.threading.set_inter_op_parallelism_threads(self.inter_op_threads)
+        except RuntimeError as e:
+            # TensorFlow only accepts threading options before its runtime starts
+            logger.warning(f"Could not configure TensorFlow threads: {str(e)}")
+
+        model_path = build_icassp_2022_model_path(FilenameSuffix.tf)
+        return _wrap_model(Model.MODEL_TYPES.TENSORFLOW, tf.saved_model.load(str(model_path)))
+
+
+class TFLiteRuntime(InferenceRuntime):
+    name = "tflite"
+
+    def _load_model(self):
+        from basic_pitch import FilenameSuffix, build_icassp_2022_model_path
+        from basic_pitch.inference import Model
+
+        try:
+            import tflite_runtime.interpreter as tflite
+        except ImportError:
+            import tensorflow.lite as tflite
+
+        if self.inter_op_threads:
+            logger.info("TFLite has no inter-op thread pool, ignoring inter_op_threads")
+
+        model_path = build_icassp_2022_model_path(FilenameSuffix.tflite)
+        interpreter = tflite.Interpreter(
+            model_path=str(model_path),
+            num_threads=self.intra_op_threads or None
+        )
+        return _wrap_model(Model.MODEL_TYPES.TFLITE, interpreter.get_signature_runner(), interpreter)
+
+
+class ONNXRuntime(InferenceRuntime):
+    name = "onnx"
+
+    def _load_model(self):
+        import onnxruntime as ort
+        from basic_pitch import FilenameSuffix, build_icassp_2022_model_path
+        from basic_pitch.inference import Model
+
+        options = ort.SessionOptions()
+        if self.intra_op_threads:
+            options.intra_op_num_threads = self.intra_op_threads
+        if self.inter_op_threads:
+            options.inter_op_num_threads = self.inter_op_threads
+            if self.inter_op_threads > 1:
+                options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+
+        model_path = build_icassp_2022_model_path(FilenameSuffix.onnx)
+        session = ort.InferenceSession(str(model_path), sess_options=options, providers=["CPUExecutionProvider"])
+        return _wrap_model(Model.MODEL_TYPES.ONNX, session)
+
+
+RUNTIMES = {
+    "tensorflow": TensorFlowRuntime,
+    "tflite": TFLiteRuntime,
+    "onnx": ONNXRuntime,
+}
+
+_runtimes = {}
+_runtimes_lock = threading.Lock()
+
+
+def resolve_backend(backend=None):
+    """Resolve a backend name (or "auto") to an installed runtime backend"""
+    backend = (backend or TRANSCRIPTION_BACKEND).lower()
+    installed = available_backends()
+
+    if backend == "auto":
+        for candidate in AUTO_BACKEND_ORDER:
+            if candidate in installed:
+                return candidate
+        raise RuntimeError("No Basic Pitch inference runtime installed (need onnxruntime, tflite-runtime or tensorflow)")
+
+    if backend not in RUNTIMES:
+        raise ValueError(f"Unknown transcription backend: {backend}. Choose from: auto, {', '.join(RUNTIMES)}")
+    if backend not in installed:
+        raise RuntimeError(f"Transcription backend '{backend}' is not installed")
+    return backend
+
+
+def get_inference_runtime(backend=None, intra_op_threads=None, inter_op_threads=None):
+    """Return the process-wide runtime for a backend, loading it on first use"""
+    backend = resolve_backend(backend)
+    intra = INFERENCE_INTRA_OP_THREADS if intra_op_threads is None else intra_op_threads
+    inter = INFERENCE_INTER_OP_THREADS if inter_op_threads is None else inter_op_threads
+
+    key = (backend, intra, inter)
+    with _runtimes_lock:
+        if key not in _runtimes:
+            _runtimes[key] = RUNTIMES[backend](intra_op_threads=intra, inter_op_threads=inter)
+        return _runtimes[key]
+
+
+def predict(audio_path):
+    """Drop-in replacement for basic_pitch.inference.predict using the configured runtime"""
+    return get_inference_runtime().predict(audio_path)
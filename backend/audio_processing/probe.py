@@ -0,0 +1,205 @@
+"""
+Lightweight audio header probing.
+
+Reads format, sample rate, channels and duration from the first bytes of a
+WAV or MP3 file without decoding any audio, so uploads can be validated
+while they are still arriving. Pure Python, no audio dependencies.
+"""
+import struct
+
+# Bytes needed to reliably probe a header (covers WAV LIST chunks and most ID3 tags)
+PROBE_BYTES = 64 * 1024
+# Longest ID3v2 tag an MP3 may start with (embedded cover art can be several MB)
+MAX_ID3_TAG_BYTES = 16 * 1024 * 1024
+# Room for the first MPEG frame and the next frame's header (the longest frame is 2881 bytes)
+_MP3_TWO_FRAMES_BYTES = 2 * 2881
+
+# MPEG audio tables: bitrates in kbps indexed by [version_is_mpeg1][layer][index]
+_MP3_BITRATES = {
+    (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_MP3_SAMPLE_RATES = {
+    3: [44100, 48000, 32000],  # MPEG 1
+    2: [22050, 24000, 16000],  # MPEG 2
+    0: [11025, 12000, 8000],   # MPEG 2.5
+}
+
+
+def _id3_tag_size(head):
+    """Bytes taken by the ID3v2 tag `head` starts with, or None if it has none (size is a 28-bit syncsafe integer)"""
+    if head[:3] != b"ID3" or len(head) < 10:
+        return None
+    size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+    return 10 + size + (10 if head[5] & 0x10 else 0)
+
+
+def probe_bytes_needed(head):
+    """
+    How many leading bytes probe_audio_header() needs for a file that starts with `head`:
+    PROBE_BYTES, or enough to reach the first two MP3 frames after a larger ID3v2 tag.
+    """
+    tag_size = _id3_tag_size(head)
+    if tag_size is None:
+        return PROBE_BYTES
+    return max(PROBE_BYTES, min(tag_size, MAX_ID3_TAG_BYTES) + _MP3_TWO_FRAMES_BYTES)
+
+
+def probe_audio_header(head, total_size=None):
+    """
+    Probe the header of an audio file.
+    Returns a dict with format, sample_rate, channels and duration_seconds
+    (None when it can't be determined yet), or None if the format is unknown.
+    """
+    if len(head) >= 12 and head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return _probe_wav(head, total_size)
+    return _probe_mp3(head, total_size)
+
+
+def _probe_wav(head, total_size):
+    offset = 12
+    fmt = None
+    data_size = None
+    data_offset = None
+
+    while offset + 8 <= len(head):
+        chunk_id = head[offset:offset + 4]
+        chunk_size = struct.unpack("<I", head[offset + 4:offset + 8])[0]
+        body = offset + 8
+
+        if chunk_id == b"fmt " and body + 16 <= len(head):
+            audio_format, channels, sample_rate, byte_rate, block_align, bits = struct.unpack(
+                "<HHIIHH", head[body:body + 16]
+            )
+            # WAVE_FORMAT_EXTENSIBLE keeps the real format code in its SubFormat GUID
+            if audio_format == 0xFFFE and chunk_size >= 26 and body + 26 <= len(head):
+                audio_format = struct.unpack("<H", head[body + 24:body + 26])[0]
+            fmt = {
+                "audio_format": audio_format,
+                "channels": channels,
+                "sample_rate": sample_rate,
+                "byte_rate": byte_rate,
+                "block_align": block_align,
+                "bits_per_sample": bits,
+            }
+        elif chunk_id == b"data":
+            data_size = chunk_size
+            data_offset = body
+            break
+
+        # Chunks are word-aligned
+        offset = body + chunk_size + (chunk_size & 1)
+
+    if fmt is None or not fmt["sample_rate"] or not fmt["channels"]:
+        return None
+
+    # Streamed WAVs often leave the data size as 0 or 0xFFFFFFFF
+    if data_size in (0, 0xFFFFFFFF):
+        data_size = total_size - data_offset if total_size and data_offset else None
+
+    duration = None
+    if data_size and fmt["byte_rate"]:
+        duration = data_size / fmt["byte_rate"]
+
+    return {
+        "format": "wav",
+        "sample_rate": fmt["sample_rate"],
+        "channels": fmt["channels"],
+        "bits_per_sample": fmt["bits_per_sample"],
+        "byte_rate": fmt["byte_rate"],
+        "block_align": fmt["block_align"],
+        "audio_format": fmt["audio_format"],
+        "data_offset": data_offset,
+        "data_size": data_size,
+        "duration_seconds": duration,
+    }
+
+
+def _probe_mp3(head, total_size):
+    # Skip an ID3v2 tag
+    offset = _id3_tag_size(head) or 0
+
+    # The first frame must start right there, and the next frame right after it: scanning for a
+    # sync word would find one in almost any binary file
+    frame = _parse_mp3_frame(head, offset)
+    if frame is None:
+        return None
+    next_offset = offset + frame["frame_length"]
+    if _parse_mp3_frame(head, next_offset) is None:
+        # Only a file that is this single frame has no second header
+        file_size = total_size if total_size is not None else len(head)
+        if next_offset != file_size:
+            return None
+
+    audio_start = offset
+    samples_per_frame = frame["samples_per_frame"]
+
+    # A Xing/Info (VBR) header carries the exact frame count
+    duration = None
+    side_info = (32 if frame["channels"] == 2 else 17) if frame["mpeg1"] else (17 if frame["channels"] == 2 else 9)
+    xing_offset = offset + 4 + side_info
+    if head[xing_offset:xing_offset + 4] in (b"Xing", b"Info") and xing_offset + 12 <= len(head):
+        flags = struct.unpack(">I", head[xing_offset + 4:xing_offset + 8])[0]
+        if flags & 0x1:
+            frames = struct.unpack(">I", head[xing_offset + 8:xing_offset + 12])[0]
+            duration = frames * samples_per_frame / frame["sample_rate"]
+
+    # Otherwise estimate from the bitrate (exact for CBR)
+    if duration is None and total_size:
+        duration = (total_size - audio_start) * 8 / (frame["bitrate_kbps"] * 1000)
+
+    return {
+        "format": "mp3",
+        "sample_rate": frame["sample_rate"],
+        "channels": frame["channels"],
+        "bitrate_kbps": frame["bitrate_kbps"],
+        "data_offset": audio_start,
+        "duration_seconds": duration,
+    }
+
+
+def _parse_mp3_frame(head, offset):
+    """The MPEG audio frame header at `offset`, or None if there isn't a valid one"""
+    if offset + 4 > len(head) or head[offset] != 0xFF or (head[offset + 1] & 0xE0) != 0xE0:
+        return None
+    b1, b2, b3 = head[offset + 1], head[offset + 2], head[offset + 3]
+
+    version_bits = (b1 >> 3) & 0x3
+    layer_bits = (b1 >> 1) & 0x3
+    bitrate_index = (b2 >> 4) & 0xF
+    sample_rate_index = (b2 >> 2) & 0x3
+
+    if version_bits == 1 or layer_bits == 0 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    mpeg1 = version_bits == 3
+    layer = 4 - layer_bits
+    sample_rate = _MP3_SAMPLE_RATES[version_bits][sample_rate_index]
+
+    if layer == 1:
+        samples_per_frame = 384
+    elif layer == 3 and not mpeg1:
+        samples_per_frame = 576
+    else:
+        samples_per_frame = 1152
+
+    bitrate_kbps = _MP3_BITRATES[(mpeg1, layer)][bitrate_index]
+    padding = (b2 >> 1) & 0x1
+    if layer == 1:
+        frame_length = (12 * bitrate_kbps * 1000 // sample_rate + padding) * 4
+    else:
+        frame_length = samples_per_frame // 8 * bitrate_kbps * 1000 // sample_rate + padding
+
+    return {
+        "mpeg1": mpeg1,
+        "layer": layer,
+        "bitrate_kbps": bitrate_kbps,
+        "frame_length": frame_length,
+        "sample_rate": sample_rate,
+        "channels": 1 if (b3 >> 6) == 3 else 2,
+        "samples_per_frame": samples_per_frame,
+    }
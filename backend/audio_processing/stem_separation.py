@@ -7,11 +7,13 @@ try:
     from pathlib import Path
     import music21
     import pretty_midi
-    import basic_pitch
-    from basic_pitch.inference import predict
+    from audio_processing.inference_runtime import predict, available_backends
     
     logger = logging.getLogger(__name__)
-    STEM_PROCESSING_AVAILABLE = True
+    # basic_pitch is only imported on first use, so ask the runtime whether it could load the model
+    STEM_PROCESSING_AVAILABLE = bool(available_backends())
+    if not STEM_PROCESSING_AVAILABLE:
+        logger.warning("Stem processing needs basic_pitch with onnxruntime, tflite_runtime or tensorflow")
 except ImportError as e:
     import logging
     logger = logging.getLogger(__name__)
@@ -19,11 +21,14 @@ except ImportError as e:
     STEM_PROCESSING_AVAILABLE = False
 
 
-def extract_stems_and_convert_to_midi(audio_path, output_dir):
+def extract_stems_and_convert_to_midi(audio_path, output_dir, resampled_cache=None, progress=None):
     """
     Extract stems from audio and convert each to MIDI and MusicXML
     This creates completely transformative, original compositions
+    resampled_cache: optional .npy of the 22050 Hz mono signal built during upload
+    progress: optional progress(stage, percent, **detail) callback, called as each stage finishes
     """
+    report = progress or (lambda stage, percent, **detail: None)
     if not STEM_PROCESSING_AVAILABLE:
         logger.error("Stem processing dependencies not available")
         return {
@@ -38,9 +43,13 @@ def extract_stems_and_convert_to_midi(audio_path, output_dir):
         output_dir = Path(output_dir)
         output_dir.mkdir(exist_ok=True)
         
-        # Load audio
-        audio, sr = librosa.load(audio_path, sr=22050)
+        # Load audio (reuse the signal decoded while the upload was arriving)
+        if resampled_cache and Path(resampled_cache).exists():
+            audio, sr = np.load(resampled_cache), 22050
+        else:
+            audio, sr = librosa.load(audio_path, sr=22050)
         logger.info(f"Loaded audio: {len(audio)/sr:.2f}s at {sr}Hz")
+        report("loaded", 5)
         
         # 1. Use Basic Pitch to convert audio to MIDI
         logger.info("Converting audio to MIDI using Basic Pitch...")
@@ -50,10 +59,12 @@ def extract_stems_and_convert_to_midi(audio_path, output_dir):
         main_midi_file = output_dir / "full_song.mid"
         midi_data.write(str(main_midi_file))
         logger.info(f"Saved main MIDI: {main_midi_file}")
+        report("main_midi", 20)
         
         # 2. Create stems using frequency separation
         logger.info("Creating stems using frequency separation...")
         stems = create_frequency_based_stems(audio, sr)
+        report("stems_separated", 30, stems=list(stems.keys()))
         
         # 3. Convert each stem to MIDI
         midi_files = []
@@ -89,6 +100,8 @@ def extract_stems_and_convert_to_midi(audio_path, output_dir):
                 # Clean up temp file
                 if temp_stem_path.exists():
                     temp_stem_path.unlink()
+            
+            report("stem_done", 30 + int(65 * (i + 1) / len(stems)), stem=stem_name)
         
         # 4. Create transformation info file
         create_transformation_info(output_dir, midi_files, musicxml_files)
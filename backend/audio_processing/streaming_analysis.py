@@ -0,0 +1,253 @@
+"""
+Streaming WAV decode and analysis.
+
+Fed with upload chunks as they arrive, the analyzer decodes PCM on the fly
+and builds the waveform overview, loudness, an onset envelope for tempo
+estimation and the 22050 Hz mono signal used by the stem pipeline, so that
+work is already done when the upload completes.
+"""
+import logging
+
+from audio_processing.probe import probe_audio_header, PROBE_BYTES
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+    STREAMING_ANALYSIS_AVAILABLE = True
+except ImportError as e:
+    logger.warning(f"Streaming analysis dependencies not installed: {e}")
+    STREAMING_ANALYSIS_AVAILABLE = False
+
+try:
+    import soxr
+    SOXR_AVAILABLE = True
+except ImportError:
+    SOXR_AVAILABLE = False
+
+try:
+    import librosa
+    LIBROSA_AVAILABLE = True
+except ImportError:
+    LIBROSA_AVAILABLE = False
+
+ANALYSIS_SAMPLE_RATE = 22050
+OVERVIEW_POINTS = 1000
+ONSET_N_FFT = 2048
+ONSET_HOP = 512
+
+# Header bytes buffered before decoding can start
+_MAX_HEADER_BYTES = 4 * PROBE_BYTES
+
+
+class StreamingAnalysisError(Exception):
+    pass
+
+
+def decode_pcm(data, audio_format, bits_per_sample, channels):
+    """Decode interleaved little-endian PCM frames to float32 mono"""
+    if audio_format == 3 and bits_per_sample == 32:
+        samples = np.frombuffer(data, dtype="<f4").astype(np.float32)
+    elif audio_format == 3 and bits_per_sample == 64:
+        samples = np.frombuffer(data, dtype="<f8").astype(np.float32)
+    elif audio_format == 1 and bits_per_sample == 16:
+        samples = np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768.0
+    elif audio_format == 1 and bits_per_sample == 24:
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        ints = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        ints = (ints << 8) >> 8  # sign-extend
+        samples = ints.astype(np.float32) / 8388608.0
+    elif audio_format == 1 and bits_per_sample == 32:
+        samples = np.frombuffer(data, dtype="<i4").astype(np.float32) / 2147483648.0
+    elif audio_format == 1 and bits_per_sample == 8:
+        samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    else:
+        raise StreamingAnalysisError(f"Unsupported WAV encoding: format={audio_format}, bits={bits_per_sample}")
+
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return samples
+
+
+class StreamingWavAnalyzer:
+    """Incrementally decode and analyze a WAV file from its byte stream"""
+
+    def __init__(self, total_size=None):
+        self.total_size = total_size
+        self.error = None
+        self.header = None
+        self._head = b""
+        self._pending = b""
+        self._data_remaining = None
+
+        # Loudness
+        self.frames = 0
+        self._sum_squares = 0.0
+        self._peak = 0.0
+
+        # Waveform overview (min/max per bucket)
+        self._bucket_size = None
+        self._bucket_fill = 0
+        self._bucket_min = np.inf
+        self._bucket_max = -np.inf
+        self.overview = []
+
+        # 22050 Hz mono signal
+        self._resampler = None
+        self._resampled = []
+        self._native = []
+
+        # Onset envelope (spectral flux) for tempo estimation
+        self._onset_buffer = np.zeros(0, dtype=np.float32)
+        self._previous_spectrum = None
+        self._window = np.hanning(ONSET_N_FFT).astype(np.float32)
+        self.onset_envelope = []
+
+    def feed(self, chunk):
+        """Consume the next chunk of the file"""
+        if self.header is None:
+            self._head += chunk
+            header = probe_audio_header(self._head, self.total_size)
+            if header is None or header.get("data_offset") is None or len(self._head) < header["data_offset"]:
+                if len(self._head) > _MAX_HEADER_BYTES:
+                    raise StreamingAnalysisError("Could not find WAV data chunk for streaming analysis")
+                return
+            if header["format"] != "wav":
+                raise StreamingAnalysisError("Streaming analysis only supports WAV uploads")
+            self._start(header)
+            chunk = self._head[header["data_offset"]:]
+            self._head = b""
+
+        if self._data_remaining is not None:
+            chunk = chunk[:self._data_remaining]
+            self._data_remaining -= len(chunk)
+
+        data = self._pending + chunk
+        usable = len(data) - len(data) % self.header["block_align"]
+        self._pending = data[usable:]
+        if usable:
+            self._process(decode_pcm(
+                data[:usable], self.header["audio_format"], self.header["bits_per_sample"], self.header["channels"]
+            ))
+
+    def _start(self, header):
+        self.header = header
+        if header.get("data_size"):
+            self._data_remaining = header["data_size"]
+
+        total_frames = None
+        if header.get("data_size") and header["block_align"]:
+            total_frames = header["data_size"] // header["block_align"]
+        # Fixed number of overview points when the length is known, otherwise 20 per second
+        self._bucket_size = max(1, -(-total_frames // OVERVIEW_POINTS)) if total_frames else max(1, header["sample_rate"] // 20)
+
+        if header["sample_rate"] != ANALYSIS_SAMPLE_RATE and SOXR_AVAILABLE:
+            self._resampler = soxr.ResampleStream(header["sample_rate"], ANALYSIS_SAMPLE_RATE, 1, dtype="float32")
+
+    def _process(self, samples):
+        self.frames += len(samples)
+        self._sum_squares += float(np.dot(samples, samples))
+        if len(samples):
+            self._peak = max(self._peak, float(np.max(np.abs(samples))))
+
+        self._update_overview(samples)
+
+        if self.header["sample_rate"] == ANALYSIS_SAMPLE_RATE:
+            self._add_resampled(samples)
+        elif self._resampler is not None:
+            self._add_resampled(self._resampler.resample_chunk(samples, last=False))
+        else:
+            # No streaming resampler installed: resample once at the end
+            self._native.append(samples)
+
+    def _update_overview(self, samples):
+        position = 0
+        while position < len(samples):
+            take = min(self._bucket_size - self._bucket_fill, len(samples) - position)
+            block = samples[position:position + take]
+            self._bucket_min = min(self._bucket_min, float(block.min()))
+            self._bucket_max = max(self._bucket_max, float(block.max()))
+            self._bucket_fill += take
+            position += take
+            if self._bucket_fill == self._bucket_size:
+                self._flush_bucket()
+
+    def _flush_bucket(self):
+        if self._bucket_fill:
+            self.overview.append([round(self._bucket_min, 4), round(self._bucket_max, 4)])
+        self._bucket_fill = 0
+        self._bucket_min = np.inf
+        self._bucket_max = -np.inf
+
+    def _add_resampled(self, samples):
+        if not len(samples):
+            return
+        samples = np.asarray(samples, dtype=np.float32)
+        self._resampled.append(samples)
+        self._update_onsets(samples)
+
+    def _update_onsets(self, samples):
+        buffer = np.concatenate([self._onset_buffer, samples])
+        start = 0
+        while start + ONSET_N_FFT <= len(buffer):
+            frame = buffer[start:start + ONSET_N_FFT] * self._window
+            spectrum = np.log1p(np.abs(np.fft.rfft(frame)))
+            if self._previous_spectrum is not None:
+                self.onset_envelope.append(float(np.maximum(spectrum - self._previous_spectrum, 0).mean()))
+            self._previous_spectrum = spectrum
+            start += ONSET_HOP
+        self._onset_buffer = buffer[start:]
+
+    def finish(self, resampled_cache_path=None):
+        """Flush remaining state and return the analysis results"""
+        if self.header is None:
+            raise StreamingAnalysisError("Upload ended before the WAV header was complete")
+
+        self._flush_bucket()
+
+        if self._resampler is not None:
+            self._add_resampled(self._resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True))
+        elif self._native:
+            native = np.concatenate(self._native)
+            if LIBROSA_AVAILABLE:
+                resampled = librosa.resample(native, orig_sr=self.header["sample_rate"], target_sr=ANALYSIS_SAMPLE_RATE)
+            else:
+                positions = np.arange(0, len(native), self.header["sample_rate"] / ANALYSIS_SAMPLE_RATE)
+                resampled = np.interp(positions, np.arange(len(native)), native)
+            self._add_resampled(resampled)
+
+        resampled = np.concatenate(self._resampled) if self._resampled else np.zeros(0, dtype=np.float32)
+        if resampled_cache_path is not None:
+            np.save(resampled_cache_path, resampled)
+
+        rms = np.sqrt(self._sum_squares / self.frames) if self.frames else 0.0
+        return {
+            "sample_rate": self.header["sample_rate"],
+            "channels": self.header["channels"],
+            "duration_seconds": round(self.frames / self.header["sample_rate"], 3),
+            "rms_dbfs": round(20 * np.log10(rms), 2) if rms > 0 else None,
+            "peak_dbfs": round(20 * np.log10(self._peak), 2) if self._peak > 0 else None,
+            "tempo_bpm": self._estimate_tempo(),
+            "overview": self.overview,
+            "overview_samples_per_point": self._bucket_size,
+        }
+
+    def _estimate_tempo(self):
+        envelope = np.asarray(self.onset_envelope, dtype=np.float32)
+        frame_rate = ANALYSIS_SAMPLE_RATE / ONSET_HOP
+        if len(envelope) < frame_rate * 4:
+            return None
+
+        if LIBROSA_AVAILABLE:
+            tempo = librosa.feature.tempo(onset_envelope=envelope, sr=ANALYSIS_SAMPLE_RATE, hop_length=ONSET_HOP)
+            return round(float(np.atleast_1d(tempo)[0]), 1)
+
+        # Autocorrelation peak between 60 and 200 BPM
+        envelope = envelope - envelope.mean()
+        autocorr = np.correlate(envelope, envelope, mode="full")[len(envelope) - 1:]
+        min_lag = int(frame_rate * 60 / 200)
+        max_lag = min(int(frame_rate * 60 / 60), len(autocorr) - 1)
+        if max_lag <= min_lag:
+            return None
+        lag = min_lag + int(np.argmax(autocorr[min_lag:max_lag]))
+        return round(60 * frame_rate / lag, 1)
@@ -1,3 +1,4 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
@@ -13,14 +14,31 @@ logger = logging.getLogger(__name__)
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+from services.database import mongo
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # One MongoDB client (and connection pool) for the lifetime of the process
+    mongo.connect()
+    await start_background_tasks()
+    try:
+        yield
+    finally:
+        await stop_background_tasks()
+        mongo.close()
+
+
 # Create the main app
 app = FastAPI(
     title="LyricsBeats API",
     description="AI-powered music production and lyric generation platform",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS
+from services.pagination import NEXT_CURSOR_HEADER, TOTAL_COUNT_HEADER
 origins = os.environ.get('CORS_ORIGINS', '*').split(',')
 app.add_middleware(
     CORSMiddleware,
@@ -28,10 +46,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Pagination cursors and counts for listings
+    expose_headers=[NEXT_CURSOR_HEADER, TOTAL_COUNT_HEADER],
 )
 
+# Reject oversized uploads before the multipart body is parsed
+from services.uploads import UploadSizeLimitMiddleware
+app.add_middleware(UploadSizeLimitMiddleware)
+
 # Import and include API routes
-from api import api_router
+from api import api_router, start_background_tasks, stop_background_tasks
 app.include_router(api_router)
 
 # Health check endpoint
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime, timezone
 import uuid
 
@@ -14,27 +14,95 @@ class StatusCheckCreate(BaseModel):
     client_name: str
 
 
+class StatusSummaryRow(BaseModel):
+    start: str
+    client_name: str
+    count: int
+    last_seen: datetime
+
+
+class StatusSummary(BaseModel):
+    """Status check counts per client and time bucket (GET /status/summary)"""
+    bucket: str
+    since: datetime
+    until: datetime
+    rows: List[StatusSummaryRow]
+    pending: int = 0
+
+
+class AudioMetadata(BaseModel):
+    format: str
+    sample_rate: int
+    channels: int
+    duration_seconds: Optional[float] = None
+    size_bytes: int
+    sha256: str
+    content_type: Optional[str] = None
+    client_filename: Optional[str] = None
+    uploaded_at: Optional[datetime] = None
+
+
+class AudioAnalysis(BaseModel):
+    sample_rate: int
+    channels: int
+    duration_seconds: float
+    rms_dbfs: Optional[float] = None
+    peak_dbfs: Optional[float] = None
+    tempo_bpm: Optional[float] = None
+    overview: List[List[float]] = []
+    overview_samples_per_point: Optional[int] = None
+    resampled_cache: Optional[str] = None
+
+
 class Project(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     name: str
     original_file: Optional[str] = None
+    original_metadata: Optional[AudioMetadata] = None
+    analysis: Optional[AudioAnalysis] = None
     transformed_file: Optional[str] = None
     lyrics: Optional[str] = None
+    lyrics_revision: int = 0
+    # Takes generated together with `lyrics` (POST /generate-lyrics with count > 1); one can be selected
+    lyrics_variants: Optional[List[str]] = None
     style: Optional[str] = None
     stems_directory: Optional[str] = None
+    stems_manifest: Optional[Dict[str, str]] = None
+    stems_tree: Optional[str] = None
     midi_files: Optional[List[str]] = []
     musicxml_files: Optional[List[str]] = []
     main_midi: Optional[str] = None
+    stems_created: Optional[List[str]] = []
     transformation_type: Optional[str] = None
     transformation_complete: bool = False
+    transform_revision: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 
+class ProjectSummary(BaseModel):
+    """The fields a project listing shows (GET /projects?view=summary)"""
+    id: str
+    name: str
+    style: Optional[str] = None
+    original_file: Optional[str] = None
+    transformed_file: Optional[str] = None
+    transformation_complete: bool = False
+    created_at: datetime
+    updated_at: datetime
+
+
 class ProjectCreate(BaseModel):
     name: str
 
 
+class UploadSessionCreate(BaseModel):
+    filename: str
+    content_type: str
+    total_size: int
+    sha256: Optional[str] = None
+
+
 class UserStyle(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     name: str
@@ -54,8 +122,17 @@ class LyricsRequest(BaseModel):
     style: str
     custom_prompt: Optional[str] = None
     user_style_id: Optional[str] = None
+    # Skip the lyrics cache for a take nobody has seen yet
+    fresh: bool = False
+    # Takes to generate in one upstream request (at most LYRICS_MAX_VARIANTS)
+    count: int = Field(1, ge=1)
 
 
 class LyricsResponse(BaseModel):
     lyrics: str
     style: str
+    variants: Optional[List[str]] = None
+
+
+class LyricsSelection(BaseModel):
+    variant: int = Field(..., ge=0)
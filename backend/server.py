@@ -1,8 +1,9 @@
-from fastapi import FastAPI, APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, APIRouter, UploadFile, File, HTTPException, Request, Response, Query, Depends
+from fastapi.responses import StreamingResponse
+from motor.motor_asyncio import AsyncIOMotorDatabase
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.exceptions import HTTPException as StarletteHTTPException
 import os
 import logging
 from pathlib import Path
@@ -10,37 +11,82 @@ from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 import uuid
 from datetime import datetime, timezone
-import shutil
 import asyncio
+from contextlib import asynccontextmanager, aclosing
+import itertools
 import numpy as np
 import librosa
 import soundfile as sf
 from scipy import signal
 import random
-from emergentintegrations.llm.chat import LlmChat, UserMessage
 
 # Advanced Music Processing
 import music21
 import pretty_midi
 import mido
-import basic_pitch
-from basic_pitch.inference import predict
+from audio_processing.inference_runtime import predict
 import tempfile
+from starlette.concurrency import run_in_threadpool
+from starlette.background import BackgroundTask
+
+from services.uploads import save_upload, UploadError, UploadSizeLimitMiddleware
+from services.stems_archive import StemsArchiveCache, project_stem_entries
+from services.static_files import stored_file_response
+from services.blob_store import BlobStore, manifest_digest
+from services.blob_drivers import create_blob_driver
+from services.database import mongo, get_database
+from services.db_indexes import ensure_indexes
+from services.transform_lease import TransformLeases, TransformLeaseError, transform_result, WORKER_ID
+from services.timestamp_migration import migrate_timestamps
+from services.pagination import (
+    paginate, set_page_headers, field_projection, InvalidCursor, InvalidFields,
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, TOTAL_COUNT_HEADER
+)
+from services.lyrics_export import LyricsDocumentCache, LYRICS_FORMATS
+from services.status_buffer import StatusCheckBuffer, status_summary, STATUS_BUCKETS
+from services.project_events import format_sse
+from services import stream_completion, LYRICIST_SYSTEM_MESSAGE
+from services.llm_client import llm_pool, LLMBusyError, LLM_MODEL_ID
+from services.lyrics_cache import lyrics_cache
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# MongoDB: one pooled client, connected in the app lifespan (pool settings from MONGO_* env).
+# Routes take the database with Depends(get_database) and pass it to their helpers; the long-lived
+# services below hold mongo.proxy, which resolves to the connected database when used.
+
+# Status checks are written in batches by a background flusher
+status_buffer = StatusCheckBuffer(mongo.proxy)
 
 # Create upload directory
 UPLOAD_DIR = Path(__file__).parent / "uploads"
 UPLOAD_DIR.mkdir(exist_ok=True)
+blob_store = BlobStore(UPLOAD_DIR, driver=create_blob_driver())
+stems_archives = StemsArchiveCache(UPLOAD_DIR / ".cache" / "stems")
+
+@asynccontextmanager
+async def lifespan(app):
+    # One MongoDB client (and connection pool) for the lifetime of the process
+    mongo.connect()
+    try:
+        await ensure_indexes(mongo.proxy)
+    except Exception as e:
+        logger.error(f"Error ensuring database indexes: {str(e)}")
+    # Convert ISO-string timestamps from older versions while serving
+    timestamp_migration = asyncio.create_task(run_timestamp_migration())
+    status_buffer.start()
+    llm_pool.start()
+    try:
+        yield
+    finally:
+        timestamp_migration.cancel()
+        await status_buffer.stop()
+        await llm_pool.stop()
+        mongo.close()
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -61,9 +107,22 @@ class Project(BaseModel):
     transformed_file: Optional[str] = None
     lyrics: Optional[str] = None
     style: Optional[str] = None
+    lyrics_revision: int = 0
+    original_metadata: Optional[Dict[str, Any]] = None
+    stems_manifest: Optional[Dict[str, str]] = None
+    stems_tree: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class ProjectSummary(BaseModel):
+    id: str
+    name: str
+    style: Optional[str] = None
+    original_file: Optional[str] = None
+    transformed_file: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
 class ProjectCreate(BaseModel):
     name: str
 
@@ -84,19 +143,12 @@ class LyricsRequest(BaseModel):
     style: str
     custom_prompt: Optional[str] = None
     user_style_id: Optional[str] = None
+    fresh: bool = False
 
 class LyricsResponse(BaseModel):
     lyrics: str
     style: str
 
-# Initialize LLM Chat
-def get_llm_chat():
-    return LlmChat(
-        api_key=os.environ.get('EMERGENT_LLM_KEY'),
-        session_id="beat_maker_session",
-        system_message="You are a professional rap lyricist and songwriter. You create original, creative rap lyrics in various styles. You understand different rap genres like trap, boom bap, drill, conscious rap, and more. You can adapt to different flows, rhyme schemes, and themes."
-    ).with_model("openai", "gpt-4o")
-
 # Audio Transformation Functions
 def apply_audio_transformations(audio_path, output_path):
     """
@@ -472,67 +524,88 @@ async def root():
 async def create_status_check(input: StatusCheckCreate):
     status_dict = input.dict()
     status_obj = StatusCheck(**status_dict)
-    await db.status_checks.insert_one(status_obj.dict())
+    await status_buffer.write(status_obj.dict())
     return status_obj
 
+async def list_page(response, collection, sort_by, sortable, order, limit, after, include_total, projection=None):
+    if sort_by not in sortable:
+        raise HTTPException(status_code=400, detail=f"Cannot sort by '{sort_by}'. Choose from: {', '.join(sortable)}")
+    try:
+        docs, next_cursor, total = await paginate(
+            collection, sort_by, order, limit, after, include_total=include_total, projection=projection or {"_id": 0}
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    set_page_headers(response, next_cursor, total)
+    return docs
+
 @api_router.get("/status", response_model=List[StatusCheck])
-async def get_status_checks():
-    status_checks = await db.status_checks.find().to_list(1000)
+async def get_status_checks(response: Response, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                            after: Optional[str] = None, order: str = Query("asc", pattern="^(asc|desc)$"),
+                            include_total: bool = False, db: AsyncIOMotorDatabase = Depends(get_database)):
+    status_checks = await list_page(response, db.status_checks, "timestamp", ("timestamp",), order, limit, after, include_total)
     return [StatusCheck(**status_check) for status_check in status_checks]
 
+@api_router.get("/status/summary")
+async def get_status_summary(bucket: str = Query("hour", pattern=f"^({'|'.join(STATUS_BUCKETS)})$"),
+                             since: Optional[datetime] = None, until: Optional[datetime] = None,
+                             client_name: Optional[str] = None, db: AsyncIOMotorDatabase = Depends(get_database)):
+    try:
+        summary = await status_summary(db.status_checks, bucket, since, until, client_name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {**summary, "pending": status_buffer.metrics()["pending"]}
+
 # Project Management
 @api_router.post("/projects", response_model=Project)
-async def create_project(project: ProjectCreate):
+async def create_project(project: ProjectCreate, db: AsyncIOMotorDatabase = Depends(get_database)):
     project_obj = Project(**project.dict())
-    project_dict = project_obj.dict()
-    project_dict['created_at'] = project_dict['created_at'].isoformat()
-    project_dict['updated_at'] = project_dict['updated_at'].isoformat()
-    await db.projects.insert_one(project_dict)
+    await db.projects.insert_one(project_obj.dict())
     return project_obj
 
-@api_router.get("/projects", response_model=List[Project])
-async def get_projects():
-    projects = await db.projects.find().to_list(1000)
-    for project in projects:
-        if isinstance(project.get('created_at'), str):
-            project['created_at'] = datetime.fromisoformat(project['created_at'])
-        if isinstance(project.get('updated_at'), str):
-            project['updated_at'] = datetime.fromisoformat(project['updated_at'])
-    return [Project(**project) for project in projects]
+@api_router.get("/projects", response_model=None, responses={200: {"model": List[Project]}})
+async def get_projects(response: Response, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                       after: Optional[str] = None, sort_by: str = "created_at",
+                       order: str = Query("asc", pattern="^(asc|desc)$"), include_total: bool = False,
+                       view: str = Query("full", pattern="^(full|summary)$"), fields: Optional[str] = None,
+                       db: AsyncIOMotorDatabase = Depends(get_database)):
+    # ?view=summary and ?fields= only read (and return) what a listing needs
+    model = ProjectSummary if view == "summary" else Project
+    projection = None
+    try:
+        if fields:
+            projection = field_projection(fields, Project.model_fields, required=("id", sort_by))
+        elif view == "summary":
+            projection = field_projection(ProjectSummary.model_fields, ProjectSummary.model_fields)
+    except InvalidFields as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    projects = await list_page(response, db.projects, sort_by, ("created_at", "updated_at"), order, limit, after,
+                               include_total, projection)
+    if fields:
+        return projects
+    return [model(**project) for project in projects]
 
 @api_router.get("/projects/{project_id}", response_model=Project)
-async def get_project(project_id: str):
+async def get_project(project_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
     project = await db.projects.find_one({"id": project_id})
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    if isinstance(project.get('created_at'), str):
-        project['created_at'] = datetime.fromisoformat(project['created_at'])
-    if isinstance(project.get('updated_at'), str):
-        project['updated_at'] = datetime.fromisoformat(project['updated_at'])
-    
     return Project(**project)
 
 # File Upload
 @api_router.post("/projects/{project_id}/upload")
-async def upload_file(project_id: str, file: UploadFile = File(...)):
+async def upload_file(project_id: str, file: UploadFile = File(...), db: AsyncIOMotorDatabase = Depends(get_database)):
     # Check if project exists
     project = await db.projects.find_one({"id": project_id})
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    # Validate file type
-    allowed_types = ['audio/mpeg', 'audio/wav', 'audio/mp3', 'audio/x-wav']
-    if file.content_type not in allowed_types:
-        raise HTTPException(status_code=400, detail="Invalid file type. Please upload audio files only.")
-    
-    # Save file
-    file_extension = Path(file.filename).suffix
-    filename = f"{project_id}_original{file_extension}"
-    file_path = UPLOAD_DIR / filename
-    
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # Stream to disk off the event loop, hashing and probing as it arrives
+    try:
+        filename, metadata = await save_upload(file, blob_store)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     
     # Update project
     await db.projects.update_one(
@@ -540,16 +613,17 @@ async def upload_file(project_id: str, file: UploadFile = File(...)):
         {
             "$set": {
                 "original_file": filename,
-                "updated_at": datetime.now(timezone.utc).isoformat()
+                "original_metadata": metadata,
+                "updated_at": datetime.now(timezone.utc)
             }
         }
     )
     
-    return {"message": "File uploaded successfully", "filename": filename}
+    return {"message": "File uploaded successfully", "filename": filename, "metadata": metadata}
 
 # Beat Transformation (Advanced Audio-to-MIDI Conversion)
 @api_router.post("/projects/{project_id}/transform")
-async def transform_beat(project_id: str):
+async def transform_beat(project_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
     project = await db.projects.find_one({"id": project_id})
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
@@ -557,106 +631,116 @@ async def transform_beat(project_id: str):
     if not project.get('original_file'):
         raise HTTPException(status_code=400, detail="No original file found. Please upload a file first.")
     
-    original_path = UPLOAD_DIR / project['original_file']
-    if not original_path.exists():
+    # Fetched from remote storage if this machine has no copy
+    original_path = blob_store.local_path(project['original_file'])
+    if original_path is None:
         raise HTTPException(status_code=404, detail="Original file not found")
     
+    # Claim the project; if another request is already transforming this file, wait for its result
+    job_id = str(uuid.uuid4())
+    revision = project['original_file']
+    # Each request is its own lease owner: there is no in-process job queue here to share work
+    transform_leases = TransformLeases(db, owner=f"{WORKER_ID}/{job_id}")
+    try:
+        holder = await transform_leases.claim(project_id, job_id, revision)
+        while holder is not None:
+            logger.info(f"Transformation of project {project_id} is already running on {holder.get('owner')}, waiting for it")
+            transformed = await transform_leases.follow(project_id, holder, revision)
+            if transformed is not None:
+                return transformation_response(transform_result(transformed))
+            holder = await transform_leases.claim(project_id, job_id, revision)
+    except TransformLeaseError as e:
+        raise HTTPException(status_code=500, detail=f"Failed to transform beat: {str(e)}")
+    
+    heartbeat = asyncio.create_task(transform_leases.keep_alive(project_id, job_id))
     try:
         logger.info(f"Starting advanced audio-to-MIDI transformation for project {project_id}")
         
-        # Create transformation output directory
-        transform_dir = UPLOAD_DIR / f"{project_id}_stems"
-        transform_dir.mkdir(exist_ok=True)
-        
-        # Apply advanced audio-to-MIDI conversion
-        logger.info("Calling extract_stems_and_convert_to_midi...")
-        transformation_result = extract_stems_and_convert_to_midi(str(original_path), str(transform_dir))
-        
-        if not transformation_result.get("success"):
-            logger.error(f"Transformation failed: {transformation_result.get('error', 'Unknown error')}")
-            raise HTTPException(status_code=500, detail=f"Audio transformation failed: {transformation_result.get('error', 'Unknown error')}")
+        # Convert into a scratch directory, then store the results as blobs
+        with tempfile.TemporaryDirectory(dir=blob_store.temp_dir) as transform_dir:
+            # Apply advanced audio-to-MIDI conversion
+            logger.info("Calling extract_stems_and_convert_to_midi...")
+            transformation_result = await run_in_threadpool(extract_stems_and_convert_to_midi, str(original_path), transform_dir)
+            
+            if not transformation_result.get("success"):
+                logger.error(f"Transformation failed: {transformation_result.get('error', 'Unknown error')}")
+                raise HTTPException(status_code=500, detail=f"Audio transformation failed: {transformation_result.get('error', 'Unknown error')}")
+            
+            # Hashing and copying every stem would otherwise block the event loop
+            stems_manifest = await run_in_threadpool(blob_store.ingest_tree, transform_dir)
         
         logger.info(f"Transformation successful. Files created: {transformation_result.get('stem_midis', [])}")
         
-        # Update project with transformation results - REMOVE audio file creation
-        await db.projects.update_one(
-            {"id": project_id},
-            {
-                "$set": {
-                    "stems_directory": f"{project_id}_stems",
-                    "midi_files": transformation_result.get("stem_midis", []),
-                    "musicxml_files": transformation_result.get("musicxml_files", []),
-                    "main_midi": transformation_result.get("main_midi"),
-                    "transformation_type": "advanced_stems_midi",
-                    "transformation_complete": True,
-                    "updated_at": datetime.now(timezone.utc).isoformat()
-                }
-            }
-        )
-        
-        logger.info(f"Advanced transformation completed for project {project_id}")
-        return {
-            "message": "Beat successfully converted to MIDI stems and MusicXML files",
-            "transformation_type": "advanced_stems_midi",
+        # Update project with transformation results (only while this request still holds the project)
+        completed = await transform_leases.complete(project_id, job_id, {
+            "stems_manifest": stems_manifest,
+            "stems_tree": manifest_digest(stems_manifest),
+            "stems_directory": None,
             "midi_files": transformation_result.get("stem_midis", []),
             "musicxml_files": transformation_result.get("musicxml_files", []),
             "main_midi": transformation_result.get("main_midi"),
-            "stems_available": True,
-            "original_composition_created": True,
-            "files_created": len(transformation_result.get("stem_midis", [])) + len(transformation_result.get("musicxml_files", []))
-        }
+            "stems_created": transformation_result.get("stems_created", []),
+            "transformation_type": "advanced_stems_midi",
+            "transformation_complete": True,
+            "updated_at": datetime.now(timezone.utc)
+        })
+        if not completed:
+            raise TransformLeaseError("Transformation was taken over by another request")
+        
+        logger.info(f"Advanced transformation completed for project {project_id}")
+        return transformation_response(transformation_result)
         
     except Exception as e:
         logger.error(f"Error in advanced transformation for project {project_id}: {str(e)}")
         import traceback
         traceback.print_exc()
+        await transform_leases.release(project_id, job_id, "failed", str(e))
         raise HTTPException(status_code=500, detail=f"Failed to transform beat: {str(e)}")
+    finally:
+        heartbeat.cancel()
+
+def transformation_response(transformation_result):
+    return {
+        "message": "Beat successfully converted to MIDI stems and MusicXML files",
+        "transformation_type": "advanced_stems_midi",
+        "midi_files": transformation_result.get("stem_midis", []),
+        "musicxml_files": transformation_result.get("musicxml_files", []),
+        "main_midi": transformation_result.get("main_midi"),
+        "stems_available": True,
+        "original_composition_created": True,
+        "files_created": len(transformation_result.get("stem_midis", [])) + len(transformation_result.get("musicxml_files", []))
+    }
 
 # New endpoint to download transformation package
 @api_router.get("/projects/{project_id}/download-stems")
-async def download_stems_package(project_id: str):
+async def download_stems_package(project_id: str, request: Request, db: AsyncIOMotorDatabase = Depends(get_database)):
     """Download complete MIDI/MusicXML package as ZIP"""
     project = await db.projects.find_one({"id": project_id})
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    if not project.get('stems_directory'):
+    if not project.get('stems_manifest') and not project.get('stems_directory'):
         raise HTTPException(status_code=404, detail="No stems available. Please transform the beat first.")
     
-    stems_dir = UPLOAD_DIR / project['stems_directory']
-    if not stems_dir.exists():
+    # Stats every blob (and fetches missing ones from remote storage), so keep it off the event loop
+    stems = await run_in_threadpool(project_stem_entries, blob_store, project)
+    if not stems:
         raise HTTPException(status_code=404, detail="Stems directory not found")
     
-    # Create ZIP file
-    import zipfile
-    zip_filename = f"{project['name']}_stems_package.zip"
-    zip_path = UPLOAD_DIR / zip_filename
-    
     try:
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            # Add all files from stems directory
-            for file_path in stems_dir.glob("*"):
-                if file_path.is_file():
-                    zipf.write(file_path, file_path.name)
-        
-        return FileResponse(
-            zip_path,
-            filename=zip_filename,
-            media_type="application/zip",
-            headers={"Content-Disposition": f"attachment; filename={zip_filename}"}
+        entries, manifest_hash = stems
+        return await stems_archives.response(
+            request, project_id, entries, manifest_hash, f"{project['name']}_stems_package.zip"
         )
         
+    except StarletteHTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error creating stems package: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to create stems package")
 
 # Lyrics Generation
-@api_router.post("/projects/{project_id}/generate-lyrics", response_model=LyricsResponse)
-async def generate_lyrics(project_id: str, request: LyricsRequest):
-    project = await db.projects.find_one({"id": project_id})
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found")
-    
+async def build_lyrics_prompt(db, request: LyricsRequest):
     # Get user style if specified
     style_context = ""
     if request.user_style_id:
@@ -681,50 +765,91 @@ async def generate_lyrics(project_id: str, request: LyricsRequest):
     
     base_prompt += style_context
     base_prompt += "\n\nGenerate 16-32 bars of original rap lyrics. Include natural pauses and flow markers. Make it ready for recording."
+    return base_prompt
+
+async def save_lyrics(db, project_id, lyrics, style):
+    await db.projects.update_one(
+        {"id": project_id},
+        {
+            "$set": {
+                "lyrics": lyrics,
+                "style": style,
+                "updated_at": datetime.now(timezone.utc)
+            },
+            "$inc": {"lyrics_revision": 1}
+        }
+    )
+
+@api_router.post("/projects/{project_id}/generate-lyrics", response_model=LyricsResponse)
+async def generate_lyrics(project_id: str, request: LyricsRequest, db: AsyncIOMotorDatabase = Depends(get_database)):
+    project = await db.projects.find_one({"id": project_id})
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    
+    base_prompt = await build_lyrics_prompt(db, request)
     
     try:
-        chat = get_llm_chat()
-        user_message = UserMessage(text=base_prompt)
-        response = await chat.send_message(user_message)
-        
-        generated_lyrics = response.strip()
+        # Reuses a cached take on the same prompt; calls go through the shared LLM client pool
+        generated_lyrics = await lyrics_cache.get_or_generate(
+            base_prompt, lambda: llm_pool.complete(base_prompt, LYRICIST_SYSTEM_MESSAGE),
+            fresh=request.fresh, model=LLM_MODEL_ID
+        )
         
         # Update project with generated lyrics
-        await db.projects.update_one(
-            {"id": project_id},
-            {
-                "$set": {
-                    "lyrics": generated_lyrics,
-                    "style": request.style,
-                    "updated_at": datetime.now(timezone.utc).isoformat()
-                }
-            }
-        )
+        await save_lyrics(db, project_id, generated_lyrics, request.style)
         
         return LyricsResponse(lyrics=generated_lyrics, style=request.style)
         
+    except LLMBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate lyrics: {str(e)}")
 
+async def lyrics_events(db, project_id, prompt, style, fresh=False):
+    """SSE body: start, a token event per streamed chunk, then done (or error)"""
+    sequence = itertools.count(1)
+    yield format_sse({"seq": next(sequence), "type": "start", "project_id": project_id, "style": style})
+    chunks = []
+    try:
+        async with aclosing(stream_completion(prompt, fresh=fresh)) as deltas:
+            async for delta in deltas:
+                chunks.append(delta)
+                yield format_sse({"seq": next(sequence), "type": "token", "text": delta})
+        generated_lyrics = "".join(chunks).strip()
+        await save_lyrics(db, project_id, generated_lyrics, style)
+        yield format_sse({"seq": next(sequence), "type": "done", "lyrics": generated_lyrics, "style": style})
+    except Exception as e:
+        logger.error(f"Error streaming lyrics: {str(e)}")
+        yield format_sse({"seq": next(sequence), "type": "error", "detail": f"Failed to generate lyrics: {str(e)}"})
+
+@api_router.post("/projects/{project_id}/generate-lyrics/stream")
+async def stream_lyrics(project_id: str, request: LyricsRequest, db: AsyncIOMotorDatabase = Depends(get_database)):
+    project = await db.projects.find_one({"id": project_id})
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    
+    prompt = await build_lyrics_prompt(db, request)
+    events = lyrics_events(db, project_id, prompt, request.style, request.fresh)
+    # Closed explicitly: Starlette drops the body of a disconnected client, which would hold its LLM slot
+    return StreamingResponse(events, background=BackgroundTask(events.aclose), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 # User Style Management
 @api_router.post("/user-styles", response_model=UserStyle)
-async def create_user_style(style: UserStyleCreate):
+async def create_user_style(style: UserStyleCreate, db: AsyncIOMotorDatabase = Depends(get_database)):
     style_obj = UserStyle(**style.dict())
-    style_dict = style_obj.dict()
-    style_dict['created_at'] = style_dict['created_at'].isoformat()
-    await db.user_styles.insert_one(style_dict)
+    await db.user_styles.insert_one(style_obj.dict())
     return style_obj
 
 @api_router.get("/user-styles", response_model=List[UserStyle])
-async def get_user_styles():
-    styles = await db.user_styles.find().to_list(1000)
-    for style in styles:
-        if isinstance(style.get('created_at'), str):
-            style['created_at'] = datetime.fromisoformat(style['created_at'])
+async def get_user_styles(response: Response, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                          after: Optional[str] = None, order: str = Query("asc", pattern="^(asc|desc)$"),
+                          include_total: bool = False, db: AsyncIOMotorDatabase = Depends(get_database)):
+    styles = await list_page(response, db.user_styles, "created_at", ("created_at",), order, limit, after, include_total)
     return [UserStyle(**style) for style in styles]
 
 @api_router.delete("/user-styles/{style_id}")
-async def delete_user_style(style_id: str):
+async def delete_user_style(style_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
     result = await db.user_styles.delete_one({"id": style_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="User style not found")
@@ -732,15 +857,15 @@ async def delete_user_style(style_id: str):
 
 # File Download
 @api_router.get("/files/{filename}")
-async def download_file(filename: str):
-    file_path = UPLOAD_DIR / filename
-    if not file_path.exists():
+async def download_file(filename: str, request: Request):
+    response = await stored_file_response(request, blob_store, filename)
+    if response is None:
         raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(file_path)
+    return response
 
 # Export Project
 @api_router.get("/projects/{project_id}/export")
-async def export_project(project_id: str):
+async def export_project(project_id: str, db: AsyncIOMotorDatabase = Depends(get_database)):
     project = await db.projects.find_one({"id": project_id})
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
@@ -761,7 +886,10 @@ async def export_project(project_id: str):
 
 # Download Lyrics as Text File
 @api_router.get("/projects/{project_id}/download-lyrics")
-async def download_lyrics(project_id: str):
+async def download_lyrics(project_id: str, request: Request, format: str = "txt", db: AsyncIOMotorDatabase = Depends(get_database)):
+    if format not in LYRICS_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported lyrics format: {format}")
+    
     project = await db.projects.find_one({"id": project_id})
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
@@ -769,10 +897,17 @@ async def download_lyrics(project_id: str):
     if not project.get("lyrics"):
         raise HTTPException(status_code=404, detail="No lyrics found for this project")
     
-    # Create lyrics file content
-    lyrics_content = f"""Title: {project['name']}
+    lyrics_name = f"{project['name'].replace(' ', '_')}_lyrics"
+    return lyrics_documents.response(request, project, format, lyrics_name)
+
+def render_lyrics_sheet(project):
+    """Plain-text lyrics sheet with the publishing header"""
+    generated = project.get('updated_at', 'Unknown')
+    if isinstance(generated, datetime):
+        generated = generated.isoformat()
+    return f"""Title: {project['name']}
 Style: {project.get('style', 'Unknown')}
-Generated: {project.get('updated_at', 'Unknown')}
+Generated: {generated}
 Copyright: Original Work - Ready for Publishing
 
 ---
@@ -784,20 +919,11 @@ Copyright: Original Work - Ready for Publishing
 Generated by Beat Maker AI
 This work is original and ready for copyright registration.
 """
-    
-    # Create temporary file
-    lyrics_filename = f"{project['name'].replace(' ', '_')}_lyrics.txt"
-    lyrics_path = UPLOAD_DIR / lyrics_filename
-    
-    with open(lyrics_path, "w", encoding="utf-8") as f:
-        f.write(lyrics_content)
-    
-    return FileResponse(
-        lyrics_path, 
-        filename=lyrics_filename,
-        media_type="text/plain",
-        headers={"Content-Disposition": f"attachment; filename={lyrics_filename}"}
-    )
+
+lyrics_documents = LyricsDocumentCache(
+    renderers={"txt": render_lyrics_sheet},
+    header_fields=("name", "style", "updated_at"),
+)
 
 # Include the router in the main app
 app.include_router(api_router)
@@ -808,7 +934,9 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, TOTAL_COUNT_HEADER],
 )
+app.add_middleware(UploadSizeLimitMiddleware)
 
 # Configure logging
 logging.basicConfig(
@@ -817,6 +945,8 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+async def run_timestamp_migration():
+    try:
+        await migrate_timestamps(mongo.proxy)
+    except Exception as e:
+        logger.error(f"Error migrating timestamps: {str(e)}")
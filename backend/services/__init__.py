@@ -1,46 +1,41 @@
 import os
+import re
 import logging
+from contextlib import aclosing
 from models import LyricsRequest, LyricsResponse
 
-try:
-    from emergentintegrations.llm.chat import LlmChat, UserMessage
-    AI_SERVICES_AVAILABLE = True
-except ImportError as e:
-    logging.getLogger(__name__).warning(f"AI services dependencies not installed: {e}")
-    AI_SERVICES_AVAILABLE = False
+from services.llm_client import (
+    llm_pool, new_session_id, litellm_reachable, LLMBusyError, AI_SERVICES_AVAILABLE, LLM_MODEL_ID
+)
+from services.lyrics_cache import lyrics_cache
 
 logger = logging.getLogger(__name__)
 
+# Most lyric variants one request may ask for
+LYRICS_MAX_VARIANTS = int(os.environ.get('LYRICS_MAX_VARIANTS', '5'))
 
-def get_llm_chat():
-    """Initialize LLM Chat for lyric generation"""
-    if not AI_SERVICES_AVAILABLE:
-        raise Exception("AI services dependencies not installed")
-        
-    return LlmChat(
-        api_key=os.environ.get('EMERGENT_LLM_KEY'),
-        session_id="beat_maker_session",
-        system_message="You are a professional rap lyricist and songwriter. You create original, creative rap lyrics in various styles. You understand different rap genres like trap, boom bap, drill, conscious rap, and more. You can adapt to different flows, rhyme schemes, and themes."
-    ).with_model("openai", "gpt-4o")
+# Heading that starts each take when several are requested in one prompt
+VARIANT_HEADING = re.compile(r"^\s*=+\s*TAKE\s+\d+\s*=+\s*$", re.IGNORECASE | re.MULTILINE)
 
+LYRICIST_SYSTEM_MESSAGE = "You are a professional rap lyricist and songwriter. You create original, creative rap lyrics in various styles. You understand different rap genres like trap, boom bap, drill, conscious rap, and more. You can adapt to different flows, rhyme schemes, and themes."
 
-async def generate_lyrics(request: LyricsRequest) -> LyricsResponse:
-    """
-    Generate rap lyrics based on style and optional custom prompt
-    """
+
+def get_llm_chat(session_id=None):
+    """Initialize LLM Chat for lyric generation, in its own session"""
     if not AI_SERVICES_AVAILABLE:
         raise Exception("AI services dependencies not installed")
         
-    try:
-        llm = get_llm_chat()
-        
-        # Build the prompt based on request parameters
-        base_prompt = f"Create original rap lyrics in the {request.style} style."
-        
-        if request.custom_prompt:
-            base_prompt += f" Additional instructions: {request.custom_prompt}"
-        
-        base_prompt += """
+    return llm_pool.chat(LYRICIST_SYSTEM_MESSAGE, session_id)
+
+
+def lyrics_prompt(request: LyricsRequest) -> str:
+    """Prompt for lyrics in one of the predefined styles"""
+    base_prompt = f"Create original rap lyrics in the {request.style} style."
+    
+    if request.custom_prompt:
+        base_prompt += f" Additional instructions: {request.custom_prompt}"
+    
+    base_prompt += """
         
         Please provide:
         1. Original, creative lyrics (avoid clichés when possible)
@@ -51,12 +46,147 @@ async def generate_lyrics(request: LyricsRequest) -> LyricsResponse:
         
         Format the response clearly with verse/chorus labels.
         """
+    return base_prompt
+
+
+def user_style_prompt(user_style, custom_prompt=None) -> str:
+    """Prompt for lyrics matching a user's style profile"""
+    return f"""
+        Create original rap lyrics based on this style profile:
         
-        # Generate lyrics
-        response = await llm.acreate([UserMessage(content=base_prompt)])
+        Style Name: {user_style['name']}
+        Description: {user_style['description']}
+        Sample Lyrics: {user_style['sample_lyrics']}
         
-        # Extract the lyrics from response
-        lyrics = response.content if hasattr(response, 'content') else str(response)
+        {"Additional instructions: " + custom_prompt if custom_prompt else ""}
+        
+        Please create original lyrics that match this style while being completely unique and copyright-ready.
+        Include 2-3 verses and a chorus.
+        """
+
+
+async def complete(prompt, session_id=None) -> str:
+    """The whole completion for `prompt`"""
+    return await llm_pool.complete(prompt, LYRICIST_SYSTEM_MESSAGE, session_id)
+
+
+async def cached_completion(prompt, fresh=False) -> str:
+    """complete(), through the lyrics cache; `fresh` always asks the model"""
+    return await lyrics_cache.get_or_generate(
+        prompt, lambda: complete(prompt), fresh=fresh, model=LLM_MODEL_ID
+    )
+
+
+async def _stream_from_model(prompt, session_id):
+    if litellm_reachable():
+        streamed = False
+        try:
+            # Closed with this generator, so a consumer that stops early frees the pool slot
+            async with aclosing(llm_pool.stream(prompt, LYRICIST_SYSTEM_MESSAGE, session_id)) as deltas:
+                async for delta in deltas:
+                    streamed = True
+                    yield delta
+            return
+        except LLMBusyError:
+            raise
+        except Exception as e:
+            if streamed:
+                raise
+            logger.warning(f"Streaming completion failed, waiting for the whole completion: {str(e)}")
+    
+    llm_pool.stats["stream_fallbacks"] += 1
+    yield await complete(prompt, session_id)
+
+
+async def stream_completion(prompt, session_id=None, fresh=False):
+    """
+    The completion for `prompt` as text chunks, as the model produces them. Without litellm (or
+    LLM_API_BASE for an Emergent key), or when streaming fails before the first token, the whole
+    completion arrives as one chunk, as do lyrics served by the lyrics cache (unless `fresh`).
+    A streamed completion holds an LLM slot until it ends, so consumers that may stop early
+    should iterate it inside `contextlib.aclosing`.
+    """
+    if not AI_SERVICES_AVAILABLE and not litellm_reachable():
+        raise Exception("AI services dependencies not installed")
+    
+    key = lyrics_cache.key(prompt, LLM_MODEL_ID)
+    if not fresh:
+        lyrics = await lyrics_cache.lookup(key, prompt)
+        if lyrics is not None:
+            yield lyrics
+            return
+    
+    future = lyrics_cache.claim(key, fresh)
+    chunks = []
+    try:
+        async with aclosing(_stream_from_model(prompt, session_id or new_session_id())) as deltas:
+            async for delta in deltas:
+                chunks.append(delta)
+                yield delta
+    except BaseException as e:
+        lyrics_cache.abandon(key, future, e)
+        raise
+    lyrics_cache.resolve(key, future, "".join(chunks).strip())
+
+
+def variants_prompt(prompt, count) -> str:
+    """`prompt`, asking for `count` distinct takes in one answer"""
+    return prompt + f"""
+        
+        Write {count} distinct takes, each with its own theme, imagery and rhyme scheme.
+        Start each take with a line of the form "=== TAKE 1 ===" (numbered 1 to {count}) and write nothing
+        before the first take or after the last one.
+        """
+
+
+def split_variants(text, count):
+    """The takes in a completion written for variants_prompt()"""
+    takes = [take.strip() for take in VARIANT_HEADING.split(text) if take.strip()]
+    return takes[:count] or [text.strip()]
+
+
+async def _complete_variants(prompt, count):
+    """`count` takes from one upstream request: `n` choices when possible, else one structured prompt"""
+    if litellm_reachable():
+        try:
+            return await llm_pool.complete_many(prompt, LYRICIST_SYSTEM_MESSAGE, count)
+        except LLMBusyError:
+            raise
+        except Exception as e:
+            logger.warning(f"Multi-choice completion failed, asking for the takes in one prompt: {str(e)}")
+    return split_variants(await complete(variants_prompt(prompt, count)), count)
+
+
+async def generate_variants(prompt, count, fresh=False):
+    """
+    `count` lyric takes for `prompt`, in one upstream call. Takes already in the lyrics cache are reused
+    (unless `fresh`), and new ones are added to it.
+    """
+    key = lyrics_cache.key(prompt, LLM_MODEL_ID)
+    if not fresh:
+        cached = lyrics_cache.takes(key, prompt, count)
+        if cached:
+            return cached
+    
+    variants = [variant for variant in await _complete_variants(prompt, count) if variant]
+    if not variants:
+        raise Exception("The model returned no lyrics")
+    for variant in variants:
+        lyrics_cache.store(key, variant)
+    logger.info(f"Generated {len(variants)} lyric variants in one request")
+    return variants
+
+
+async def generate_lyrics(request: LyricsRequest) -> LyricsResponse:
+    """
+    Generate rap lyrics based on style and optional custom prompt
+    """
+    if not AI_SERVICES_AVAILABLE and not litellm_reachable():
+        raise Exception("AI services dependencies not installed")
+        
+    try:
+        # Generate lyrics (or reuse a cached take on the same prompt)
+        lyrics = await cached_completion(lyrics_prompt(request), fresh=request.fresh)
         
         logger.info(f"Generated lyrics in {request.style} style")
         
@@ -65,37 +195,25 @@ async def generate_lyrics(request: LyricsRequest) -> LyricsResponse:
             style=request.style
         )
         
+    except LLMBusyError:
+        raise
     except Exception as e:
         logger.error(f"Error generating lyrics: {str(e)}")
         raise Exception(f"Failed to generate lyrics: {str(e)}")
 
 
-async def generate_lyrics_with_user_style(user_style, custom_prompt=None) -> str:
+async def generate_lyrics_with_user_style(user_style, custom_prompt=None, fresh=False) -> str:
     """
     Generate lyrics based on a user's custom style
     """
     try:
-        llm = get_llm_chat()
-        
-        prompt = f"""
-        Create original rap lyrics based on this style profile:
-        
-        Style Name: {user_style['name']}
-        Description: {user_style['description']}
-        Sample Lyrics: {user_style['sample_lyrics']}
-        
-        {"Additional instructions: " + custom_prompt if custom_prompt else ""}
-        
-        Please create original lyrics that match this style while being completely unique and copyright-ready.
-        Include 2-3 verses and a chorus.
-        """
-        
-        response = await llm.acreate([UserMessage(content=prompt)])
-        lyrics = response.content if hasattr(response, 'content') else str(response)
+        lyrics = await cached_completion(user_style_prompt(user_style, custom_prompt), fresh=fresh)
         
         logger.info(f"Generated lyrics for user style: {user_style['name']}")
         return lyrics
         
+    except LLMBusyError:
+        raise
     except Exception as e:
         logger.error(f"Error generating lyrics with user style: {str(e)}")
         raise Exception(f"Failed to generate lyrics: {str(e)}")
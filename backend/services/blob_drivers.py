@@ -0,0 +1,287 @@
+"""
+Storage drivers behind the blob store.
+
+The blob store always keeps blobs on the local filesystem: writers produce
+temp files there and readers that need a real path (the transform, archive
+builds) read from there. A driver decides where blobs live beyond that:
+
+- `local`: nowhere else. Downloads can be handed out as HMAC-signed,
+  expiring URLs served by this app.
+- `s3`: an S3-compatible bucket (AWS, MinIO, R2, ... via S3_ENDPOINT_URL) is
+  the source of truth. Ingested blobs are pushed with streaming multipart
+  uploads, blobs missing locally are fetched on demand, and downloads are
+  redirected to presigned URLs (or proxied with range reads), so any worker
+  with bucket access can fetch its inputs and publish its outputs without
+  going through the API. The local copies are only a cache.
+
+Select one with BLOB_STORAGE_DRIVER; the S3 driver needs boto3.
+"""
+import os
+import hmac
+import time
+import hashlib
+import logging
+import secrets
+import mimetypes
+from abc import ABC, abstractmethod
+from urllib.parse import quote, urlencode
+
+from services.http_cache import content_disposition
+
+logger = logging.getLogger(__name__)
+
+try:
+    import boto3
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import ClientError
+    BOTO3_AVAILABLE = True
+except ImportError:
+    BOTO3_AVAILABLE = False
+    logger.warning("boto3 not available, the s3 blob storage driver is disabled")
+
+BLOB_STORAGE_DRIVER = os.environ.get('BLOB_STORAGE_DRIVER', 'local')
+BLOB_URL_SECRET = os.environ.get('BLOB_URL_SECRET', '')
+BLOB_URL_TTL_SECONDS = int(os.environ.get('BLOB_URL_TTL_SECONDS', '3600'))
+BLOB_URL_BASE = os.environ.get('BLOB_URL_BASE', '/api/blobs')
+BLOB_REDIRECT_DOWNLOADS = os.environ.get('BLOB_REDIRECT_DOWNLOADS', 'true').lower() == 'true'
+
+S3_BUCKET = os.environ.get('S3_BUCKET', '')
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL') or None
+S3_REGION = os.environ.get('S3_REGION') or None
+S3_PREFIX = os.environ.get('S3_PREFIX', 'blobs/')
+S3_MULTIPART_THRESHOLD_BYTES = int(os.environ.get('S3_MULTIPART_THRESHOLD_BYTES', str(16 * 1024 * 1024)))
+S3_MULTIPART_CHUNK_BYTES = int(os.environ.get('S3_MULTIPART_CHUNK_BYTES', str(8 * 1024 * 1024)))
+
+READ_CHUNK_BYTES = 1024 * 1024
+
+
+class BlobDriverError(Exception):
+    pass
+
+
+class BlobDriver(ABC):
+    """Where blobs live beyond the local filesystem"""
+
+    name = None
+    # Whether blobs are stored elsewhere (and local copies are only a cache)
+    remote = False
+    # Whether downloads should be redirected to presigned_url() instead of served by the app
+    redirect_downloads = False
+
+    @abstractmethod
+    def presigned_url(self, digest, name, filename=None, ttl=BLOB_URL_TTL_SECONDS):
+        """A URL anyone holding it can download blob `name` (content `digest`) from until it expires"""
+
+    def verify_url(self, name, expires, signature, filename=None):
+        """Whether a signed URL served by this app is authentic and unexpired"""
+        return False
+
+
+class RemoteBlobDriver(BlobDriver):
+    """A driver that stores blobs elsewhere; the blob store only calls these when `remote` is set"""
+
+    remote = True
+
+    @abstractmethod
+    def exists(self, digest):
+        """Whether remote storage holds the blob"""
+
+    @abstractmethod
+    def size(self, digest):
+        """The blob's size in bytes, or None if it isn't stored"""
+
+    @abstractmethod
+    def upload(self, digest, path, content_type=None):
+        """Store the file at `path` as blob `digest`; if it is already stored, refresh its last modified time"""
+
+    @abstractmethod
+    def download(self, digest, path):
+        """Fetch a blob into `path`; False if it isn't stored"""
+
+    @abstractmethod
+    def read_range(self, digest, start, length):
+        """Yield the bytes [start, start + length) of a blob"""
+
+    @abstractmethod
+    def delete(self, digest):
+        """Remove a blob from remote storage"""
+
+    @abstractmethod
+    def iter_blobs(self):
+        """Yield (digest, size, last modified timestamp) for every stored blob"""
+
+
+class LocalBlobDriver(BlobDriver):
+    """Blobs live only on the local filesystem; presigned URLs are HMAC-signed app URLs"""
+
+    name = "local"
+
+    def __init__(self, secret=BLOB_URL_SECRET, url_base=BLOB_URL_BASE):
+        if not secret:
+            # URLs only verify in the process that signed them
+            logger.warning("BLOB_URL_SECRET is not set, signed blob URLs will not survive a restart "
+                           "or work across workers")
+            secret = secrets.token_hex(32)
+        self.secret = secret.encode()
+        self.url_base = url_base.rstrip("/")
+
+    def _signature(self, name, expires, filename):
+        message = f"{name}\n{expires}\n{filename or ''}".encode()
+        return hmac.new(self.secret, message, hashlib.sha256).hexdigest()
+
+    def presigned_url(self, digest, name, filename=None, ttl=BLOB_URL_TTL_SECONDS):
+        expires = int(time.time()) + ttl
+        params = {"expires": expires, "signature": self._signature(name, expires, filename)}
+        if filename:
+            params["filename"] = filename
+        return f"{self.url_base}/{quote(name)}?{urlencode(params)}"
+
+    def verify_url(self, name, expires, signature, filename=None):
+        if expires < time.time():
+            return False
+        return hmac.compare_digest(self._signature(name, expires, filename), signature or "")
+
+
+class S3BlobDriver(RemoteBlobDriver):
+    """Blobs live in an S3-compatible bucket under `<prefix><digest>`"""
+
+    name = "s3"
+
+    def __init__(self, bucket=S3_BUCKET, endpoint_url=S3_ENDPOINT_URL, region=S3_REGION, prefix=S3_PREFIX,
+                 redirect_downloads=BLOB_REDIRECT_DOWNLOADS, client=None,
+                 multipart_threshold=S3_MULTIPART_THRESHOLD_BYTES, multipart_chunk=S3_MULTIPART_CHUNK_BYTES):
+        if client is None:
+            if not BOTO3_AVAILABLE:
+                raise BlobDriverError("The s3 blob storage driver requires boto3")
+            # Credentials come from the usual AWS environment variables / config files
+            client = boto3.client(
+                "s3", endpoint_url=endpoint_url, region_name=region,
+                config=BotoConfig(signature_version="s3v4", retries={"max_attempts": 5, "mode": "adaptive"})
+            )
+        if not bucket:
+            raise BlobDriverError("S3_BUCKET must be set for the s3 blob storage driver")
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.redirect_downloads = redirect_downloads
+        self.multipart_threshold = multipart_threshold
+        self.multipart_chunk = max(multipart_chunk, 5 * 1024 * 1024)  # S3's minimum part size
+
+    def key(self, digest):
+        return f"{self.prefix}{digest}"
+
+    def _head(self, digest):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self.key(digest))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def exists(self, digest):
+        return self._head(digest) is not None
+
+    def size(self, digest):
+        head = self._head(digest)
+        return head["ContentLength"] if head else None
+
+    def upload(self, digest, path, content_type=None):
+        """Push a local file, streaming it in parts when it is large; only touched if already stored"""
+        key = self.key(digest)
+        head = self._head(digest)
+        if head is not None:
+            # Copied onto itself so LastModified shows garbage collection a fresh reference in the making
+            self.client.copy_object(
+                Bucket=self.bucket, Key=key, CopySource={"Bucket": self.bucket, "Key": key},
+                MetadataDirective="REPLACE", Metadata=head.get("Metadata", {}),
+                ContentType=head.get("ContentType") or content_type or "binary/octet-stream"
+            )
+            return False
+        extra = {"ContentType": content_type} if content_type else {}
+        size = os.path.getsize(path)
+
+        if size < self.multipart_threshold:
+            with open(path, "rb") as f:
+                self.client.put_object(Bucket=self.bucket, Key=key, Body=f, **extra)
+            return True
+
+        upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=key, **extra)["UploadId"]
+        try:
+            parts = []
+            with open(path, "rb") as f:
+                for number, chunk in enumerate(iter(lambda: f.read(self.multipart_chunk), b""), start=1):
+                    part = self.client.upload_part(
+                        Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=number, Body=chunk
+                    )
+                    parts.append({"PartNumber": number, "ETag": part["ETag"]})
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts}
+            )
+        except BaseException:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            raise
+        logger.info(f"Uploaded blob {digest} to s3://{self.bucket}/{key} in {len(parts)} parts ({size} bytes)")
+        return True
+
+    def download(self, digest, path):
+        try:
+            body = self.client.get_object(Bucket=self.bucket, Key=self.key(digest))["Body"]
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        with open(path, "wb") as f:
+            for chunk in body.iter_chunks(READ_CHUNK_BYTES):
+                f.write(chunk)
+        return True
+
+    def read_range(self, digest, start, length):
+        if length <= 0:
+            return
+        body = self.client.get_object(
+            Bucket=self.bucket, Key=self.key(digest), Range=f"bytes={start}-{start + length - 1}"
+        )["Body"]
+        try:
+            yield from body.iter_chunks(READ_CHUNK_BYTES)
+        finally:
+            body.close()
+
+    def delete(self, digest):
+        self.client.delete_object(Bucket=self.bucket, Key=self.key(digest))
+
+    def iter_blobs(self):
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get("Contents", []):
+                digest = item["Key"][len(self.prefix):]
+                if "/" not in digest:
+                    yield digest, item["Size"], item["LastModified"].timestamp()
+
+    def presigned_url(self, digest, name, filename=None, ttl=BLOB_URL_TTL_SECONDS):
+        params = {"Bucket": self.bucket, "Key": self.key(digest)}
+        media_type = mimetypes.guess_type(filename or name)[0]
+        if media_type:
+            params["ResponseContentType"] = media_type
+        if filename:
+            params["ResponseContentDisposition"] = content_disposition(filename)
+        return self.client.generate_presigned_url("get_object", Params=params, ExpiresIn=ttl)
+
+
+DRIVERS = {
+    "local": LocalBlobDriver,
+    "s3": S3BlobDriver,
+}
+
+
+def create_blob_driver(name=None):
+    """The driver selected by BLOB_STORAGE_DRIVER; falls back to local if it cannot be used"""
+    name = (name or BLOB_STORAGE_DRIVER).lower()
+    if name not in DRIVERS:
+        raise ValueError(f"Unknown blob storage driver '{name}'. Choose from: {', '.join(DRIVERS)}")
+    try:
+        driver = DRIVERS[name]()
+    except BlobDriverError as e:
+        logger.error(f"Cannot use the {name} blob storage driver ({str(e)}), storing blobs locally only")
+        return LocalBlobDriver()
+    logger.info(f"Using the {driver.name} blob storage driver")
+    return driver
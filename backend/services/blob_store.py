@@ -0,0 +1,221 @@
+"""
+Content-addressed artifact storage.
+
+Files are stored once per SHA-256 under hash-prefix shards
+(`blobs/ab/cd/abcd...`) so no directory grows without bound and identical
+content is deduplicated. Writers produce a temp file inside the store and
+ingest it, which is an atomic rename into place. Projects refer to blobs by
+name, `<sha256><ext>` (the extension only tells clients what the bytes
+are), and a set of files such as the stems of a transform is stored as a
+manifest mapping file names to blob digests.
+
+Names that are not blob names resolve to the flat uploads directory so
+artifacts written by older versions keep working.
+
+A storage driver (services.blob_drivers) may keep blobs somewhere else as
+well: ingested blobs are then pushed to it and local_path() fetches blobs
+that are not on this machine.
+"""
+import os
+import re
+import json
+import uuid
+import hashlib
+import logging
+import mimetypes
+from pathlib import Path
+
+from services.blob_drivers import LocalBlobDriver
+
+logger = logging.getLogger(__name__)
+
+BLOBS_DIRNAME = "blobs"
+TEMP_DIRNAME = ".tmp"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+_BLOB_NAME = re.compile(r"^(?P<digest>[0-9a-f]{64})(?P<ext>\.[0-9A-Za-z]{1,10})?$")
+
+
+class BlobNotFound(Exception):
+    pass
+
+
+def file_digest(path):
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def parse_blob_name(name):
+    """Return (digest, extension) for a blob name, or None for other (legacy) names"""
+    match = _BLOB_NAME.match(name or "")
+    if not match:
+        return None
+    return match.group("digest"), match.group("ext") or ""
+
+
+def manifest_digest(manifest):
+    """Identity of a set of blobs: hash of the sorted name -> digest mapping"""
+    return hashlib.sha256(json.dumps(manifest, sort_keys=True).encode()).hexdigest()
+
+
+class BlobStore:
+    def __init__(self, upload_dir, driver=None):
+        self.upload_dir = Path(upload_dir)
+        self.root = self.upload_dir / BLOBS_DIRNAME
+        self.temp_dir = self.root / TEMP_DIRNAME
+        self.temp_dir.mkdir(parents=True, exist_ok=True)
+        self.driver = driver or LocalBlobDriver()
+
+    @property
+    def remote(self):
+        """Whether blobs live in remote storage, making local copies a cache"""
+        return self.driver.remote
+
+    def blob_path(self, digest):
+        return self.root / digest[:2] / digest[2:4] / digest
+
+    def temp_path(self, suffix=""):
+        """A fresh path on the store's filesystem for writing a file before ingesting it"""
+        return self.temp_dir / f"{uuid.uuid4().hex}{suffix}"
+
+    def resolve(self, name):
+        """Filesystem path for a stored name (blob name or legacy flat file); None if invalid"""
+        if not name or "/" in name or "\\" in name or name.startswith("."):
+            return None
+        parsed = parse_blob_name(name)
+        if parsed:
+            return self.blob_path(parsed[0])
+        return self.upload_dir / name
+
+    def exists(self, name):
+        path = self.resolve(name)
+        if path is None:
+            return False
+        if path.is_file():
+            return True
+        parsed = parse_blob_name(name)
+        return bool(parsed) and self.remote and self.driver.exists(parsed[0])
+
+    def local_path(self, name):
+        """
+        Local path holding a stored name's bytes, fetching the blob from remote
+        storage if this machine has no copy; None if it does not exist.
+        """
+        path = self.resolve(name)
+        if path is None:
+            return None
+        if path.is_file():
+            return path
+        parsed = parse_blob_name(name)
+        if not parsed or not self.remote:
+            return None
+
+        temp_path = self.temp_path(".fetching")
+        try:
+            if not self.driver.download(parsed[0], temp_path):
+                return None
+            self._place(temp_path, path)
+        finally:
+            temp_path.unlink(missing_ok=True)
+        logger.info(f"Fetched blob {parsed[0]} from {self.driver.name} storage")
+        return path
+
+    def presigned_url(self, name, filename=None):
+        """Expiring download URL for a blob name (see the driver for where it points)"""
+        parsed = parse_blob_name(name)
+        if not parsed:
+            return None
+        return self.driver.presigned_url(parsed[0], name, filename)
+
+    @staticmethod
+    def _place(temp_path, target):
+        with open(temp_path, "rb+") as f:
+            os.fsync(f.fileno())
+        target.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.replace(temp_path, target)
+        except FileNotFoundError:
+            # The shard was pruned by a concurrent remove(); recreate it
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(temp_path, target)
+
+    def ingest(self, temp_path, digest=None, ext=""):
+        """
+        Move a finished temp file into the store and return its blob name.
+        If the content is already stored the temp file is simply dropped.
+        With remote storage the blob is pushed there before the name is returned.
+        """
+        temp_path = Path(temp_path)
+        if digest is None:
+            digest = file_digest(temp_path)
+        target = self.blob_path(digest)
+
+        try:
+            # Already stored: refresh it so garbage collection sees a fresh reference in the making
+            os.utime(target)
+            temp_path.unlink(missing_ok=True)
+        except FileNotFoundError:
+            self._place(temp_path, target)
+
+        if self.remote:
+            self.driver.upload(digest, target, mimetypes.guess_type(f"blob{ext}")[0])
+        return f"{digest}{ext}"
+
+    def ingest_tree(self, directory):
+        """Store every file in a directory; returns its manifest {file name: blob digest}"""
+        manifest = {}
+        for path in sorted(Path(directory).iterdir()):
+            if path.is_file():
+                temp_path = self.temp_path()
+                os.replace(path, temp_path)
+                manifest[path.name] = parse_blob_name(self.ingest(temp_path))[0]
+        return manifest
+
+    def manifest_entries(self, manifest):
+        """[(file name, local blob path)] for a manifest; raises BlobNotFound if any blob is missing"""
+        entries = []
+        for name, digest in sorted(manifest.items()):
+            path = self.local_path(digest)
+            if path is None:
+                raise BlobNotFound(f"Blob {digest} ({name}) is missing")
+            entries.append((name, path))
+        return entries
+
+    def iter_blobs(self):
+        """Yield (digest, path) for every stored blob"""
+        for shard in self.root.iterdir():
+            if shard.name == TEMP_DIRNAME or not shard.is_dir():
+                continue
+            for subshard in shard.iterdir():
+                for path in subshard.iterdir():
+                    yield path.name, path
+
+    def remove(self, digest):
+        """Delete a blob everywhere"""
+        if self.remote:
+            self.driver.delete(digest)
+        self.remove_local(digest)
+
+    def offload(self, digest):
+        """Drop the local copy of a blob once remote storage is known to hold it"""
+        if not self.remote:
+            return False
+        path = self.blob_path(digest)
+        if path.is_file():
+            # Blobs stored before the driver was configured may exist only here
+            self.driver.upload(digest, path)
+        self.remove_local(digest)
+        return True
+
+    def remove_local(self, digest):
+        path = self.blob_path(digest)
+        path.unlink(missing_ok=True)
+        # Prune emptied shard directories
+        for directory in (path.parent, path.parent.parent):
+            try:
+                directory.rmdir()
+            except OSError:
+                break
@@ -0,0 +1,93 @@
+"""
+Shared MongoDB change streams.
+
+Each process opens at most one change stream per collection and fans its
+events out to listeners (the document caches, the project event bus), so
+adding a consumer never adds another server-side cursor. Enabled with
+MONGO_CHANGE_STREAMS=true; change streams need a replica set or sharded
+cluster, and on a standalone server the watcher logs it once and stops.
+"""
+import os
+import asyncio
+import logging
+
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+MONGO_CHANGE_STREAMS = os.environ.get('MONGO_CHANGE_STREAMS', 'false').lower() == 'true'
+CHANGE_STREAM_RETRY_SECONDS = float(os.environ.get('CHANGE_STREAM_RETRY_SECONDS', '5'))
+
+# "$changeStream is only supported on replica sets" and similar
+CHANGE_STREAMS_UNSUPPORTED_CODES = (40573, 40324)
+
+# Change events after which nothing derived from the collection can be trusted
+COLLECTION_EVENTS = ("drop", "rename", "dropDatabase", "invalidate")
+
+
+class ChangeStreamWatcher:
+    """
+    Watches `db[collection_name]`. Listeners get on_change(event) for every change and
+    on_reset() whenever events may have been missed (stream (re)opened or failed).
+    `full_document_fields` adds those fields of the changed document to update events.
+    """
+
+    def __init__(self, db, collection_name, full_document_fields=()):
+        self.db = db
+        self.collection_name = collection_name
+        self.full_document_fields = tuple(full_document_fields)
+        self.state = "disabled"
+        self.events = 0
+        self._listeners = []
+
+    def subscribe(self, on_change, on_reset=None):
+        self._listeners.append((on_change, on_reset))
+
+    def _pipeline(self):
+        projection = {"operationType": 1, "documentKey": 1}
+        for field in self.full_document_fields:
+            projection[f"fullDocument.{field}"] = 1
+        return [{"$project": projection}]
+
+    def _notify(self, index, *args):
+        for listener in self._listeners:
+            callback = listener[index]
+            if callback is None:
+                continue
+            try:
+                callback(*args)
+            except Exception as e:
+                logger.error(f"Change stream listener on {self.collection_name} failed: {str(e)}")
+
+    async def run(self, retry_seconds=CHANGE_STREAM_RETRY_SECONDS):
+        """Deliver changes until cancelled, reopening the stream after errors"""
+        options = {"full_document": "updateLookup"} if self.full_document_fields else {}
+        while True:
+            try:
+                async with self.db[self.collection_name].watch(self._pipeline(), **options) as stream:
+                    # Changes made while the stream was down were missed
+                    self._notify(1)
+                    self.state = "watching"
+                    logger.info(f"Watching {self.collection_name} changes")
+                    async for change in stream:
+                        self.events += 1
+                        if change.get("operationType") in COLLECTION_EVENTS:
+                            self._notify(1)
+                            continue
+                        self._notify(0, change)
+            except asyncio.CancelledError:
+                raise
+            except (OperationFailure, NotImplementedError) as e:
+                if isinstance(e, NotImplementedError) or e.code in CHANGE_STREAMS_UNSUPPORTED_CODES:
+                    self.state = "unsupported"
+                    logger.warning(f"Change streams are not available on this MongoDB deployment ({self.collection_name})")
+                    return
+                self._failed(e)
+            except Exception as e:
+                self._failed(e)
+            await asyncio.sleep(retry_seconds)
+
+    def _failed(self, error):
+        self.state = "reconnecting"
+        self._notify(1)
+        logger.error(f"Change stream on {self.collection_name} failed, retrying: {str(error)}")
@@ -0,0 +1,200 @@
+"""
+The process-wide MongoDB client.
+
+One AsyncIOMotorClient is created when the app starts (in its lifespan)
+and closed when it stops. Pool size, timeouts and read preference come
+from the environment so the pool can be sized per uvicorn worker:
+roughly, MONGO_MAX_POOL_SIZE x workers must stay below the server's
+connection limit. Route handlers get the database with
+Depends(get_database); background services hold `mongo.proxy`, which
+resolves to the same database once it is connected.
+
+A ConnectionPoolListener keeps live pool statistics (connections open,
+checked out, requests waiting for a connection) for GET /api/db/pool.
+"""
+import os
+import time
+import logging
+import threading
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+
+def _optional_int(name, default=None):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+
+MONGO_MAX_POOL_SIZE = _optional_int('MONGO_MAX_POOL_SIZE', 100)
+MONGO_MIN_POOL_SIZE = _optional_int('MONGO_MIN_POOL_SIZE', 0)
+MONGO_MAX_IDLE_TIME_MS = _optional_int('MONGO_MAX_IDLE_TIME_MS')
+MONGO_WAIT_QUEUE_TIMEOUT_MS = _optional_int('MONGO_WAIT_QUEUE_TIMEOUT_MS')
+MONGO_SERVER_SELECTION_TIMEOUT_MS = _optional_int('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000)
+MONGO_CONNECT_TIMEOUT_MS = _optional_int('MONGO_CONNECT_TIMEOUT_MS', 5000)
+MONGO_SOCKET_TIMEOUT_MS = _optional_int('MONGO_SOCKET_TIMEOUT_MS', 60000)
+MONGO_READ_PREFERENCE = os.environ.get('MONGO_READ_PREFERENCE', 'primary')
+
+
+def client_options():
+    """Keyword arguments for the Motor client, from the MONGO_* settings"""
+    options = {
+        "tz_aware": True,
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS,
+        "readPreference": MONGO_READ_PREFERENCE,
+    }
+    return {key: value for key, value in options.items() if value is not None}
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Counts connection pool events; callbacks arrive from driver threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pools = {}
+
+    def _pool(self, address):
+        key = f"{address[0]}:{address[1]}"
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = self._pools[key] = {
+                "open": 0, "checked_out": 0, "waiting": 0, "max_checked_out": 0, "max_waiting": 0,
+                "checkouts_total": 0, "checkout_failures_total": 0, "cleared_total": 0,
+                "wait_seconds_total": 0.0, "_waits": {},
+            }
+        return pool
+
+    def stats(self):
+        with self._lock:
+            pools = {
+                address: {key: value for key, value in pool.items() if not key.startswith("_")}
+                for address, pool in self._pools.items()
+            }
+        for pool in pools.values():
+            pool["wait_seconds_total"] = round(pool["wait_seconds_total"], 3)
+        return pools
+
+    def _wait_started(self, event):
+        with self._lock:
+            pool = self._pool(event.address)
+            pool["waiting"] += 1
+            pool["max_waiting"] = max(pool["max_waiting"], pool["waiting"])
+            pool["_waits"][threading.get_ident()] = time.monotonic()
+
+    def _wait_finished(self, event, checked_out):
+        with self._lock:
+            pool = self._pool(event.address)
+            pool["waiting"] = max(0, pool["waiting"] - 1)
+            started = pool["_waits"].pop(threading.get_ident(), None)
+            if started is not None:
+                pool["wait_seconds_total"] += time.monotonic() - started
+            if checked_out:
+                pool["checked_out"] += 1
+                pool["checkouts_total"] += 1
+                pool["max_checked_out"] = max(pool["max_checked_out"], pool["checked_out"])
+            else:
+                pool["checkout_failures_total"] += 1
+
+    def _adjust(self, event, key, delta):
+        with self._lock:
+            pool = self._pool(event.address)
+            pool[key] = max(0, pool[key] + delta)
+
+    def connection_check_out_started(self, event):
+        self._wait_started(event)
+
+    def connection_checked_out(self, event):
+        self._wait_finished(event, checked_out=True)
+
+    def connection_check_out_failed(self, event):
+        self._wait_finished(event, checked_out=False)
+
+    def connection_checked_in(self, event):
+        self._adjust(event, "checked_out", -1)
+
+    def connection_created(self, event):
+        self._adjust(event, "open", 1)
+
+    def connection_closed(self, event):
+        self._adjust(event, "open", -1)
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        with self._lock:
+            self._pool(event.address)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._adjust(event, "cleared_total", 1)
+
+    def pool_closed(self, event):
+        with self._lock:
+            self._pools.pop(f"{event.address[0]}:{event.address[1]}", None)
+
+
+class _DatabaseProxy:
+    """Stands in for the database in objects created before the client is connected"""
+
+    def __init__(self, manager):
+        self._manager = manager
+
+    def __getattr__(self, name):
+        return getattr(self._manager.db, name)
+
+    def __getitem__(self, name):
+        return self._manager.db[name]
+
+
+class MongoManager:
+    def __init__(self):
+        self.client = None
+        self.db = None
+        self.listener = PoolStatsListener()
+        self.proxy = _DatabaseProxy(self)
+
+    def connect(self, url=None, name=None, **overrides):
+        """Create the client; called once from the app lifespan"""
+        if self.client is not None:
+            return self.db
+        options = {**client_options(), **overrides}
+        self.client = AsyncIOMotorClient(
+            url or os.environ['MONGO_URL'], event_listeners=[self.listener], **options
+        )
+        self.db = self.client[name or os.environ['DB_NAME']]
+        logger.info(
+            f"Connected MongoDB client (maxPoolSize={options.get('maxPoolSize')}, "
+            f"minPoolSize={options.get('minPoolSize')}, readPreference={options.get('readPreference')})"
+        )
+        return self.db
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+            logger.info("Closed MongoDB client")
+        self.client = None
+        self.db = None
+
+    def pool_stats(self):
+        return {"options": client_options(), "pools": self.listener.stats()}
+
+
+mongo = MongoManager()
+
+
+def get_database():
+    """FastAPI dependency: the shared database"""
+    if mongo.db is None:
+        raise RuntimeError("MongoDB client is not connected (the app lifespan has not started)")
+    return mongo.db
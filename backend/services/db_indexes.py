@@ -0,0 +1,124 @@
+"""
+MongoDB indexes for every lookup path.
+
+Documents are looked up by their `id` field (never `_id`), so without an
+index each find_one is a collection scan. ensure_indexes() runs at startup:
+it creates the indexes below if missing (a no-op when they already exist),
+then verifies them and checks that `id` lookups are planned as index scans.
+Listings sort on (created_at, id), which the compound indexes serve
+directly. Status checks expire through a TTL index on their timestamp; when
+STATUS_CHECK_TTL_SECONDS changes the existing index is updated in place.
+"""
+import logging
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import PyMongoError
+
+from services.status_buffer import STATUS_CHECK_TTL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+INDEXES = {
+    "projects": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created_at_id"),
+        IndexModel([("updated_at", DESCENDING), ("id", DESCENDING)], name="updated_at_id"),
+    ],
+    "user_styles": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="created_at_id"),
+    ],
+    "status_checks": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("timestamp", DESCENDING), ("id", DESCENDING)], name="timestamp_id"),
+        IndexModel([("timestamp", ASCENDING)], name="timestamp_ttl", expireAfterSeconds=STATUS_CHECK_TTL_SECONDS),
+    ],
+    "upload_sessions": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("expires_at", ASCENDING)], name="expires_at"),
+    ],
+}
+
+
+def _plan_stages(plan):
+    """Every stage name in a (nested) query plan"""
+    stages = [plan.get("stage")]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages += _plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        stages += _plan_stages(child)
+    return [stage for stage in stages if stage]
+
+
+async def lookup_plan(collection, field="id"):
+    """Winning plan stage for an equality lookup on `field` (IXSCAN, COLLSCAN, ...); None if unknown"""
+    try:
+        explained = await collection.find({field: "__index_check__"}).limit(1).explain()
+    except (PyMongoError, NotImplementedError, TypeError, AttributeError) as e:
+        logger.debug(f"Could not explain {collection.name} lookup: {str(e)}")
+        return None
+    stages = _plan_stages(explained.get("queryPlanner", {}).get("winningPlan", {}))
+    for stage in ("IXSCAN", "IDHACK", "EXPRESS_IXSCAN", "COLLSCAN"):
+        if stage in stages:
+            return stage
+    return stages[-1] if stages else None
+
+
+async def verify_indexes(db, specs=INDEXES):
+    """{collection: {"missing": [...], "id_lookup": plan stage}} for the indexes in `specs`"""
+    report = {}
+    for name, models in specs.items():
+        collection = db[name]
+        try:
+            existing = await collection.index_information()
+        except PyMongoError as e:
+            report[name] = {"missing": [model.document["name"] for model in models], "error": str(e)}
+            continue
+
+        existing_keys = {tuple(info["key"]) for info in existing.values()}
+        missing = [
+            model.document["name"] for model in models
+            if tuple(model.document["key"].items()) not in existing_keys
+        ]
+        report[name] = {"missing": missing, "id_lookup": await lookup_plan(collection)}
+    return report
+
+
+async def _sync_ttl(collection, models):
+    """Apply changed expireAfterSeconds to existing TTL indexes (create_indexes would reject them)"""
+    existing = await collection.index_information()
+    for model in models:
+        expire = model.document.get("expireAfterSeconds")
+        current = existing.get(model.document["name"])
+        if expire is None or current is None or current.get("expireAfterSeconds") == expire:
+            continue
+        await collection.database.command(
+            "collMod", collection.name, index={"name": model.document["name"], "expireAfterSeconds": expire}
+        )
+        logger.info(f"Changed {collection.name}.{model.document['name']} expiry to {expire}s")
+
+
+async def ensure_indexes(db, specs=INDEXES):
+    """Create any missing indexes, then verify and log the index state; returns the report"""
+    errors = {}
+    for name, models in specs.items():
+        try:
+            await _sync_ttl(db[name], models)
+            await db[name].create_indexes(models)
+        except PyMongoError as e:
+            # e.g. duplicate ids prevent the unique index; the app still works, just slower
+            errors[name] = str(e)
+            logger.error(f"Could not create indexes on {name}: {str(e)}")
+
+    report = await verify_indexes(db, specs)
+    for name, state in report.items():
+        if name in errors:
+            state["error"] = errors[name]
+        if state["missing"]:
+            logger.warning(f"Collection {name} is missing indexes: {', '.join(state['missing'])}")
+        elif state.get("id_lookup") == "COLLSCAN":
+            logger.warning(f"Lookups by id on {name} still scan the collection")
+        else:
+            logger.info(f"Indexes on {name} verified (id lookups: {state.get('id_lookup') or 'unknown plan'})")
+    return report
@@ -0,0 +1,131 @@
+"""
+Read-through cache for documents looked up by `id`.
+
+Projects and user styles are read far more often than they change: the UI
+polls GET /projects/{id} while a transform runs, and every lyrics request
+loads the project and its user style. DocumentCache keeps recently read
+documents in memory (LRU, at most DOCUMENT_CACHE_MAX_ENTRIES per
+collection) for up to DOCUMENT_CACHE_TTL_SECONDS, so repeated reads never
+reach Mongo. Every write path in this process invalidates the documents it
+touches. Writes made by other processes are picked up when the TTL lapses,
+or at once when the cache is attached to its collection's change stream
+(MONGO_CHANGE_STREAMS=true, see services/change_streams.py).
+"""
+import os
+import copy
+import time
+from collections import OrderedDict
+
+import bson
+
+DOCUMENT_CACHE_MAX_ENTRIES = int(os.environ.get('DOCUMENT_CACHE_MAX_ENTRIES', '1000'))
+DOCUMENT_CACHE_TTL_SECONDS = float(os.environ.get('DOCUMENT_CACHE_TTL_SECONDS', '30'))
+
+
+class DocumentCache:
+    """LRU + TTL cache of `db[collection_name]` documents keyed by their `id` field"""
+
+    def __init__(self, db, collection_name, max_entries=DOCUMENT_CACHE_MAX_ENTRIES,
+                 ttl_seconds=DOCUMENT_CACHE_TTL_SECONDS):
+        self.db = db
+        self.collection_name = collection_name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # id -> (document, Mongo _id, expiry on the monotonic clock, encoded size)
+        self._entries = OrderedDict()
+        # Change events identify documents by _id
+        self._ids_by_oid = {}
+        # Bumped by every invalidation, so a read that raced with a write isn't cached
+        self._epoch = 0
+        self.bytes = 0
+        self.watcher = None
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "evictions": 0,
+            "invalidations": 0,
+            "change_events": 0,
+        }
+
+    @property
+    def collection(self):
+        return self.db[self.collection_name]
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.ttl_seconds > 0
+
+    async def get(self, doc_id):
+        """The document with this `id` (a private copy, without `_id`), or None"""
+        entry = self._entries.get(doc_id)
+        if entry is not None:
+            if time.monotonic() < entry[2]:
+                self._entries.move_to_end(doc_id)
+                self.stats["hits"] += 1
+                return copy.deepcopy(entry[0])
+            self._drop(doc_id)
+            self.stats["expired"] += 1
+
+        self.stats["misses"] += 1
+        epoch = self._epoch
+        doc = await self.collection.find_one({"id": doc_id})
+        if doc is None:
+            return None
+        oid = doc.pop("_id", None)
+        if self.enabled and epoch == self._epoch:
+            self._store(doc_id, copy.deepcopy(doc), oid)
+        return doc
+
+    def _store(self, doc_id, doc, oid):
+        self._drop(doc_id)
+        size = len(bson.encode(doc))
+        self._entries[doc_id] = (doc, oid, time.monotonic() + self.ttl_seconds, size)
+        self.bytes += size
+        if oid is not None:
+            self._ids_by_oid[oid] = doc_id
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+            self.stats["evictions"] += 1
+
+    def _drop(self, doc_id):
+        entry = self._entries.pop(doc_id, None)
+        if entry is not None:
+            self.bytes -= entry[3]
+            self._ids_by_oid.pop(entry[1], None)
+
+    def invalidate(self, doc_id):
+        """Forget a document after it was written"""
+        self._epoch += 1
+        if doc_id in self._entries:
+            self._drop(doc_id)
+            self.stats["invalidations"] += 1
+
+    def clear(self):
+        self._epoch += 1
+        self._entries.clear()
+        self._ids_by_oid.clear()
+        self.bytes = 0
+
+    def metrics(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else None,
+            "change_stream": self.watcher.state if self.watcher else "disabled",
+            **self.stats,
+        }
+
+    def attach(self, watcher):
+        """Drop documents as `watcher` (a ChangeStreamWatcher on this collection) reports them changed"""
+        self.watcher = watcher
+        watcher.subscribe(self.handle_change, self.clear)
+
+    def handle_change(self, change):
+        self.stats["change_events"] += 1
+        doc_id = self._ids_by_oid.get((change.get("documentKey") or {}).get("_id"))
+        if doc_id is not None:
+            self.invalidate(doc_id)
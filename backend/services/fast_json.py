@@ -0,0 +1,101 @@
+"""
+Fast JSON responses for listings.
+
+By default a listing builds a model per document and FastAPI then validates
+and serializes the whole list again through the response model with the
+stdlib encoder. FAST_JSON_RESPONSES opts into a single pass:
+
+  validated  each document is validated once, then serialized with orjson
+  trusted    documents read from our own database are not validated at all:
+             they only get the model's defaults and lose unknown fields
+
+Both produce the same JSON as the default path (UTC datetimes end in "Z").
+Without orjson installed the stdlib encoder is used.
+"""
+import os
+import copy
+import json
+import logging
+from datetime import datetime, timezone
+
+from pydantic import BaseModel
+from pydantic_core import PydanticUndefined
+from starlette.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError as e:
+    ORJSON_AVAILABLE = False
+    logger.warning(f"orjson not available, fast JSON responses use the standard json encoder: {str(e)}")
+
+FAST_JSON_MODES = ("off", "validated", "trusted")
+FAST_JSON_RESPONSES = os.environ.get('FAST_JSON_RESPONSES', 'off').lower()
+if FAST_JSON_RESPONSES not in FAST_JSON_MODES:
+    logger.warning(f"Unknown FAST_JSON_RESPONSES '{FAST_JSON_RESPONSES}', using 'off'")
+    FAST_JSON_RESPONSES = "off"
+
+# Page headers set on the injected Response by the listing routes
+_PASSTHROUGH_EXCLUDED = {"content-length", "content-type"}
+
+
+def _default(value):
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def _stdlib_default(value):
+    if isinstance(value, datetime):
+        if value.tzinfo is not None and value.utcoffset() == timezone.utc.utcoffset(None):
+            return value.replace(tzinfo=None).isoformat() + "Z"
+        return value.isoformat()
+    return _default(value)
+
+
+def dumps(content):
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_stdlib_default, separators=(",", ":")).encode("utf-8")
+
+
+class ORJSONResponse(JSONResponse):
+    def render(self, content):
+        return dumps(content)
+
+
+def _trusted(model, docs):
+    """The documents shaped like `model` without validating them (like model_construct(), but plain dicts)"""
+    fields = [(name, field.default_factory, field.default) for name, field in model.model_fields.items()]
+    shaped = []
+    for doc in docs:
+        item = {}
+        for name, factory, default in fields:
+            if name in doc:
+                item[name] = doc[name]
+            elif factory is not None:
+                item[name] = factory()
+            elif default is not PydanticUndefined:
+                item[name] = copy.copy(default)
+        shaped.append(item)
+    return shaped
+
+
+def build_models(model, docs, mode):
+    """`docs` as serializable `model` data; validated unless the mode is trusted"""
+    if mode == "trusted":
+        return _trusted(model, docs)
+    return [model.model_validate(doc).model_dump() for doc in docs]
+
+
+def list_response(response, items, model=None, mode=None):
+    """
+    JSON response for a listing, keeping the headers set on the route's injected `response`.
+    With `model`, `items` are documents to shape into it (per `mode`); otherwise they're sent as they are.
+    """
+    mode = mode or FAST_JSON_RESPONSES
+    content = build_models(model, items, mode) if model is not None else items
+    headers = {key: value for key, value in response.headers.items() if key.lower() not in _PASSTHROUGH_EXCLUDED}
+    return ORJSONResponse(content, status_code=response.status_code or 200, headers=headers)
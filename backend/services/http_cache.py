@@ -0,0 +1,67 @@
+"""
+HTTP validator helpers shared by the download endpoints.
+"""
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import quote
+
+from starlette.responses import Response
+
+
+def make_etag(value, weak=False):
+    return f'{"W/" if weak else ""}"{value}"'
+
+
+def etag_matches(if_none_match, etag):
+    """Weak comparison of an If-None-Match header against an ETag"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    bare = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == bare:
+            return True
+    return False
+
+
+def not_modified_since(if_modified_since, mtime):
+    """True if a resource last modified at `mtime` (epoch seconds) is unchanged since the header date"""
+    if not if_modified_since:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return False
+    # HTTP dates have one-second resolution
+    return int(mtime) <= since
+
+
+def http_date(timestamp):
+    return formatdate(timestamp, usegmt=True)
+
+
+def is_not_modified(request_headers, etag, mtime=None):
+    """Evaluate conditional GET headers (If-None-Match takes precedence over If-Modified-Since)"""
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match:
+        return etag_matches(if_none_match, etag)
+    if mtime is not None:
+        return not_modified_since(request_headers.get("if-modified-since"), mtime)
+    return False
+
+
+def not_modified_response(headers):
+    """304 carrying the validators/cache headers of the full response"""
+    keep = {"etag", "cache-control", "last-modified", "vary", "expires"}
+    return Response(status_code=304, headers={k: v for k, v in headers.items() if k.lower() in keep})
+
+
+def content_disposition(filename, disposition="attachment"):
+    """Content-Disposition header value that survives non-ASCII filenames"""
+    fallback = filename.encode("ascii", "replace").decode().replace("?", "_").replace('"', "_").replace("\\", "_")
+    if fallback != filename:
+        return f"{disposition}; filename=\"{fallback}\"; filename*=utf-8''{quote(filename)}"
+    return f'{disposition}; filename="{filename}"'
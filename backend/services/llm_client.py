@@ -0,0 +1,279 @@
+"""
+Shared LLM client for lyrics generation.
+
+Every call used to build its own LlmChat under one hard-coded session id, so
+no connection outlived a request and concurrent users shared conversation
+state. LLMClientPool is created once per process (`llm_pool`, started and
+stopped with the app like the MongoDB client):
+
+  connections  one httpx.AsyncClient with keep-alive, installed as
+               litellm.aclient_session, which every completion goes
+               through when litellm can reach the model (LlmChat, used
+               otherwise, manages its own connections)
+  sessions     each call gets its own session id (`new_session_id()`)
+  timeouts     LLM_TIMEOUT_SECONDS per call (per chunk while streaming)
+  retries      timeouts, connection errors, 429 and 5xx are retried up to
+               LLM_MAX_RETRIES times with full-jitter exponential backoff
+  concurrency  at most LLM_MAX_CONCURRENCY calls run at once; the rest wait
+               in line up to LLM_QUEUE_TIMEOUT_SECONDS, then LLMBusyError
+"""
+import os
+import asyncio
+import logging
+import random
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+try:
+    from emergentintegrations.llm.chat import LlmChat, UserMessage
+    AI_SERVICES_AVAILABLE = True
+except ImportError as e:
+    logger.warning(f"AI services dependencies not installed: {e}")
+    AI_SERVICES_AVAILABLE = False
+
+# Streamed and multi-choice completions talk to the model through litellm (which LlmChat is built on)
+try:
+    import litellm
+    import httpx
+    LITELLM_AVAILABLE = True
+except ImportError as e:
+    logger.warning(f"litellm not installed, lyrics are streamed as one chunk and variants share one prompt: {e}")
+    LITELLM_AVAILABLE = False
+
+LLM_PROVIDER = os.environ.get('LLM_PROVIDER', 'openai')
+LLM_MODEL = os.environ.get('LLM_MODEL', 'gpt-4o')
+# litellm's name for the model
+LLM_MODEL_ID = f"{LLM_PROVIDER}/{LLM_MODEL}"
+# Endpoint for streamed completions when the key belongs to an OpenAI-compatible proxy
+LLM_API_BASE = os.environ.get('LLM_API_BASE')
+# Emergent universal keys are only accepted by Emergent's proxy, which LlmChat finds by itself
+# but litellm only reaches through LLM_API_BASE
+EMERGENT_KEY_PREFIX = "sk-emergent-"
+
+LLM_TIMEOUT_SECONDS = float(os.environ.get('LLM_TIMEOUT_SECONDS', '60'))
+LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', '2'))
+LLM_RETRY_BASE_SECONDS = float(os.environ.get('LLM_RETRY_BASE_SECONDS', '0.5'))
+LLM_RETRY_MAX_SECONDS = float(os.environ.get('LLM_RETRY_MAX_SECONDS', '8'))
+LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', '8'))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.environ.get('LLM_QUEUE_TIMEOUT_SECONDS', '30'))
+LLM_MAX_CONNECTIONS = int(os.environ.get('LLM_MAX_CONNECTIONS', '20'))
+LLM_KEEPALIVE_SECONDS = float(os.environ.get('LLM_KEEPALIVE_SECONDS', '60'))
+
+RETRYABLE_STATUS_CODES = (408, 409, 429, 500, 502, 503, 504)
+
+
+class LLMError(Exception):
+    pass
+
+
+class LLMBusyError(LLMError):
+    """Too many LLM calls are already waiting"""
+
+
+class LLMTimeoutError(LLMError):
+    pass
+
+
+def new_session_id(prefix="lyrics"):
+    return f"{prefix}-{uuid.uuid4().hex}"
+
+
+def litellm_reachable():
+    """Whether litellm can call the model itself: with a provider key, or with an Emergent key and LLM_API_BASE"""
+    if not LITELLM_AVAILABLE:
+        return False
+    return bool(LLM_API_BASE) or not os.environ.get('EMERGENT_LLM_KEY', '').startswith(EMERGENT_KEY_PREFIX)
+
+
+def _retryable(error):
+    if isinstance(error, (asyncio.TimeoutError, LLMTimeoutError, ConnectionError)):
+        return True
+    if LITELLM_AVAILABLE and isinstance(error, httpx.TransportError):
+        return True
+    # litellm / openai errors carry the HTTP status
+    status = getattr(error, "status_code", None)
+    return status in RETRYABLE_STATUS_CODES
+
+
+class LLMClientPool:
+    def __init__(self, max_concurrency=LLM_MAX_CONCURRENCY, timeout_seconds=LLM_TIMEOUT_SECONDS,
+                 max_retries=LLM_MAX_RETRIES, queue_timeout_seconds=LLM_QUEUE_TIMEOUT_SECONDS):
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout_seconds = timeout_seconds
+        self.max_retries = max(0, max_retries)
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._http = None
+        self.in_flight = 0
+        self.waiting = 0
+        self.stats = {"calls": 0, "retries": 0, "timeouts": 0, "failures": 0, "rejected": 0,
+                      "stream_fallbacks": 0, "wait_seconds": 0.0}
+
+    def start(self):
+        """Open the keep-alive connection pool; called from the app lifespan"""
+        if not LITELLM_AVAILABLE or self._http is not None:
+            return
+        self._http = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_CONNECTIONS,
+                keepalive_expiry=LLM_KEEPALIVE_SECONDS,
+            ),
+            timeout=httpx.Timeout(self.timeout_seconds, connect=min(10.0, self.timeout_seconds)),
+        )
+        litellm.aclient_session = self._http
+        logger.info(f"Opened LLM connection pool (max {LLM_MAX_CONNECTIONS} connections, {self.max_concurrency} concurrent calls)")
+        if not litellm_reachable():
+            logger.warning("EMERGENT_LLM_KEY needs LLM_API_BASE for streamed completions, lyrics arrive as one chunk")
+
+    async def stop(self):
+        if self._http is None:
+            return
+        if litellm.aclient_session is self._http:
+            litellm.aclient_session = None
+        await self._http.aclose()
+        self._http = None
+        logger.info("Closed LLM connection pool")
+
+    async def _acquire(self):
+        self.waiting += 1
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout_seconds)
+        except asyncio.TimeoutError:
+            self.stats["rejected"] += 1
+            raise LLMBusyError(f"No LLM capacity within {self.queue_timeout_seconds:g}s, try again shortly")
+        finally:
+            self.waiting -= 1
+            self.stats["wait_seconds"] += time.monotonic() - start
+        self.in_flight += 1
+
+    def _release(self):
+        self.in_flight -= 1
+        self._slots.release()
+
+    async def _backoff(self, attempt, error):
+        delay = random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * 2 ** attempt))
+        self.stats["retries"] += 1
+        logger.warning(f"LLM call failed ({str(error) or type(error).__name__}), retrying in {delay:.2f}s")
+        await asyncio.sleep(delay)
+
+    def chat(self, system_message, session_id=None):
+        """An LlmChat with its own session"""
+        if not AI_SERVICES_AVAILABLE:
+            raise LLMError("AI services dependencies not installed")
+        return LlmChat(
+            api_key=os.environ.get('EMERGENT_LLM_KEY'),
+            session_id=session_id or new_session_id(),
+            system_message=system_message
+        ).with_model(LLM_PROVIDER, LLM_MODEL)
+
+    async def _with_retries(self, call, description):
+        """Await `call()` (a fresh coroutine per attempt) with the call timeout, retrying transient failures"""
+        for attempt in range(self.max_retries + 1):
+            self.stats["calls"] += 1
+            try:
+                return await asyncio.wait_for(call(), self.timeout_seconds)
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    self.stats["timeouts"] += 1
+                    e = LLMTimeoutError(f"{description} timed out after {self.timeout_seconds:g}s")
+                if attempt < self.max_retries and _retryable(e):
+                    await self._backoff(attempt, e)
+                    continue
+                self.stats["failures"] += 1
+                raise e
+
+    def _completion(self, prompt, system_message, session_id, **options):
+        return litellm.acompletion(
+            model=LLM_MODEL_ID,
+            messages=[
+                {"role": "system", "content": system_message},
+                {"role": "user", "content": prompt},
+            ],
+            api_key=os.environ.get('EMERGENT_LLM_KEY'),
+            api_base=LLM_API_BASE,
+            user=session_id,
+            **options
+        )
+
+    async def complete(self, prompt, system_message, session_id=None):
+        """The whole completion for `prompt`, through litellm when it can reach the model, else LlmChat"""
+        session_id = session_id or new_session_id()
+        direct = litellm_reachable()
+        if not direct and not AI_SERVICES_AVAILABLE:
+            raise LLMError("AI services dependencies not installed")
+        await self._acquire()
+        try:
+            if direct:
+                response = await self._with_retries(
+                    lambda: self._completion(prompt, system_message, session_id), "LLM call"
+                )
+                response = response.choices[0].message.content or ""
+            else:
+                response = await self._with_retries(
+                    lambda: self.chat(system_message, session_id).send_message(UserMessage(text=prompt)), "LLM call"
+                )
+        finally:
+            self._release()
+        return response.strip() if isinstance(response, str) else str(response)
+
+    async def complete_many(self, prompt, system_message, n, session_id=None):
+        """`n` independent completions for `prompt` from one request (the prompt is sent and billed once)"""
+        if not litellm_reachable():
+            raise LLMError("litellm not installed, or no LLM_API_BASE for an Emergent key")
+        session_id = session_id or new_session_id()
+        await self._acquire()
+        try:
+            response = await self._with_retries(
+                lambda: self._completion(prompt, system_message, session_id, n=n), "LLM call"
+            )
+        finally:
+            self._release()
+        return [(choice.message.content or "").strip() for choice in response.choices]
+
+    async def stream(self, prompt, system_message, session_id=None):
+        """
+        The completion for `prompt` as text chunks. Opening the stream is retried; once text has
+        been produced a failure is raised, and no chunk may take longer than the call timeout.
+        """
+        if not litellm_reachable():
+            raise LLMError("litellm not installed, or no LLM_API_BASE for an Emergent key")
+        session_id = session_id or new_session_id()
+        await self._acquire()
+        try:
+            response = await self._with_retries(
+                lambda: self._completion(prompt, system_message, session_id, stream=True), "Opening the LLM stream"
+            )
+            chunks = response.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), self.timeout_seconds)
+                except StopAsyncIteration:
+                    return
+                except asyncio.TimeoutError:
+                    self.stats["timeouts"] += 1
+                    self.stats["failures"] += 1
+                    raise LLMTimeoutError(f"LLM stream stalled for {self.timeout_seconds:g}s")
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    yield delta
+        finally:
+            self._release()
+
+    def metrics(self):
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_concurrency": self.max_concurrency,
+            "timeout_seconds": self.timeout_seconds,
+            "max_retries": self.max_retries,
+            "connection_pool": "open" if self._http is not None else "closed",
+            **self.stats,
+            "wait_seconds": round(self.stats["wait_seconds"], 3),
+        }
+
+
+llm_pool = LLMClientPool()
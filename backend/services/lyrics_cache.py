@@ -0,0 +1,210 @@
+"""
+Cache of generated lyrics, with in-flight request coalescing.
+
+People press generate again and again on the same preset, and each press
+used to be a full LLM call. Lyrics are cached per prompt (and model): a key
+collects up to LYRICS_CACHE_VARIATIONS different results, so the first
+presses still get fresh takes, and once the key has its variations further
+requests are served from them in turn. Identical requests that arrive while
+a generation for their key is running wait for it instead of calling the
+model again. A request with `fresh` set always calls the model, and its
+result replaces the oldest variation.
+
+Entries live in process memory (LRU, at most LYRICS_CACHE_MAX_KEYS keys)
+for LYRICS_CACHE_TTL_SECONDS. metrics() estimates the tokens and cost the
+cache saved from the sizes of the prompts and lyrics it answered.
+"""
+import os
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+
+LYRICS_CACHE_VARIATIONS = int(os.environ.get('LYRICS_CACHE_VARIATIONS', '3'))
+LYRICS_CACHE_MAX_KEYS = int(os.environ.get('LYRICS_CACHE_MAX_KEYS', '500'))
+LYRICS_CACHE_TTL_SECONDS = float(os.environ.get('LYRICS_CACHE_TTL_SECONDS', str(24 * 3600)))
+# USD per 1000 tokens, for the cost-saved estimate (gpt-4o list prices)
+LLM_INPUT_COST_PER_1K_TOKENS = float(os.environ.get('LLM_INPUT_COST_PER_1K_TOKENS', '0.0025'))
+LLM_OUTPUT_COST_PER_1K_TOKENS = float(os.environ.get('LLM_OUTPUT_COST_PER_1K_TOKENS', '0.01'))
+
+# Rough size of an English token, for estimates only
+CHARS_PER_TOKEN = 4
+
+
+class _Entry:
+    __slots__ = ("variations", "expires_at", "next")
+
+    def __init__(self, ttl_seconds):
+        self.variations = []
+        self.expires_at = time.monotonic() + ttl_seconds
+        self.next = 0
+
+
+class LyricsCache:
+    def __init__(self, variations=LYRICS_CACHE_VARIATIONS, max_keys=LYRICS_CACHE_MAX_KEYS,
+                 ttl_seconds=LYRICS_CACHE_TTL_SECONDS):
+        self.variations = variations
+        self.max_keys = max_keys
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "bypassed": 0,
+            "evictions": 0,
+            "tokens_saved": 0,
+        }
+        self._cost_saved = 0.0
+
+    @property
+    def enabled(self):
+        return self.variations > 0 and self.max_keys > 0 and self.ttl_seconds > 0
+
+    @staticmethod
+    def key(prompt, model=""):
+        return hashlib.sha256(f"{model}\n{prompt.strip()}".encode("utf-8")).hexdigest()
+
+    def _entry(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() >= entry.expires_at:
+            del self._entries[key]
+            return None
+        return entry
+
+    def _serve(self, key):
+        """A cached variation, once the key has all of its variations"""
+        entry = self._entry(key)
+        if entry is None or len(entry.variations) < self.variations:
+            return None
+        self._entries.move_to_end(key)
+        lyrics = entry.variations[entry.next % len(entry.variations)]
+        entry.next += 1
+        return lyrics
+
+    def _saved(self, prompt, lyrics):
+        input_tokens = len(prompt) // CHARS_PER_TOKEN
+        output_tokens = len(lyrics) // CHARS_PER_TOKEN
+        self.stats["tokens_saved"] += input_tokens + output_tokens
+        self._cost_saved += (
+            input_tokens * LLM_INPUT_COST_PER_1K_TOKENS + output_tokens * LLM_OUTPUT_COST_PER_1K_TOKENS
+        ) / 1000
+
+    def store(self, key, lyrics):
+        if not self.enabled or not lyrics:
+            return
+        entry = self._entry(key)
+        if entry is None:
+            entry = self._entries[key] = _Entry(self.ttl_seconds)
+        self._entries.move_to_end(key)
+        if lyrics in entry.variations:
+            return
+        entry.variations.append(lyrics)
+        # A fresh take on a full key replaces its oldest variation
+        del entry.variations[:-self.variations]
+        while len(self._entries) > self.max_keys:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    async def lookup(self, key, prompt):
+        """Cached lyrics for `key`, or the result of the generation already running for it; None if neither"""
+        if not self.enabled:
+            return None
+        lyrics = self._serve(key)
+        if lyrics is not None:
+            self.stats["hits"] += 1
+            self._saved(prompt, lyrics)
+            return lyrics
+        pending = self._inflight.get(key)
+        if pending is not None:
+            try:
+                lyrics = await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                # The request we joined went away before finishing; generate after all
+                return None
+            self.stats["coalesced"] += 1
+            self._saved(prompt, lyrics)
+            return lyrics
+        return None
+
+    def takes(self, key, prompt, count):
+        """`count` different cached takes for `key` (a batch request), or None if it has fewer"""
+        if not self.enabled:
+            return None
+        entry = self._entry(key)
+        if entry is None or len(entry.variations) < count:
+            return None
+        self._entries.move_to_end(key)
+        start = entry.next
+        entry.next += count
+        takes = [entry.variations[(start + i) % len(entry.variations)] for i in range(count)]
+        self.stats["hits"] += 1
+        for lyrics in takes:
+            self._saved(prompt, lyrics)
+        return takes
+
+    def claim(self, key, fresh=False):
+        """Start generating for `key`; identical requests coalesce onto the returned future until it resolves"""
+        self.stats["bypassed" if fresh else "misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        if not fresh:
+            self._inflight[key] = future
+        return future
+
+    def resolve(self, key, future, lyrics):
+        self.store(key, lyrics)
+        self._settle(key, future, lyrics)
+
+    def abandon(self, key, future, error):
+        self._settle(key, future, error=error)
+
+    def _settle(self, key, future, lyrics=None, error=None):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        if future.done():
+            return
+        if error is None:
+            future.set_result(lyrics)
+        elif isinstance(error, (asyncio.CancelledError, GeneratorExit)):
+            future.cancel()
+        else:
+            future.set_exception(error)
+            # Only waiting requests need the error; don't warn when there were none
+            future.exception()
+
+    async def get_or_generate(self, prompt, generate, fresh=False, model=""):
+        """Lyrics for `prompt`: cached, shared with an identical request in flight, or from `generate()`"""
+        key = self.key(prompt, model)
+        if not fresh:
+            lyrics = await self.lookup(key, prompt)
+            if lyrics is not None:
+                return lyrics
+        future = self.claim(key, fresh)
+        try:
+            lyrics = await generate()
+        except BaseException as e:
+            self.abandon(key, future, e)
+            raise
+        self.resolve(key, future, lyrics)
+        return lyrics
+
+    def clear(self):
+        self._entries.clear()
+
+    def metrics(self):
+        requests = self.stats["hits"] + self.stats["coalesced"] + self.stats["misses"]
+        return {
+            "keys": len(self._entries),
+            "variations": sum(len(entry.variations) for entry in self._entries.values()),
+            "variations_per_key": self.variations,
+            "in_flight": len(self._inflight),
+            "hit_rate": round((self.stats["hits"] + self.stats["coalesced"]) / requests, 4) if requests else None,
+            **self.stats,
+            "estimated_cost_saved_usd": round(self._cost_saved, 4),
+        }
+
+
+lyrics_cache = LyricsCache()
@@ -0,0 +1,161 @@
+"""
+Lyrics download documents rendered in memory.
+
+Projects carry a `lyrics_revision` counter that is bumped whenever their
+lyrics are rewritten. Rendered documents are cached per (project, revision,
+format, header fields) and served with an ETag derived from that key, so
+repeat downloads are answered from memory or with a 304.
+"""
+import re
+import json
+import hashlib
+from collections import OrderedDict
+
+from starlette.responses import Response
+
+from services.http_cache import make_etag, is_not_modified, not_modified_response, content_disposition
+
+LYRICS_FORMATS = {
+    "txt": ("text/plain; charset=utf-8", "txt"),
+    "json": ("application/json", "json"),
+    "lrc": ("text/plain; charset=utf-8", "lrc"),
+}
+
+MAX_CACHED_DOCUMENTS = 512
+
+# Line spacing used for LRC timings when the beat's duration/tempo is unknown
+DEFAULT_SECONDS_PER_LINE = 4.0
+
+_SECTION_PATTERN = re.compile(
+    r"^(\[[^\]]+\]|\((intro|verse|pre-chorus|chorus|hook|bridge|outro|refrain)[^)]*\)"
+    r"|(intro|verse|pre-chorus|chorus|hook|bridge|outro|refrain)(\s*\d+)?\s*:?)$",
+    re.IGNORECASE,
+)
+
+
+def split_sections(lyrics):
+    """Group lyric lines under their section headings ([Verse 1], Chorus:, ...)"""
+    sections = []
+    current = {"name": None, "lines": []}
+    for raw_line in lyrics.splitlines():
+        line = raw_line.strip()
+        if not line:
+            continue
+        if _SECTION_PATTERN.match(line):
+            if current["name"] or current["lines"]:
+                sections.append(current)
+            current = {"name": line.strip("[]():").strip(), "lines": []}
+        else:
+            current["lines"].append(line)
+    if current["name"] or current["lines"]:
+        sections.append(current)
+    return sections
+
+
+def render_txt(project):
+    return (
+        f"Lyrics for {project['name']}\n"
+        f"Style: {project.get('style', 'Unknown')}\n"
+        + "=" * 40 + "\n\n"
+        + project["lyrics"]
+    )
+
+
+def render_json(project):
+    return json.dumps({
+        "title": project["name"],
+        "style": project.get("style"),
+        "revision": project.get("lyrics_revision", 0),
+        "sections": split_sections(project["lyrics"]),
+        "lyrics": project["lyrics"],
+    }, ensure_ascii=False, indent=2)
+
+
+def _timing_source(project):
+    """Track duration and tempo used to estimate LRC timings"""
+    duration = (project.get("analysis") or {}).get("duration_seconds") \
+        or (project.get("original_metadata") or {}).get("duration_seconds")
+    return duration, (project.get("analysis") or {}).get("tempo_bpm")
+
+
+def _seconds_per_line(project, line_count):
+    """Spread the lines over the track if its length is known, else two bars per line at its tempo"""
+    duration, tempo = _timing_source(project)
+    if duration and line_count:
+        return duration / line_count
+    if tempo:
+        return 8 * 60.0 / tempo
+    return DEFAULT_SECONDS_PER_LINE
+
+
+def _lrc_timestamp(seconds):
+    minutes, seconds = divmod(seconds, 60)
+    return f"[{int(minutes):02d}:{seconds:05.2f}]"
+
+
+def render_lrc(project):
+    """LRC-style timed text; timings are estimated since lyrics are not aligned to the audio"""
+    sections = split_sections(project["lyrics"])
+    lines = [line for section in sections for line in section["lines"]]
+    step = _seconds_per_line(project, len(lines))
+
+    output = [f"[ti:{project['name']}]"]
+    if project.get("style"):
+        output.append(f"[re:{project['style']}]")
+    position = 0.0
+    for section in sections:
+        if section["name"]:
+            output.append(f"{_lrc_timestamp(position)}[{section['name']}]")
+        for line in section["lines"]:
+            output.append(f"{_lrc_timestamp(position)}{line}")
+            position += step
+    return "\n".join(output) + "\n"
+
+
+class LyricsDocumentCache:
+    """
+    Renders and caches lyrics downloads.
+    `renderers` overrides render(project) -> str per format; `header_fields` are
+    the project fields besides the lyrics that appear in the documents.
+    """
+
+    def __init__(self, renderers=None, header_fields=("name", "style"), max_entries=MAX_CACHED_DOCUMENTS):
+        self.renderers = {"txt": render_txt, "json": render_json, "lrc": render_lrc}
+        self.renderers.update(renderers or {})
+        self.header_fields = header_fields
+        self.max_entries = max_entries
+        self._documents = OrderedDict()
+
+    def _key(self, project, fmt):
+        # The header fields are part of the document, so e.g. a rename re-renders it
+        header = "\0".join(str(project.get(field)) for field in self.header_fields)
+        if fmt == "lrc":
+            header += f"\0{_timing_source(project)}"
+        fingerprint = hashlib.sha256(header.encode()).hexdigest()[:12]
+        return f"{project['id']}-r{project.get('lyrics_revision', 0)}-{fmt}-{fingerprint}"
+
+    def render(self, project, fmt):
+        """Return (body bytes, etag) for a project's lyrics in the given format"""
+        key = self._key(project, fmt)
+        body = self._documents.get(key)
+        if body is None:
+            body = self.renderers[fmt](project).encode("utf-8")
+            self._documents[key] = body
+            while len(self._documents) > self.max_entries:
+                self._documents.popitem(last=False)
+        else:
+            self._documents.move_to_end(key)
+        return body, make_etag(key)
+
+    def response(self, request, project, fmt, download_name):
+        """Download response for the lyrics document (or 304 if the client has it)"""
+        media_type, extension = LYRICS_FORMATS[fmt]
+        body, etag = self.render(project, fmt)
+        headers = {
+            "ETag": etag,
+            "Cache-Control": "private, no-cache",
+            "Content-Disposition": content_disposition(f"{download_name}.{extension}"),
+        }
+        if is_not_modified(request.headers, etag):
+            return not_modified_response(headers)
+        return Response(content=body, media_type=media_type, headers=headers)
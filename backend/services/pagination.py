@@ -0,0 +1,127 @@
+"""
+Keyset (cursor) pagination for listings.
+
+Pages are ordered by (sort field, id) and the next page starts strictly
+after the last document of the previous one, so every page is an index
+range scan on the compound (field, id) indexes: latency does not grow with
+the page number or the collection size, and documents inserted meanwhile
+never shift pages. The cursor is an opaque token holding the sort field,
+order and the last (value, id) seen.
+
+Listings can also be narrowed to a subset of fields, pushed down to Mongo
+as a projection so unused fields (lyrics, file lists) are never read or sent.
+"""
+import json
+import base64
+from datetime import datetime
+
+from pymongo import ASCENDING, DESCENDING
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+TOTAL_COUNT_HEADER = "X-Total-Count"
+
+# BSON orders strings before dates. Older documents stored timestamps as ISO
+# strings, so when a page ends in one type bracket the rest of the other
+# bracket still follows it.
+_FOLLOWING_TYPE = {("desc", "date"): "string", ("asc", "string"): "date"}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class InvalidFields(ValueError):
+    pass
+
+
+def field_projection(fields, allowed, required=("id",)):
+    """
+    Mongo projection including only `fields` (a comma-separated string or a list of names) plus `required`.
+    Raises InvalidFields for names not in `allowed`.
+    """
+    if isinstance(fields, str):
+        fields = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = sorted(set(fields) - set(allowed))
+    if unknown:
+        raise InvalidFields(f"Unknown field(s): {', '.join(unknown)}")
+    projection = {"_id": 0}
+    for name in list(required) + list(fields):
+        projection[name] = 1
+    return projection
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and "$date" in value:
+        return datetime.fromisoformat(value["$date"])
+    return value
+
+
+def encode_cursor(sort_by, order, value, doc_id):
+    payload = json.dumps({"s": sort_by, "o": order, "v": _encode_value(value), "id": doc_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, sort_by, order):
+    """(value, id) from a cursor; raises InvalidCursor if it is malformed or was issued for another ordering"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        value, doc_id = _decode_value(payload["v"]), payload["id"]
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor("Malformed cursor")
+    if payload.get("s") != sort_by or payload.get("o") != order:
+        raise InvalidCursor("Cursor was issued for a different sort order")
+    return value, doc_id
+
+
+def after_filter(sort_by, order, value, doc_id):
+    """Filter matching documents that come strictly after (value, doc_id) in the given order"""
+    op = "$lt" if order == "desc" else "$gt"
+    clauses = [{sort_by: {op: value}}, {sort_by: value, "id": {op: doc_id}}]
+    following = _FOLLOWING_TYPE.get((order, "date" if isinstance(value, datetime) else "string"))
+    if following:
+        clauses.append({sort_by: {"$type": following}})
+    return {"$or": clauses}
+
+
+async def paginate(collection, sort_by, order="desc", limit=DEFAULT_PAGE_SIZE, after=None,
+                   query=None, include_total=False, projection=None):
+    """
+    One page of `collection` ordered by (sort_by, id).
+    Returns (documents, next cursor or None, total count or None); raises InvalidCursor.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = dict(query or {})
+    page_query = query
+    if after:
+        page_query = {"$and": [query, after_filter(sort_by, order, *decode_cursor(after, sort_by, order))]}
+
+    direction = DESCENDING if order == "desc" else ASCENDING
+    # One extra document tells whether there is a next page
+    docs = await collection.find(page_query, projection).sort(
+        [(sort_by, direction), ("id", direction)]
+    ).limit(limit + 1).to_list(limit + 1)
+
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        last = docs[-1]
+        next_cursor = encode_cursor(sort_by, order, last.get(sort_by), last.get("id"))
+
+    total = await collection.count_documents(query) if include_total else None
+    return docs, next_cursor, total
+
+
+def set_page_headers(response, next_cursor, total):
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    if total is not None:
+        response.headers[TOTAL_COUNT_HEADER] = str(total)
@@ -0,0 +1,153 @@
+"""
+Push notifications of project progress.
+
+Clients subscribe to a project with GET /api/projects/{id}/events (Server-Sent
+Events) instead of polling it. ProjectEventBus fans events out to every
+subscriber in this process:
+
+  job       a transform job changed status (queued, running, done, failed, ...)
+  progress  a running transform reached a stage (stem done, percent)
+  lyrics    lyrics were generated
+  project   the project's stored state changed
+
+`project` events come from the process's shared projects change stream
+(MONGO_CHANGE_STREAMS=true), so subscribers also see transforms and lyrics
+finished by other workers; the others are published where the work runs.
+Each subscriber has a bounded queue: a client that stops reading loses its
+oldest events rather than holding memory.
+"""
+import os
+import asyncio
+import itertools
+import json
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+PROJECT_EVENT_QUEUE_SIZE = int(os.environ.get('PROJECT_EVENT_QUEUE_SIZE', '100'))
+PROJECT_EVENT_KEEPALIVE_SECONDS = float(os.environ.get('PROJECT_EVENT_KEEPALIVE_SECONDS', '15'))
+
+# Stored project fields carried by `project` events
+PROJECT_STATE_FIELDS = (
+    "id", "transform_state", "transform_error", "transform_progress", "transformation_complete",
+    "original_file", "lyrics_revision", "style", "updated_at",
+)
+
+
+def project_state(project):
+    return {field: project.get(field) for field in PROJECT_STATE_FIELDS if field in project}
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def format_sse(event):
+    """One Server-Sent Events message"""
+    data = json.dumps(event, default=_json_default, separators=(",", ":"))
+    return f"id: {event['seq']}\nevent: {event['type']}\ndata: {data}\n\n"
+
+
+class Subscription:
+    def __init__(self, bus, project_id, maxsize):
+        self.bus = bus
+        self.project_id = project_id
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+    def put(self, event):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            self.bus.stats["dropped"] += 1
+        self.queue.put_nowait(event)
+
+    def close(self):
+        self.bus._unsubscribe(self)
+
+
+class ProjectEventBus:
+    def __init__(self, queue_size=PROJECT_EVENT_QUEUE_SIZE, keepalive_seconds=PROJECT_EVENT_KEEPALIVE_SECONDS):
+        self.queue_size = queue_size
+        self.keepalive_seconds = keepalive_seconds
+        self._subscribers = defaultdict(set)
+        self._sequence = itertools.count(1)
+        self._loop = None
+        self.stats = {"published": 0, "delivered": 0, "dropped": 0}
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+
+    def subscribe(self, project_id):
+        subscription = Subscription(self, project_id, self.queue_size)
+        self._subscribers[project_id].add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        subscribers = self._subscribers.get(subscription.project_id)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.project_id]
+
+    def event(self, project_id, event_type, **data):
+        return {
+            "seq": next(self._sequence),
+            "type": event_type,
+            "project_id": project_id,
+            "at": datetime.now(timezone.utc),
+            **data,
+        }
+
+    def publish(self, project_id, event_type, **data):
+        """Send an event to the project's subscribers in this process (call from the event loop)"""
+        self.stats["published"] += 1
+        subscribers = self._subscribers.get(project_id)
+        if not subscribers:
+            return
+        event = self.event(project_id, event_type, **data)
+        for subscription in list(subscribers):
+            subscription.put(event)
+            self.stats["delivered"] += 1
+
+    def publish_threadsafe(self, project_id, event_type, **data):
+        """publish() from a worker thread"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(lambda: self.publish(project_id, event_type, **data))
+
+    def attach(self, watcher):
+        """Publish `project` events for changes seen by `watcher` (the projects ChangeStreamWatcher)"""
+        watcher.subscribe(self.handle_change)
+
+    def handle_change(self, change):
+        project = change.get("fullDocument")
+        if project and project.get("id") in self._subscribers:
+            self.publish(project["id"], "project", project=project_state(project))
+
+    async def stream(self, subscription, request, initial=()):
+        """SSE body: the `initial` events, then the subscription's events, with keep-alive comments"""
+        try:
+            for event in initial:
+                yield format_sse(event)
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), self.keepalive_seconds)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_sse(event)
+        finally:
+            subscription.close()
+
+    def metrics(self):
+        return {
+            "subscribers": sum(len(subscribers) for subscribers in self._subscribers.values()),
+            "projects": len(self._subscribers),
+            **self.stats,
+        }
@@ -0,0 +1,277 @@
+"""
+Resumable chunked uploads.
+
+A client creates an upload session, PUTs chunks at byte offsets (in any
+order, retrying freely), polls which bytes have arrived and finalizes. Chunks
+are written in place into a sparse `.part` file; finalizing verifies the
+checksum and atomically renames it into place. Each chunk write is counted
+in the session's `writers` while it runs, and finalizing only claims a
+session without writers, so no chunk can change the file after it was
+hashed. Sessions expire after UPLOAD_SESSION_TTL_SECONDS of inactivity and
+are swept in the background.
+"""
+import os
+import asyncio
+import hashlib
+import logging
+import uuid
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+
+from pymongo import ReturnDocument
+from starlette.concurrency import run_in_threadpool
+
+from audio_processing.probe import PROBE_BYTES, probe_bytes_needed
+from services.uploads import (
+    UploadError, validate_header, build_metadata,
+    ALLOWED_CONTENT_TYPES, MAX_UPLOAD_BYTES, UPLOAD_CHUNK_SIZE
+)
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_SESSION_TTL_SECONDS = int(os.environ.get('UPLOAD_SESSION_TTL_SECONDS', str(24 * 3600)))
+UPLOAD_SESSION_SWEEP_SECONDS = int(os.environ.get('UPLOAD_SESSION_SWEEP_SECONDS', '300'))
+MAX_CHUNK_BYTES = int(os.environ.get('MAX_UPLOAD_CHUNK_BYTES', str(64 * 1024 * 1024)))
+RECOMMENDED_CHUNK_BYTES = 8 * 1024 * 1024
+
+SESSIONS_DIRNAME = ".upload_sessions"
+
+
+def sessions_dir(upload_dir):
+    path = Path(upload_dir) / SESSIONS_DIRNAME
+    path.mkdir(exist_ok=True)
+    return path
+
+
+def part_path(upload_dir, session_id):
+    return sessions_dir(upload_dir) / f"{session_id}.part"
+
+
+def merge_ranges(ranges):
+    """Merge [start, end) byte ranges into a sorted, non-overlapping list"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def missing_ranges(received, total_size):
+    """Byte ranges still missing, given merged received ranges"""
+    missing = []
+    cursor = 0
+    for start, end in received:
+        if start > cursor:
+            missing.append([cursor, start])
+        cursor = max(cursor, end)
+    if cursor < total_size:
+        missing.append([cursor, total_size])
+    return missing
+
+
+def session_status(session):
+    """Public view of a session document"""
+    received = merge_ranges(session.get("received", []))
+    received_bytes = sum(end - start for start, end in received)
+    return {
+        "id": session["id"],
+        "project_id": session["project_id"],
+        "status": session["status"],
+        "total_size": session["total_size"],
+        "received_bytes": received_bytes,
+        "received_ranges": received,
+        "missing_ranges": missing_ranges(received, session["total_size"]),
+        "chunk_size": RECOMMENDED_CHUNK_BYTES,
+        "expires_at": session["expires_at"],
+    }
+
+
+def _expiry():
+    return datetime.now(timezone.utc) + timedelta(seconds=UPLOAD_SESSION_TTL_SECONDS)
+
+
+async def create_session(db, upload_dir, project_id, filename, content_type, total_size, sha256=None):
+    """Open a new upload session and preallocate its sparse part file"""
+    if content_type not in ALLOWED_CONTENT_TYPES:
+        raise UploadError(400, "Invalid file type. Please upload audio files only.")
+    if total_size <= 0:
+        raise UploadError(400, "total_size must be positive.")
+    if total_size > MAX_UPLOAD_BYTES:
+        raise UploadError(413, f"File too large. Maximum size is {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.")
+
+    session = {
+        "id": str(uuid.uuid4()),
+        "project_id": project_id,
+        "filename": filename,
+        "content_type": content_type,
+        "total_size": total_size,
+        "sha256": sha256.lower() if sha256 else None,
+        "received": [],
+        # Chunk writes in progress
+        "writers": 0,
+        "status": "open",
+        "created_at": datetime.now(timezone.utc),
+        "expires_at": _expiry(),
+    }
+
+    def _allocate():
+        with open(part_path(upload_dir, session["id"]), "wb") as f:
+            f.truncate(total_size)
+
+    # Insert first so the sweeper never sees the part file without its session
+    await db.upload_sessions.insert_one(dict(session))
+    await run_in_threadpool(_allocate)
+    logger.info(f"Opened upload session {session['id']} for project {project_id} ({total_size} bytes)")
+    return session
+
+
+async def get_session(db, project_id, session_id):
+    session = await db.upload_sessions.find_one({"id": session_id, "project_id": project_id})
+    if not session:
+        raise UploadError(404, "Upload session not found or expired")
+    return session
+
+
+async def write_chunk(db, upload_dir, session, offset, stream):
+    """Write a streamed chunk at `offset`, returning the updated session"""
+    if session["status"] != "open":
+        raise UploadError(409, f"Upload session is {session['status']}")
+    if offset < 0 or offset >= session["total_size"]:
+        raise UploadError(416, "Chunk offset is outside the file")
+
+    # Register as a writer; finalize won't claim the session until every write has finished
+    claimed = await db.upload_sessions.find_one_and_update(
+        {"id": session["id"], "status": "open"},
+        {"$inc": {"writers": 1}}
+    )
+    if not claimed:
+        raise UploadError(409, "Upload session is no longer open")
+
+    position = offset
+    try:
+        path = part_path(upload_dir, session["id"])
+        fd = await run_in_threadpool(os.open, path, os.O_WRONLY)
+        try:
+            async for data in stream:
+                if not data:
+                    continue
+                if position + len(data) > session["total_size"]:
+                    raise UploadError(416, "Chunk extends past the declared total_size")
+                if position + len(data) - offset > MAX_CHUNK_BYTES:
+                    raise UploadError(413, f"Chunk too large. Maximum chunk is {MAX_CHUNK_BYTES // (1024 * 1024)} MB.")
+                await run_in_threadpool(os.pwrite, fd, data, position)
+                position += len(data)
+        finally:
+            await run_in_threadpool(os.close, fd)
+
+        if position == offset:
+            raise UploadError(400, "Empty chunk")
+    except BaseException:
+        await db.upload_sessions.update_one({"id": session["id"]}, {"$inc": {"writers": -1}})
+        raise
+
+    # $push is atomic, so concurrent chunk PUTs (even on other workers) never lose ranges
+    session = await db.upload_sessions.find_one_and_update(
+        {"id": session["id"]},
+        {
+            "$inc": {"writers": -1},
+            "$push": {"received": [offset, position]},
+            "$set": {"expires_at": _expiry()}
+        },
+        return_document=ReturnDocument.AFTER
+    )
+    if not session:
+        raise UploadError(409, "Upload session is no longer open")
+    return session
+
+
+def _hash_file(path):
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        head = f.read(PROBE_BYTES)
+        # Read further into files that start with a large ID3 tag
+        needed = probe_bytes_needed(head)
+        if needed > len(head):
+            head += f.read(needed - len(head))
+        hasher.update(head)
+        for block in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+            hasher.update(block)
+    return head, hasher.hexdigest()
+
+
+async def complete_session(db, upload_dir, session, store):
+    """
+    Verify a fully received session and atomically move it into the blob store.
+    Returns (filename, metadata) like save_upload.
+    """
+    received = merge_ranges(session.get("received", []))
+    if missing_ranges(received, session["total_size"]):
+        raise UploadError(409, "Upload is incomplete")
+
+    # Claim the session so two finalize calls can't race, and only once no chunk is still being written
+    # (sessions from older versions have no writers count)
+    claimed = await db.upload_sessions.find_one_and_update(
+        {"id": session["id"], "status": "open", "writers": {"$in": [0, None]}},
+        {"$set": {"status": "completing"}}
+    )
+    if not claimed:
+        raise UploadError(409, "Upload session is already being finalized or is still receiving chunks")
+
+    path = part_path(upload_dir, session["id"])
+    try:
+        head, digest = await run_in_threadpool(_hash_file, path)
+        if session.get("sha256") and digest != session["sha256"]:
+            raise UploadError(422, "Checksum mismatch: the assembled file does not match the declared sha256")
+
+        header = validate_header(head, session["total_size"])
+        filename = await run_in_threadpool(store.ingest, path, digest, f".{header['format']}")
+
+    except BaseException:
+        await db.upload_sessions.update_one({"id": session["id"]}, {"$set": {"status": "open"}})
+        raise
+
+    await db.upload_sessions.delete_one({"id": session["id"]})
+
+    metadata = build_metadata(header, session["total_size"], digest, session["content_type"], session["filename"])
+    logger.info(f"Completed upload session {session['id']} as {filename}")
+    return filename, metadata
+
+
+async def abort_session(db, upload_dir, session):
+    await db.upload_sessions.delete_one({"id": session["id"]})
+    await run_in_threadpool(part_path(upload_dir, session["id"]).unlink, True)
+
+
+async def expire_sessions(db, upload_dir):
+    """Delete expired sessions and any part files without a live session"""
+    now = datetime.now(timezone.utc)
+    expired = await db.upload_sessions.find({"expires_at": {"$lt": now}}, {"id": 1}).to_list(None)
+    if expired:
+        await db.upload_sessions.delete_many({"id": {"$in": [s["id"] for s in expired]}})
+
+    live = {s["id"] for s in await db.upload_sessions.find({}, {"id": 1}).to_list(None)}
+
+    def _sweep():
+        removed = 0
+        for part in sessions_dir(upload_dir).glob("*.part"):
+            if part.stem not in live:
+                part.unlink(missing_ok=True)
+                removed += 1
+        return removed
+
+    removed = await run_in_threadpool(_sweep)
+    if removed:
+        logger.info(f"Expired {removed} partial upload(s)")
+    return removed
+
+
+async def run_session_sweeper(db, upload_dir):
+    """Background loop expiring abandoned upload sessions"""
+    while True:
+        try:
+            await expire_sessions(db, upload_dir)
+        except Exception as e:
+            logger.error(f"Error sweeping upload sessions: {str(e)}")
+        await asyncio.sleep(UPLOAD_SESSION_SWEEP_SECONDS)
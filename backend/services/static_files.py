@@ -0,0 +1,243 @@
+"""
+Serving files from the uploads directory with validators and byte ranges.
+
+Files get a strong ETag derived from their content hash (cached per
+inode/size/mtime so it is only computed once per file version), honour
+If-None-Match / If-Modified-Since, and serve single `Range` requests as
+206 partial content. When the ASGI server offers the zero-copy send
+extension the body is handed over as a file descriptor, otherwise it is
+streamed in chunks from a worker thread.
+
+Blobs kept only in remote storage are redirected to a presigned URL, or
+proxied with ranged reads when the driver does not redirect downloads.
+"""
+import os
+import hashlib
+import mimetypes
+import threading
+from collections import OrderedDict
+
+import anyio
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response, RedirectResponse, StreamingResponse
+
+from services.http_cache import make_etag, is_not_modified, not_modified_response, http_date, content_disposition
+from services.blob_store import parse_blob_name
+
+FILE_CHUNK_SIZE = 256 * 1024
+MAX_CACHED_DIGESTS = 4096
+
+# Versioned URLs (?v=<etag>) never change, so they can be cached for a year
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+mimetypes.add_type("application/vnd.recordare.musicxml+xml", ".musicxml")
+mimetypes.add_type("audio/midi", ".mid")
+
+_digests = OrderedDict()
+_digests_lock = threading.Lock()
+
+
+def content_digest(path):
+    """Return (sha256 hex digest, stat result) for a file, reusing the digest while the file is unchanged"""
+    stat = os.stat(path)
+    key = (str(path), stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    with _digests_lock:
+        digest = _digests.get(key)
+        if digest is not None:
+            _digests.move_to_end(key)
+            return digest, stat
+
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(block)
+    digest = hasher.hexdigest()
+
+    with _digests_lock:
+        _digests[key] = digest
+        while len(_digests) > MAX_CACHED_DIGESTS:
+            _digests.popitem(last=False)
+    return digest, stat
+
+
+def parse_range(range_header, size):
+    """
+    Parse a single `bytes=` range against a file size.
+    Returns (start, end) inclusive, None to serve the whole file (absent,
+    malformed or multi-range headers), or raises ValueError if unsatisfiable.
+    """
+    if not range_header or not range_header.startswith("bytes="):
+        return None
+    spec = range_header[len("bytes="):].strip()
+    if "," in spec or "-" not in spec:
+        return None
+
+    first, last = (part.strip() for part in spec.split("-", 1))
+    if not (first.isdigit() or first == "") or not (last.isdigit() or last == "") or first == last == "":
+        return None
+
+    if first == "":
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError("unsatisfiable suffix range")
+        return max(0, size - length), size - 1
+
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size:
+        raise ValueError("range starts past the end of the file")
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+class FileRangeResponse(Response):
+    """Send `length` bytes of a file starting at `offset`"""
+
+    def __init__(self, path, offset, length, status_code=200, headers=None, media_type=None):
+        self.path = path
+        self.offset = offset
+        self.length = length
+        headers = dict(headers or {})
+        headers["content-length"] = str(length)
+        super().__init__(content=None, status_code=status_code, headers=headers, media_type=media_type)
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope.get("method") == "HEAD" or self.length == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, "rb") as f:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": f.fileno(),
+                    "offset": self.offset,
+                    "count": self.length,
+                    "more_body": False,
+                })
+            return
+
+        async with await anyio.open_file(self.path, mode="rb") as f:
+            await f.seek(self.offset)
+            remaining = self.length
+            while remaining > 0:
+                chunk = await f.read(min(FILE_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                # File shrank underneath us; end the response rather than hang
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+async def file_response(request, path, immutable=False, media_type=None, digest=None):
+    """
+    Response for a GET of `path` with ETag/Last-Modified validators and Range support.
+    `immutable` marks content-addressed files (whose `digest` is already known); a
+    `?v=` query matching the ETag does the same. `media_type` defaults to a guess from the path.
+    """
+    if digest is None:
+        digest, stat = await run_in_threadpool(content_digest, path)
+    else:
+        stat = await run_in_threadpool(os.stat, path)
+    etag = make_etag(digest[:32])
+    if immutable or request.query_params.get("v") == digest[:32]:
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    else:
+        cache_control = REVALIDATE_CACHE_CONTROL
+
+    media_type = media_type or mimetypes.guess_type(str(path))[0] or "application/octet-stream"
+    headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(stat.st_mtime),
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+    }
+
+    if is_not_modified(request.headers, etag, stat.st_mtime):
+        return not_modified_response(headers)
+
+    size = stat.st_size
+    byte_range = None
+    if_range = (request.headers.get("if-range") or "").strip()
+    # A Range with a stale If-Range validator (ETag or date) gets the full, current file
+    if not if_range or if_range in (etag, headers["Last-Modified"]):
+        try:
+            byte_range = parse_range(request.headers.get("range"), size)
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+
+    if byte_range is None:
+        return FileRangeResponse(path, 0, size, headers=headers, media_type=media_type)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return FileRangeResponse(path, start, end - start + 1, status_code=206, headers=headers, media_type=media_type)
+
+
+async def remote_blob_response(request, driver, digest, media_type=None):
+    """Proxy a blob from remote storage with Range support; None if it is not stored there"""
+    size = await run_in_threadpool(driver.size, digest)
+    if size is None:
+        return None
+
+    etag = make_etag(digest[:32])
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL, "Accept-Ranges": "bytes"}
+    if is_not_modified(request.headers, etag):
+        return not_modified_response(headers)
+
+    start, end = 0, size - 1
+    status_code = 200
+    if_range = (request.headers.get("if-range") or "").strip()
+    if not if_range or if_range == etag:
+        try:
+            byte_range = parse_range(request.headers.get("range"), size)
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+        if byte_range is not None:
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        driver.read_range(digest, start, end - start + 1), status_code=status_code,
+        headers=headers, media_type=media_type or "application/octet-stream"
+    )
+
+
+async def stored_file_response(request, store, name, filename=None):
+    """
+    file_response for a name in the blob store (or a legacy upload); None if there is no such file.
+    `filename` makes it a download with that name.
+    """
+    path = store.resolve(name)
+    if path is None:
+        return None
+    blob = parse_blob_name(name)
+    if not await run_in_threadpool(path.is_file):
+        if not blob or not store.remote:
+            return None
+        if store.driver.redirect_downloads:
+            # Clients fetch straight from storage, which handles Range and caching itself
+            url = await run_in_threadpool(store.presigned_url, name, filename)
+            return RedirectResponse(url, status_code=307)
+        response = await remote_blob_response(request, store.driver, blob[0], mimetypes.guess_type(name)[0])
+    elif blob:
+        # Content-addressed: the name is the hash, so the bytes never change
+        response = await file_response(
+            request, path, immutable=True, media_type=mimetypes.guess_type(name)[0], digest=blob[0]
+        )
+    else:
+        response = await file_response(request, path)
+
+    if response is not None and filename:
+        response.headers["Content-Disposition"] = content_disposition(filename)
+    return response
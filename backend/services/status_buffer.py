@@ -0,0 +1,186 @@
+"""
+Write-behind batching for status checks.
+
+Uptime monitors and clients POST /status constantly, and one insert_one per
+call keeps a pooled connection busy for every request. StatusCheckBuffer
+queues the documents in memory and writes them with a single unordered
+insert_many once STATUS_BATCH_SIZE are waiting, or every STATUS_FLUSH_SECONDS,
+and flushes what is left on shutdown. A failed batch is
+put back and retried on the next flush; at most STATUS_MAX_PENDING documents
+are held, the oldest are dropped beyond that.
+
+Stored checks expire STATUS_CHECK_TTL_SECONDS after their timestamp (a TTL
+index, see db_indexes.py), and status_summary() aggregates them into counts
+per client and time bucket on the server.
+"""
+import os
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+
+from pymongo.errors import BulkWriteError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+STATUS_BATCH_SIZE = int(os.environ.get('STATUS_BATCH_SIZE', '100'))
+STATUS_FLUSH_SECONDS = float(os.environ.get('STATUS_FLUSH_SECONDS', '1'))
+STATUS_MAX_PENDING = int(os.environ.get('STATUS_MAX_PENDING', '10000'))
+STATUS_CHECK_TTL_SECONDS = int(os.environ.get('STATUS_CHECK_TTL_SECONDS', str(7 * 24 * 3600)))
+
+# $dateToString formats for the start of each summary bucket (UTC)
+STATUS_BUCKETS = {
+    "minute": ("%Y-%m-%dT%H:%M:00Z", timedelta(minutes=1)),
+    "hour": ("%Y-%m-%dT%H:00:00Z", timedelta(hours=1)),
+    "day": ("%Y-%m-%dT00:00:00Z", timedelta(days=1)),
+}
+STATUS_SUMMARY_MAX_BUCKETS = int(os.environ.get('STATUS_SUMMARY_MAX_BUCKETS', '1000'))
+
+
+class StatusCheckBuffer:
+    """Queues documents for `db[collection_name]` and inserts them in batches"""
+
+    def __init__(self, db, collection_name="status_checks", batch_size=STATUS_BATCH_SIZE,
+                 flush_seconds=STATUS_FLUSH_SECONDS, max_pending=STATUS_MAX_PENDING):
+        self.db = db
+        self.collection_name = collection_name
+        self.batch_size = max(1, batch_size)
+        self.flush_seconds = flush_seconds
+        self.max_pending = max(self.batch_size, max_pending)
+        self._pending = []
+        self._full = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task = None
+        self.stats = {"queued": 0, "written": 0, "batches": 0, "failed_batches": 0, "dropped": 0}
+
+    @property
+    def collection(self):
+        return self.db[self.collection_name]
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    async def write(self, doc):
+        """Queue a document for the flusher, or write it right away when the flusher isn't running"""
+        self.add(doc)
+        if not self.running:
+            await self.flush()
+
+    def add(self, doc):
+        self._pending.append(doc)
+        self.stats["queued"] += 1
+        self._trim()
+        if len(self._pending) >= self.batch_size:
+            self._full.set()
+
+    def _trim(self):
+        excess = len(self._pending) - self.max_pending
+        if excess > 0:
+            del self._pending[:excess]
+            self.stats["dropped"] += excess
+            logger.warning(f"Status check buffer full, dropped the {excess} oldest checks")
+
+    async def flush(self):
+        """Write everything queued so far; returns how many documents were written"""
+        async with self._lock:
+            written = 0
+            while self._pending:
+                batch = self._pending[:self.batch_size]
+                del self._pending[:self.batch_size]
+                try:
+                    await self.collection.insert_many(batch, ordered=False)
+                    written += len(batch)
+                except BulkWriteError as e:
+                    # Only duplicates (a retried batch that was partly written) fail here; the rest went in
+                    written += e.details.get("nInserted", 0)
+                    logger.warning(f"Status check batch partly rejected: {len(e.details.get('writeErrors', []))} errors")
+                except PyMongoError as e:
+                    self.stats["failed_batches"] += 1
+                    self._pending[:0] = batch
+                    self._trim()
+                    logger.error(f"Could not write {len(batch)} status checks, will retry: {str(e)}")
+                    break
+                self.stats["batches"] += 1
+            self.stats["written"] += written
+            return written
+
+    async def run(self):
+        """Flush on size or time until cancelled"""
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            await self.flush()
+
+    def start(self):
+        if not self.running:
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        """Stop the flusher and write what is still queued"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        written = await self.flush()
+        if written:
+            logger.info(f"Flushed {written} buffered status checks on shutdown")
+        if self._pending:
+            logger.error(f"{len(self._pending)} status checks could not be written before shutdown")
+
+    def metrics(self):
+        return {
+            "pending": len(self._pending),
+            "batch_size": self.batch_size,
+            "flush_seconds": self.flush_seconds,
+            "running": self.running,
+            **self.stats,
+        }
+
+
+def _utc(value):
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+async def status_summary(collection, bucket="hour", since=None, until=None, client_name=None):
+    """Status check counts per client and `bucket` between `since` (default: 24 buckets ago) and `until` (now)"""
+    bucket_format, bucket_size = STATUS_BUCKETS[bucket]
+    until = _utc(until) or datetime.now(timezone.utc)
+    since = _utc(since) or until - bucket_size * 24
+    if since >= until:
+        raise ValueError("'since' must be before 'until'")
+    match = {"timestamp": {"$gte": since, "$lt": until}}
+    if client_name is not None:
+        match["client_name"] = client_name
+
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {
+                "start": {"$dateToString": {"format": bucket_format, "date": "$timestamp"}},
+                "client_name": "$client_name",
+            },
+            "count": {"$sum": 1},
+            "last_seen": {"$max": "$timestamp"},
+        }},
+        {"$sort": {"_id.start": 1, "_id.client_name": 1}},
+        {"$limit": STATUS_SUMMARY_MAX_BUCKETS},
+    ]
+    rows = [
+        {
+            "start": row["_id"]["start"],
+            "client_name": row["_id"]["client_name"],
+            "count": row["count"],
+            "last_seen": row["last_seen"],
+        }
+        async for row in collection.aggregate(pipeline)
+    ]
+    return {"bucket": bucket, "since": since, "until": until, "rows": rows}
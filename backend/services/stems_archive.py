@@ -0,0 +1,242 @@
+"""
+Cached, streamed stems ZIP archives.
+
+The archive for a set of stems is keyed by a manifest hash: the blob
+manifest digest for stored stems, or a hash of the names, sizes and mtimes
+for a legacy stems directory. The first request builds it off the event
+loop straight into the cache entry while streaming the bytes to the client
+as they are produced; concurrent requests for the same manifest tail the
+same build instead of starting their own. Later requests are served from
+the cached file with an ETag.
+"""
+import os
+import asyncio
+import hashlib
+import logging
+import zipfile
+from pathlib import Path
+
+from starlette.concurrency import run_in_threadpool
+from starlette.exceptions import HTTPException
+from starlette.responses import FileResponse, StreamingResponse
+
+from services.http_cache import make_etag, is_not_modified, not_modified_response, content_disposition
+from services.blob_store import BlobNotFound
+
+logger = logging.getLogger(__name__)
+
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+def directory_entries(stems_dir):
+    """([(file name, path)], manifest hash) for a stems directory; the hash changes whenever any file does"""
+    hasher = hashlib.sha256()
+    entries = []
+    for path in sorted(Path(stems_dir).iterdir()):
+        if path.is_file():
+            stat = path.stat()
+            hasher.update(f"{path.name}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+            entries.append((path.name, path))
+    return entries, hasher.hexdigest()
+
+
+def project_stem_entries(store, project):
+    """
+    ([(file name, path)], manifest hash) for a project's stems, or None if it has none on disk.
+    Stems are a blob manifest; projects transformed by older versions have a stems directory.
+    """
+    if project.get("stems_manifest"):
+        try:
+            return store.manifest_entries(project["stems_manifest"]), project["stems_tree"]
+        except BlobNotFound:
+            return None
+    stems_directory = project.get("stems_directory")
+    if stems_directory:
+        stems_dir = store.resolve(stems_directory)
+        if stems_dir is not None and stems_dir.is_dir():
+            return directory_entries(stems_dir)
+    return None
+
+
+class _ArchiveWriter:
+    """
+    Append-only file wrapper handed to ZipFile.
+    It has tell() but no seek(), so ZipFile writes data descriptors instead of
+    seeking back to patch headers - bytes already streamed never change.
+    """
+
+    def __init__(self, fp, on_progress):
+        self.fp = fp
+        self.position = 0
+        self.flushed = 0
+        self.on_progress = on_progress
+
+    def write(self, data):
+        self.fp.write(data)
+        self.position += len(data)
+        if self.position - self.flushed >= STREAM_CHUNK_BYTES:
+            self.flush()
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        self.fp.flush()
+        self.flushed = self.position
+        self.on_progress(self.position)
+
+
+class _ArchiveBuild:
+    """One in-flight archive build that any number of responses can tail"""
+
+    def __init__(self, entries, partial_path, final_path):
+        self.entries = entries
+        self.partial_path = partial_path
+        self.final_path = final_path
+        self.size = 0
+        self.done = False
+        self.error = None
+        self.changed = asyncio.Condition()
+        # Set once the partial file exists (or creating it failed), so joining requests can open it
+        self.opened = asyncio.Event()
+        self.loop = asyncio.get_running_loop()
+        self.task = None
+
+    def _progress(self, size):
+        # Called from the worker thread
+        self.loop.call_soon_threadsafe(lambda: asyncio.ensure_future(self._notify(size)))
+
+    async def _notify(self, size):
+        async with self.changed:
+            self.size = max(self.size, size)
+            self.changed.notify_all()
+
+    def _write_archive(self, fp):
+        with fp:
+            writer = _ArchiveWriter(fp, self._progress)
+            with zipfile.ZipFile(writer, "w", zipfile.ZIP_DEFLATED) as zipf:
+                for name, file_path in self.entries:
+                    zipf.write(file_path, name)
+            writer.flush()
+            os.fsync(fp.fileno())
+        return writer.position
+
+    async def run(self, fp):
+        try:
+            size = await run_in_threadpool(self._write_archive, fp)
+            await run_in_threadpool(os.replace, self.partial_path, self.final_path)
+            async with self.changed:
+                self.size = size
+                self.done = True
+                self.changed.notify_all()
+        except Exception as e:
+            logger.error(f"Error building stems archive {self.final_path.name}: {str(e)}")
+            self.partial_path.unlink(missing_ok=True)
+            async with self.changed:
+                self.error = e
+                self.done = True
+                self.changed.notify_all()
+
+    async def stream(self, fp):
+        """Yield the archive bytes from an already-open handle as the build produces them"""
+        offset = 0
+        try:
+            while True:
+                async with self.changed:
+                    await self.changed.wait_for(lambda: self.size > offset or self.done)
+                    available, done, error = self.size, self.done, self.error
+                if error is not None:
+                    raise error
+                while offset < available:
+                    data = await run_in_threadpool(fp.read, min(STREAM_CHUNK_BYTES, available - offset))
+                    if not data:
+                        break
+                    offset += len(data)
+                    yield data
+                if done and offset >= available:
+                    break
+        finally:
+            await run_in_threadpool(fp.close)
+
+
+class StemsArchiveCache:
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._builds = {}
+
+    def _paths(self, project_id, digest):
+        final_path = self.cache_dir / f"{project_id}-{digest}.zip"
+        return final_path, final_path.with_suffix(".zip.partial")
+
+    async def response(self, request, project_id, entries, manifest_hash, download_name):
+        """
+        Response for GET .../download-stems: 304, cached file, or a streamed build.
+        `entries` are the (file name, path) pairs to archive, identified by `manifest_hash`.
+        """
+        digest = manifest_hash[:32]
+        etag = make_etag(digest)
+        headers = {
+            "ETag": etag,
+            "Cache-Control": "private, no-cache",
+            "Content-Disposition": content_disposition(download_name),
+        }
+
+        if is_not_modified(request.headers, etag):
+            return not_modified_response(headers)
+
+        final_path, partial_path = self._paths(project_id, digest)
+        if final_path.exists():
+            return FileResponse(final_path, media_type="application/zip", headers=headers)
+
+        key = (project_id, digest)
+        build = self._builds.get(key)
+        if build is None:
+            build = _ArchiveBuild(entries, partial_path, final_path)
+            self._builds[key] = build
+            try:
+                write_fp = await run_in_threadpool(open, partial_path, "wb")
+            except Exception as e:
+                self._builds.pop(key, None)
+                build.error = e
+                build.done = True
+                raise
+            finally:
+                build.opened.set()
+            build.task = asyncio.create_task(self._run_build(key, build, write_fp))
+        else:
+            await build.opened.wait()
+
+        try:
+            fp = await run_in_threadpool(_open_archive, partial_path, final_path)
+        except FileNotFoundError:
+            # The build we joined already failed and removed its partial file
+            raise HTTPException(
+                status_code=503,
+                detail=f"Could not build the stems archive: {build.error or 'archive file missing'}",
+                headers={"Retry-After": "5"},
+            )
+        return StreamingResponse(build.stream(fp), media_type="application/zip", headers=headers)
+
+    async def _run_build(self, key, build, fp):
+        try:
+            await build.run(fp)
+        finally:
+            self._builds.pop(key, None)
+        if build.error is None:
+            await run_in_threadpool(self._drop_stale, key[0], build.final_path)
+            logger.info(f"Cached stems archive {build.final_path.name} ({build.size} bytes)")
+
+    def _drop_stale(self, project_id, keep):
+        for path in self.cache_dir.glob(f"{project_id}-*.zip"):
+            if path != keep:
+                path.unlink(missing_ok=True)
+
+
+def _open_archive(partial_path, final_path):
+    """Open an in-flight archive for reading; it may have been renamed into place already"""
+    try:
+        return open(partial_path, "rb")
+    except FileNotFoundError:
+        return open(final_path, "rb")
@@ -0,0 +1,87 @@
+"""
+Online migration of ISO-string timestamps to native BSON datetimes.
+
+Older versions stored `created_at`, `updated_at` and similar fields as
+`isoformat()` strings, which sort as text, bracket separately from dates
+and had to be parsed on every read. migrate_timestamps() converts them in
+small batches while the app is serving. Each document is updated only if
+the field still holds the string that was read, so a concurrent write of a
+fresh datetime is never overwritten. It is idempotent: once nothing is
+left to convert it costs one indexed query per field.
+"""
+import os
+import logging
+from datetime import datetime, timezone
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_MIGRATION_BATCH_SIZE = int(os.environ.get('TIMESTAMP_MIGRATION_BATCH_SIZE', '500'))
+
+TIMESTAMP_FIELDS = {
+    "projects": ["created_at", "updated_at", "original_metadata.uploaded_at"],
+    "user_styles": ["created_at"],
+    "status_checks": ["timestamp"],
+}
+
+
+def parse_timestamp(value):
+    """Aware UTC datetime for an ISO 8601 string (naive strings are UTC); None if it isn't one"""
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (ValueError, AttributeError):
+        return None
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def _get_path(doc, path):
+    for key in path.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(key)
+    return doc
+
+
+async def migrate_field(collection, field, batch_size=TIMESTAMP_MIGRATION_BATCH_SIZE):
+    """Convert one field across a collection; returns the number of documents converted"""
+    converted = 0
+    unparseable = []
+    while True:
+        query = {field: {"$type": "string"}}
+        if unparseable:
+            query["_id"] = {"$nin": unparseable}
+        docs = await collection.find(query, {"_id": 1, field: 1}).limit(batch_size).to_list(batch_size)
+        if not docs:
+            break
+
+        updates = []
+        for doc in docs:
+            value = _get_path(doc, field)
+            parsed = parse_timestamp(value)
+            if parsed is None:
+                unparseable.append(doc["_id"])
+                continue
+            updates.append(UpdateOne({"_id": doc["_id"], field: value}, {"$set": {field: parsed}}))
+
+        if updates:
+            result = await collection.bulk_write(updates, ordered=False)
+            converted += result.modified_count
+
+    if unparseable:
+        logger.warning(f"{len(unparseable)} document(s) in {collection.name} have an unparseable {field}, left as is")
+    return converted
+
+
+async def migrate_timestamps(db, fields=TIMESTAMP_FIELDS, batch_size=TIMESTAMP_MIGRATION_BATCH_SIZE):
+    """Convert every string timestamp in `fields` ({collection: [field paths]}); returns {collection.field: count}"""
+    counts = {}
+    for name, paths in fields.items():
+        for path in paths:
+            converted = await migrate_field(db[name], path, batch_size)
+            counts[f"{name}.{path}"] = converted
+            if converted:
+                logger.info(f"Converted {converted} {name}.{path} timestamp(s) to native datetimes")
+    return counts
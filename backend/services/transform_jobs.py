@@ -0,0 +1,342 @@
+"""
+Background transform jobs.
+
+Transforms run on a small pool of worker tasks (the CPU work itself runs in
+the threadpool) fed by a priority queue. A project has at most one active
+job per source revision: a later /transform call attaches to it instead of
+starting another, and interactive requests jump ahead of speculative ones.
+Each job writes into its own staging directory whose files are only
+published (by the on_complete hook) if the job finishes without being
+cancelled. Once publishing has begun the job can no longer be cancelled, so
+its reported state always matches what was stored.
+
+Across processes, a job first claims the project's transform lease (see
+services/transform_lease.py). If another worker holds it, the job follows
+that transform instead of running a second one.
+
+Status changes and the converter's progress reports are published as
+`job` and `progress` events on the project event bus.
+"""
+import os
+import asyncio
+import itertools
+import logging
+import shutil
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pathlib import Path
+
+from starlette.concurrency import run_in_threadpool
+
+from services.transform_lease import transform_result, STATE_IDLE, STATE_FAILED
+
+logger = logging.getLogger(__name__)
+
+TRANSFORM_WORKERS = int(os.environ.get('TRANSFORM_WORKERS', '1'))
+SPECULATIVE_TRANSFORM = os.environ.get('SPECULATIVE_TRANSFORM', 'false').lower() == 'true'
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_SPECULATIVE = 10
+
+# Finished jobs kept in memory so late /transform calls can attach to them
+MAX_FINISHED_JOBS = 1000
+
+ACTIVE_STATES = ("queued", "running")
+
+
+class TransformCancelled(Exception):
+    pass
+
+
+class TransformJob:
+    def __init__(self, project_id, source_path, revision, resampled_cache=None, speculative=False):
+        self.id = str(uuid.uuid4())
+        self.project_id = project_id
+        self.source_path = str(source_path)
+        self.revision = revision
+        self.resampled_cache = resampled_cache
+        self.speculative = speculative
+        self.priority = PRIORITY_SPECULATIVE if speculative else PRIORITY_INTERACTIVE
+        self.status = "queued"
+        # Lease owner whose transform this job follows, if another worker is running it
+        self.attached_to = None
+        # Last progress report of the running transform: {"stage", "percent", ...}
+        self.progress = None
+        # Set once on_complete starts storing the result; from then on the job can't be cancelled
+        self.publishing = False
+        self.result = None
+        self.error = None
+        self.created_at = datetime.now(timezone.utc)
+        self.finished_at = None
+        self.future = asyncio.get_running_loop().create_future()
+
+    @property
+    def active(self):
+        return self.status in ACTIVE_STATES
+
+    async def wait(self):
+        """Wait for the job without letting a disconnecting client cancel it"""
+        return await asyncio.shield(self.future)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "project_id": self.project_id,
+            "status": self.status,
+            "speculative": self.speculative,
+            "revision": self.revision,
+            "error": self.error,
+            "attached_to": self.attached_to,
+            "progress": self.progress,
+            "publishing": self.publishing,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class TransformJobManager:
+    """
+    Runs transforms in the background.
+    transform_fn(source_path, output_dir, resampled_cache=..., progress=...) does the work (in the threadpool);
+    on_complete(job, output_dir) publishes and persists a successful result; the
+    output directory is removed afterwards. With `leases` (a TransformLeases), jobs
+    claim their project before running and follow transforms owned by other workers.
+    `events` (a ProjectEventBus) receives job status and progress events.
+    """
+
+    def __init__(self, upload_dir, transform_fn, on_complete, workers=TRANSFORM_WORKERS, leases=None, events=None):
+        self.upload_dir = Path(upload_dir)
+        self.transform_fn = transform_fn
+        self.on_complete = on_complete
+        self.workers = workers
+        self.leases = leases
+        self.events = events
+        self._followers = set()
+        # Progress writes in flight (kept referenced so they aren't garbage collected)
+        self._progress_writes = set()
+        self._loop = None
+        self._jobs = OrderedDict()
+        self._queue = None
+        self._counter = itertools.count()
+        self._tasks = []
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.PriorityQueue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        tasks = self._tasks + list(self._followers)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._followers.clear()
+
+    def get(self, project_id):
+        return self._jobs.get(project_id)
+
+    def _publish(self, job):
+        if self.events:
+            self.events.publish(job.project_id, "job", job=job.to_dict())
+
+    def _report_progress(self, job, stage, percent, detail):
+        if job.status != "running":
+            return
+        job.progress = {"stage": stage, "percent": percent, **detail}
+        if self.events:
+            self.events.publish(job.project_id, "progress", job_id=job.id, **job.progress)
+        if self.leases:
+            task = asyncio.create_task(self.leases.report_progress(job.project_id, job.id, job.progress))
+            self._progress_writes.add(task)
+            task.add_done_callback(self._progress_writes.discard)
+
+    def _progress_callback(self, job):
+        """progress(stage, percent, **detail) for the converter, which calls it from its worker thread"""
+        def progress(stage, percent, **detail):
+            self._loop.call_soon_threadsafe(self._report_progress, job, stage, percent, detail)
+        return progress
+
+    def submit(self, project_id, source_path, revision, resampled_cache=None, speculative=False):
+        """Return the job for this project revision, queueing a new one if needed"""
+        existing = self._jobs.get(project_id)
+        if existing and existing.revision == revision and existing.status in ACTIVE_STATES + ("done",):
+            if not speculative and existing.speculative:
+                # Someone is now waiting on it: promote to interactive priority
+                existing.speculative = False
+                if existing.status == "queued" and existing.priority > PRIORITY_INTERACTIVE:
+                    existing.priority = PRIORITY_INTERACTIVE
+                    self._enqueue(existing)
+            return existing
+
+        if existing and existing.active:
+            self.cancel(project_id, "superseded by a newer transform")
+
+        job = TransformJob(project_id, source_path, revision, resampled_cache, speculative)
+        self._jobs[project_id] = job
+        self._jobs.move_to_end(project_id)
+        self._enqueue(job)
+        logger.info(f"Queued {'speculative ' if speculative else ''}transform {job.id} for project {project_id}")
+        self._publish(job)
+        return job
+
+    def cancel(self, project_id, reason="cancelled"):
+        """
+        Cancel the active job for a project; its artifacts are dropped. Returns the job, or None if
+        there is no active job or it is already publishing its result (which then completes).
+        """
+        job = self._jobs.get(project_id)
+        if not job or not job.active:
+            return None
+        if job.publishing:
+            logger.info(f"Not cancelling transform {job.id} for project {project_id} ({reason}): "
+                        f"its result is already being published")
+            return None
+
+        was_running = job.status == "running"
+        job.status = "cancelled"
+        job.error = reason
+        job.finished_at = datetime.now(timezone.utc)
+        if not job.future.done():
+            job.future.set_exception(TransformCancelled(reason))
+            # Nobody may be awaiting a speculative job; don't log "exception never retrieved"
+            job.future.exception()
+        logger.info(f"Cancelled transform {job.id} for project {project_id} ({reason})"
+                    + (", dropping its output when the worker finishes" if was_running else ""))
+        self._publish(job)
+        return job
+
+    def _enqueue(self, job):
+        # Re-prioritized jobs are queued again; stale entries are skipped by the worker
+        self._queue.put_nowait((job.priority, next(self._counter), job))
+
+    def _prune(self):
+        finished = [pid for pid, job in self._jobs.items() if not job.active]
+        for project_id in finished[:max(0, len(self._jobs) - MAX_FINISHED_JOBS)]:
+            del self._jobs[project_id]
+
+    async def _worker(self):
+        while True:
+            priority, _, job = await self._queue.get()
+            try:
+                if job.status != "queued" or priority != job.priority:
+                    continue
+                await self._run(job)
+            except Exception as e:
+                logger.error(f"Transform worker error: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def _finish(self, job, result):
+        job.result = result
+        job.status = "done"
+        job.finished_at = datetime.now(timezone.utc)
+        job.future.set_result(result)
+        self._publish(job)
+
+    def _fail(self, job, error):
+        job.status = "failed"
+        job.error = str(error)
+        job.finished_at = datetime.now(timezone.utc)
+        if not job.future.done():
+            job.future.set_exception(error)
+            job.future.exception()
+        self._publish(job)
+
+    async def _claim(self, job):
+        """Take the project's transform lease; if another worker holds it, follow that transform instead"""
+        try:
+            holder = await self.leases.claim(job.project_id, job.id, job.revision)
+        except Exception as e:
+            logger.error(f"Could not claim transform of project {job.project_id}: {str(e)}")
+            self._fail(job, e)
+            return False
+        if holder is None:
+            return True
+
+        job.status = "running"
+        job.attached_to = holder.get("owner")
+        logger.info(f"Transform {job.id} for project {job.project_id} attached to job {holder.get('job_id')} "
+                    f"running on {holder.get('owner')}")
+        self._publish(job)
+        # Waiting happens off the worker pool so other projects aren't held up
+        task = asyncio.create_task(self._follow(job, holder))
+        self._followers.add(task)
+        task.add_done_callback(self._followers.discard)
+        return False
+
+    async def _follow(self, job, holder):
+        try:
+            project = await self.leases.follow(job.project_id, holder, job.revision)
+        except Exception as e:
+            if job.status != "cancelled":
+                logger.error(f"Transform {job.id} for project {job.project_id} failed: {str(e)}")
+                self._fail(job, e)
+            return
+
+        if job.status == "cancelled":
+            return
+        if project is None:
+            # The other transform was abandoned or was for another file: claim the project ourselves
+            job.status = "queued"
+            job.attached_to = None
+            self._enqueue(job)
+            return
+        self._finish(job, transform_result(project))
+        logger.info(f"Transform {job.id} for project {job.project_id} completed by {holder.get('owner')}")
+
+    def _lease_lost(self, job):
+        if self._jobs.get(job.project_id) is job:
+            self.cancel(job.project_id, "transform lease taken over by another worker")
+
+    async def _run(self, job):
+        if self.leases and not await self._claim(job):
+            return
+
+        job.status = "running"
+        staging_dir = self.upload_dir / f".{job.project_id}_stems.{job.id}"
+        logger.info(f"Starting transform {job.id} for project {job.project_id}")
+        self._publish(job)
+        heartbeat = None
+        if self.leases:
+            heartbeat = asyncio.create_task(
+                self.leases.keep_alive(job.project_id, job.id, on_lost=lambda: self._lease_lost(job))
+            )
+
+        try:
+            await run_in_threadpool(staging_dir.mkdir, parents=True, exist_ok=True)
+            result = await run_in_threadpool(
+                self.transform_fn, job.source_path, str(staging_dir), resampled_cache=job.resampled_cache,
+                progress=self._progress_callback(job)
+            )
+
+            if job.status == "cancelled":
+                return
+            if not result.get("success"):
+                raise Exception(result.get("error", "Unknown error"))
+
+            job.result = result
+            job.publishing = True
+            await self.on_complete(job, staging_dir)
+            self._finish(job, result)
+            logger.info(f"Transform {job.id} for project {job.project_id} completed")
+
+        except Exception as e:
+            if job.status != "cancelled":
+                logger.error(f"Transform {job.id} for project {job.project_id} failed: {str(e)}")
+                self._fail(job, e)
+
+        finally:
+            if heartbeat:
+                heartbeat.cancel()
+            if self.leases and job.status != "done":
+                try:
+                    await self.leases.release(
+                        job.project_id, job.id, STATE_FAILED if job.status == "failed" else STATE_IDLE, job.error
+                    )
+                except Exception as e:
+                    logger.error(f"Could not release transform lease of project {job.project_id}: {str(e)}")
+            await run_in_threadpool(shutil.rmtree, staging_dir, True)
+            self._prune()
+
@@ -0,0 +1,236 @@
+"""
+Cross-process ownership of project transforms.
+
+TransformJobManager keeps one job per project within a process, but with
+several uvicorn workers (or servers) two requests for the same project can
+land in different processes and both write its stems. Before a transform
+runs, its worker claims the project with one atomic find_one_and_update that
+moves `transform_state` from idle/done/failed to "transforming" and records a
+lease (owner, job, revision, expiry). The owner renews the lease with a
+heartbeat while it works; if the worker dies the lease expires and the next
+request reclaims it. A request that finds a live lease held elsewhere follows
+that transform and shares its outcome, and a result is only written while
+its lease is still held.
+"""
+import os
+import asyncio
+import logging
+import socket
+import uuid
+from datetime import datetime, timezone, timedelta
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+TRANSFORM_LEASE_SECONDS = int(os.environ.get('TRANSFORM_LEASE_SECONDS', '120'))
+TRANSFORM_HEARTBEAT_SECONDS = int(os.environ.get('TRANSFORM_HEARTBEAT_SECONDS', '30'))
+TRANSFORM_LEASE_POLL_SECONDS = float(os.environ.get('TRANSFORM_LEASE_POLL_SECONDS', '2'))
+
+# Identifies this process as a lease owner
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+STATE_IDLE = "idle"
+STATE_TRANSFORMING = "transforming"
+STATE_DONE = "done"
+STATE_FAILED = "failed"
+
+
+class TransformLeaseError(Exception):
+    pass
+
+
+class TransformFailed(TransformLeaseError):
+    """The transform this request attached to failed"""
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _expired(lease, now=None):
+    expires_at = (lease or {}).get("expires_at")
+    if expires_at is None:
+        return True
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    return expires_at <= (now or _now())
+
+
+def transform_result(project):
+    """A transform result (as returned by the converter) rebuilt from a transformed project"""
+    return {
+        "success": True,
+        "main_midi": project.get("main_midi"),
+        "stem_midis": project.get("midi_files", []),
+        "musicxml_files": project.get("musicxml_files", []),
+        "stems_created": project.get("stems_created", []),
+    }
+
+
+class TransformLeases:
+    """
+    Transform state and leases stored on the documents of `db.projects`.
+    on_change(project_id) is called after each write to a project (e.g. to invalidate caches).
+    """
+
+    def __init__(self, db, owner=WORKER_ID, lease_seconds=TRANSFORM_LEASE_SECONDS,
+                 heartbeat_seconds=TRANSFORM_HEARTBEAT_SECONDS, poll_seconds=TRANSFORM_LEASE_POLL_SECONDS,
+                 on_change=None):
+        self.db = db
+        self.on_change = on_change or (lambda project_id: None)
+        self.owner = owner
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.poll_seconds = poll_seconds
+
+    @property
+    def collection(self):
+        return self.db.projects
+
+    def _held(self, project_id, job_id):
+        return {"id": project_id, "transform_state": STATE_TRANSFORMING, "transform_lease.job_id": job_id}
+
+    def _changed(self, project_id, result):
+        if result.matched_count == 1:
+            self.on_change(project_id)
+            return True
+        return False
+
+    async def claim(self, project_id, job_id, revision):
+        """
+        Take the project's transform for `job_id`. Returns None once claimed, or the live lease when
+        another worker holds it. Our own leases (a superseded job) and expired ones are taken over.
+        """
+        while True:
+            now = _now()
+            lease = {
+                "owner": self.owner,
+                "job_id": job_id,
+                "revision": revision,
+                "acquired_at": now,
+                "heartbeat_at": now,
+                "expires_at": now + timedelta(seconds=self.lease_seconds),
+            }
+            previous = await self.collection.find_one_and_update(
+                {
+                    "id": project_id,
+                    "$or": [
+                        {"transform_state": {"$ne": STATE_TRANSFORMING}},
+                        {"transform_lease.expires_at": {"$lte": now}},
+                        {"transform_lease.owner": self.owner},
+                    ],
+                },
+                {"$set": {
+                    "transform_state": STATE_TRANSFORMING,
+                    "transform_lease": lease,
+                    "transform_error": None,
+                    "transform_progress": None,
+                }},
+                projection={"_id": 0, "id": 1, "transform_state": 1, "transform_lease": 1},
+                return_document=ReturnDocument.BEFORE,
+            )
+            if previous is not None:
+                self.on_change(project_id)
+                held = previous.get("transform_lease") or {}
+                if previous.get("transform_state") == STATE_TRANSFORMING and held.get("owner") != self.owner:
+                    logger.warning(
+                        f"Reclaimed stale transform lease on project {project_id} from {held.get('owner')} "
+                        f"(job {held.get('job_id')})"
+                    )
+                return None
+
+            current = await self.collection.find_one(
+                {"id": project_id}, {"_id": 0, "transform_state": 1, "transform_lease": 1}
+            )
+            if current is None:
+                raise TransformLeaseError("Project not found")
+            # The holder may have finished between the two queries; if so, try again
+            if current.get("transform_state") == STATE_TRANSFORMING and not _expired(current.get("transform_lease")):
+                return current["transform_lease"]
+
+    async def heartbeat(self, project_id, job_id):
+        """Extend the lease; False if it is no longer held"""
+        now = _now()
+        result = await self.collection.update_one(
+            self._held(project_id, job_id),
+            {"$set": {
+                "transform_lease.heartbeat_at": now,
+                "transform_lease.expires_at": now + timedelta(seconds=self.lease_seconds),
+            }}
+        )
+        return self._changed(project_id, result)
+
+    async def report_progress(self, project_id, job_id, progress):
+        """Record how far the transform got, for clients watching from other processes"""
+        result = await self.collection.update_one(
+            self._held(project_id, job_id), {"$set": {"transform_progress": progress}}
+        )
+        return self._changed(project_id, result)
+
+    async def keep_alive(self, project_id, job_id, on_lost=None):
+        """Heartbeat until cancelled; calls on_lost() and returns if the lease is taken over"""
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            try:
+                held = await self.heartbeat(project_id, job_id)
+            except Exception as e:
+                # Keep trying: the lease only lapses after TRANSFORM_LEASE_SECONDS
+                logger.error(f"Transform lease heartbeat for project {project_id} failed: {str(e)}")
+                continue
+            if not held:
+                logger.warning(f"Transform lease for job {job_id} on project {project_id} was lost")
+                if on_lost:
+                    on_lost()
+                return
+
+    async def complete(self, project_id, job_id, fields):
+        """Write a finished transform's `fields` and mark it done, only while the lease is held; returns whether it was"""
+        result = await self.collection.update_one(
+            self._held(project_id, job_id),
+            {"$set": {
+                **fields,
+                "transform_state": STATE_DONE,
+                "transform_error": None,
+                "transform_lease.expires_at": None,
+            }}
+        )
+        return self._changed(project_id, result)
+
+    async def release(self, project_id, job_id, state=STATE_IDLE, error=None):
+        """Give up the lease, leaving the project idle or failed"""
+        result = await self.collection.update_one(
+            self._held(project_id, job_id),
+            {"$set": {"transform_state": state, "transform_error": error, "transform_lease.expires_at": None}}
+        )
+        return self._changed(project_id, result)
+
+    async def follow(self, project_id, lease, revision):
+        """
+        Wait for the transform holding `lease`. Returns the project once it is done with this `revision`,
+        or None when the project should be claimed again (the lease went stale, or it was for another file).
+        Raises TransformFailed if it failed on this revision.
+        """
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            project = await self.collection.find_one({"id": project_id}, {"_id": 0})
+            if project is None:
+                raise TransformLeaseError("Project not found")
+
+            current = project.get("transform_lease") or {}
+            if current.get("job_id") != lease.get("job_id"):
+                return None
+
+            state = project.get("transform_state")
+            if state == STATE_TRANSFORMING:
+                if _expired(current):
+                    logger.warning(f"Transform lease of {current.get('owner')} on project {project_id} went stale")
+                    return None
+                continue
+
+            if current.get("revision") == revision:
+                if state == STATE_DONE:
+                    return project
+                if state == STATE_FAILED:
+                    raise TransformFailed(project.get("transform_error") or "Transform failed")
+            return None
@@ -0,0 +1,462 @@
+"""
+Garbage collection and disk quota for the uploads directory.
+
+A background task periodically reconciles UPLOAD_DIR against the projects
+collection:
+
+- orphans (blobs no project references, files of projects that no longer
+  exist or that a project no longer references) and leftover temporaries
+  are removed once they are older than UPLOAD_GC_GRACE_SECONDS, so in-flight
+  uploads and transforms are never touched;
+- regenerable legacy artifacts (ZIPs and lyrics text files written into the
+  uploads directory by older versions) are removed;
+- when UPLOAD_DISK_QUOTA_BYTES is set and usage exceeds it, derived files
+  (stems, resampled caches, cached archives, transformed audio) are evicted
+  least recently used first, a project's stems as one unit. Blobs that are
+  some project's original are never evicted, and shared blobs are only
+  removed once nothing references them.
+
+With a remote blob storage driver the bucket holds every blob, so orphans
+are deleted there too (their age is the object's last modification, which
+storing the same content again refreshes) and the quota only governs local
+copies: they are offloaded least recently used first, originals included,
+and fetched again when next needed.
+
+Last use is taken from the file access time, so its granularity depends on
+the filesystem's atime mount option (relatime updates it about daily).
+"""
+import os
+import re
+import time
+import shutil
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+from datetime import datetime, timezone
+from pathlib import Path
+
+from starlette.concurrency import run_in_threadpool
+
+from services.blob_store import BLOBS_DIRNAME, parse_blob_name
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_GC_INTERVAL_SECONDS = int(os.environ.get('UPLOAD_GC_INTERVAL_SECONDS', '900'))
+UPLOAD_GC_GRACE_SECONDS = int(os.environ.get('UPLOAD_GC_GRACE_SECONDS', '3600'))
+UPLOAD_DISK_QUOTA_BYTES = int(os.environ.get('UPLOAD_DISK_QUOTA_BYTES', '0'))
+
+_PROJECT_FILE = re.compile(r"^(?P<pid>[0-9A-Za-z-]+)_(?P<kind>original\.\w+|transformed\.\w+|stems|22050\.npy)$")
+_LEGACY_ARTIFACT = re.compile(r"^.+_(stems\.zip|stems_package\.zip|lyrics\.txt)$")
+_UPLOADING = re.compile(r"^\..+\.uploading$")
+_STAGING = re.compile(r"^\.(?P<pid>[0-9A-Za-z-]+)_stems\.[0-9a-f-]+$")
+_TRASH = re.compile(r"^\..+\.old\.[0-9a-f]+$")
+_CACHED_ARCHIVE = re.compile(r"^(?P<pid>[0-9A-Za-z-]+)-[0-9a-f]+\.zip(?P<partial>\.partial)?$")
+
+KIND_CATEGORIES = {
+    "original": "original",
+    "transformed": "derived",
+    "stems": "derived",
+    "22050.npy": "derived",
+    "archive": "cache",
+    "blob": "derived",
+}
+
+# Project fields reset when its stems are evicted
+STEMS_RESET = {
+    "stems_directory": None, "stems_manifest": None, "stems_tree": None,
+    "midi_files": [], "musicxml_files": [], "main_midi": None, "stems_created": [],
+    "transformation_complete": False, "transform_revision": None,
+}
+
+# Directories managed elsewhere (resumable upload parts are expired by their own sweeper)
+SKIP_NAMES = {".upload_sessions", ".cache", BLOBS_DIRNAME}
+
+
+@dataclass
+class Entry:
+    path: Path
+    kind: str
+    project_id: str = None
+    size: int = 0
+    last_used: float = 0.0
+    modified: float = 0.0
+    digest: str = None
+
+    @property
+    def category(self):
+        return KIND_CATEGORIES.get(self.kind, "temporary" if self.kind in ("uploading", "staging", "trash", "partial") else "other")
+
+
+@dataclass
+class EvictionUnit:
+    label: str
+    category: str
+    size: int
+    last_used: float
+    evict: Callable[[], Awaitable[bool]]
+
+
+def _usage(path):
+    """(total bytes, last access, last modification) for a file or directory tree"""
+    stat = path.stat()
+    if not path.is_dir():
+        return stat.st_size, max(stat.st_atime, stat.st_mtime), stat.st_mtime
+    size, last_used, modified = 0, stat.st_mtime, stat.st_mtime
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                child = os.stat(os.path.join(root, name))
+            except FileNotFoundError:
+                continue
+            size += child.st_size
+            last_used = max(last_used, child.st_atime, child.st_mtime)
+            modified = max(modified, child.st_mtime)
+    return size, last_used, modified
+
+
+def _classify(name):
+    match = _PROJECT_FILE.match(name)
+    if match:
+        kind = match.group("kind")
+        if kind not in ("stems", "22050.npy"):
+            kind = kind.split(".")[0]
+        return kind, match.group("pid")
+    if _LEGACY_ARTIFACT.match(name):
+        return "legacy", None
+    if _UPLOADING.match(name):
+        return "uploading", None
+    match = _STAGING.match(name)
+    if match:
+        return "staging", match.group("pid")
+    if _TRASH.match(name):
+        return "trash", None
+    return "unknown", None
+
+
+def scan_uploads(upload_dir, cache_dirs=(), store=None):
+    """Inventory the uploads directory, the blob store and cached archive directories"""
+    entries = []
+    for path in Path(upload_dir).iterdir():
+        if path.name in SKIP_NAMES:
+            continue
+        kind, project_id = _classify(path.name)
+        try:
+            size, last_used, modified = _usage(path)
+        except FileNotFoundError:
+            continue
+        entries.append(Entry(path, kind, project_id, size, last_used, modified))
+
+    for cache_dir in cache_dirs:
+        if not Path(cache_dir).exists():
+            continue
+        for path in Path(cache_dir).iterdir():
+            match = _CACHED_ARCHIVE.match(path.name)
+            kind = "partial" if match and match.group("partial") else "archive" if match else "unknown"
+            try:
+                size, last_used, modified = _usage(path)
+            except FileNotFoundError:
+                continue
+            entries.append(Entry(path, kind, match.group("pid") if match else None, size, last_used, modified))
+
+    if store is not None:
+        for path in store.temp_dir.iterdir():
+            try:
+                size, last_used, modified = _usage(path)
+            except FileNotFoundError:
+                continue
+            entries.append(Entry(path, "uploading", None, size, last_used, modified))
+        for digest, path in store.iter_blobs():
+            try:
+                size, last_used, modified = _usage(path)
+            except FileNotFoundError:
+                continue
+            entries.append(Entry(path, "blob", None, size, last_used, modified, digest))
+    return entries
+
+
+def _remove(path):
+    if path.is_dir():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        path.unlink(missing_ok=True)
+
+
+class UploadsGarbageCollector:
+    """
+    Reconciles the uploads directory with the projects collection.
+    is_busy(project_id) reports projects with a transform in progress; their
+    derived files and staging directories are left alone. on_project_change(project_id)
+    is called after a project is unlinked from evicted files.
+    """
+
+    def __init__(self, db, upload_dir, store=None, cache_dirs=(), quota_bytes=UPLOAD_DISK_QUOTA_BYTES,
+                 grace_seconds=UPLOAD_GC_GRACE_SECONDS, is_busy=None, on_project_change=None):
+        self.db = db
+        self.upload_dir = Path(upload_dir)
+        self.store = store
+        self.cache_dirs = [Path(d) for d in cache_dirs]
+        self.quota_bytes = quota_bytes
+        self.grace_seconds = grace_seconds
+        self.is_busy = is_busy or (lambda project_id: False)
+        self.on_project_change = on_project_change or (lambda project_id: None)
+        self._lock = asyncio.Lock()
+        self.stats = {
+            "runs": 0,
+            "last_run_at": None,
+            "last_run_seconds": None,
+            "last_error": None,
+            "bytes_reclaimed_total": 0,
+            "files_removed_total": 0,
+            "orphans_removed_total": 0,
+            "evictions_total": 0,
+            "last_bytes_reclaimed": 0,
+            "usage_bytes": None,
+            "usage_by_category": {},
+            "remote_usage_bytes": None,
+        }
+
+    def metrics(self):
+        return {**self.stats, "quota_bytes": self.quota_bytes or None, "grace_seconds": self.grace_seconds}
+
+    async def _project_references(self):
+        """
+        Returns ({project id: referenced flat file names}, {blob digest: {(project id, role)}},
+        {(project id, role): reference value}) for every project.
+        """
+        projects = await self.db.projects.find(
+            {}, {"_id": 0, "id": 1, "original_file": 1, "transformed_file": 1, "stems_directory": 1,
+                 "stems_manifest": 1, "stems_tree": 1, "analysis.resampled_cache": 1}
+        ).to_list(None)
+        references, blob_refs, roles = {}, {}, {}
+        for project in projects:
+            project_id = project["id"]
+            files = {
+                "original": project.get("original_file"),
+                "transformed": project.get("transformed_file"),
+                "resampled": (project.get("analysis") or {}).get("resampled_cache"),
+            }
+            names = {project.get("stems_directory")}
+            for role, name in files.items():
+                blob = parse_blob_name(name) if name else None
+                if blob:
+                    blob_refs.setdefault(blob[0], set()).add((project_id, role))
+                    roles[(project_id, role)] = name
+                else:
+                    names.add(name)
+            if project.get("stems_manifest"):
+                for digest in project["stems_manifest"].values():
+                    blob_refs.setdefault(digest, set()).add((project_id, "stems"))
+                roles[(project_id, "stems")] = project.get("stems_tree")
+            references[project_id] = {name for name in names if name}
+        return references, blob_refs, roles
+
+    def _is_orphan(self, entry, references, blob_refs, now):
+        """Whether an entry is garbage (regardless of quota)"""
+        if now - entry.modified < self.grace_seconds:
+            return False
+        if entry.kind == "blob":
+            return entry.digest not in blob_refs
+        if entry.kind in ("legacy", "uploading", "trash", "partial"):
+            return True
+        if entry.kind == "staging":
+            return not self.is_busy(entry.project_id)
+        if entry.kind == "archive":
+            return entry.project_id not in references
+        if entry.project_id is None:
+            return False
+        if entry.project_id not in references:
+            return True
+        return entry.path.name not in references[entry.project_id] and not self.is_busy(entry.project_id)
+
+    async def _evict(self, entry):
+        """Drop a derived flat-layout entry, unlinking it from its project first; False if it is in use"""
+        if self.is_busy(entry.project_id):
+            return False
+        name = entry.path.name
+        if entry.kind == "stems":
+            result = await self.db.projects.update_one(
+                {"id": entry.project_id, "stems_directory": name}, {"$set": STEMS_RESET}
+            )
+            if result.matched_count == 0:
+                return False
+        elif entry.kind == "transformed":
+            await self.db.projects.update_one(
+                {"id": entry.project_id, "transformed_file": name}, {"$set": {"transformed_file": None}}
+            )
+        elif entry.kind == "22050.npy":
+            await self.db.projects.update_one(
+                {"id": entry.project_id, "analysis.resampled_cache": name}, {"$unset": {"analysis.resampled_cache": ""}}
+            )
+        if entry.kind in ("stems", "transformed", "22050.npy"):
+            self.on_project_change(entry.project_id)
+        await run_in_threadpool(_remove, entry.path)
+        return True
+
+    async def _evict_blobs(self, project_id, role, reference, digests):
+        """Unlink a project's derived blobs (e.g. its stems) and delete the ones nothing else uses"""
+        if self.is_busy(project_id):
+            return False
+        if role == "stems":
+            update = ({"id": project_id, "stems_tree": reference}, {"$set": STEMS_RESET})
+        elif role == "resampled":
+            update = ({"id": project_id, "analysis.resampled_cache": reference},
+                      {"$unset": {"analysis.resampled_cache": ""}})
+        else:
+            update = ({"id": project_id, "transformed_file": reference}, {"$set": {"transformed_file": None}})
+        result = await self.db.projects.update_one(*update)
+        if result.matched_count == 0:
+            return False
+        self.on_project_change(project_id)
+        for digest in digests:
+            await run_in_threadpool(self.store.remove, digest)
+        return True
+
+    async def _offload(self, digest):
+        await run_in_threadpool(self.store.offload, digest)
+        return True
+
+    def _eviction_units(self, kept, blob_refs, roles, now):
+        """Everything that may be evicted under quota pressure"""
+        units = [
+            EvictionUnit(entry.path.name, entry.category, entry.size, entry.last_used,
+                         lambda entry=entry: self._evict(entry))
+            for entry in kept if entry.kind != "blob" and entry.category in ("derived", "cache")
+        ]
+
+        if self.store is not None and self.store.remote:
+            # Local blobs are only a cache; skip fresh ones that may still be on their way up
+            units.extend(
+                EvictionUnit(f"local copy of blob {entry.digest}", self._category(entry, blob_refs), entry.size,
+                             entry.last_used, lambda digest=entry.digest: self._offload(digest))
+                for entry in kept if entry.kind == "blob" and now - entry.modified >= self.grace_seconds
+            )
+            return units
+
+        blobs = {entry.digest: entry for entry in kept if entry.kind == "blob"}
+        groups = {}
+        for digest, refs in blob_refs.items():
+            if digest not in blobs or any(role == "original" for _, role in refs):
+                continue
+            for ref in refs:
+                groups.setdefault(ref, []).append(digest)
+
+        for (project_id, role), digests in groups.items():
+            # Only blobs this group alone references are freed by evicting it
+            exclusive = [digest for digest in digests if blob_refs[digest] == {(project_id, role)}]
+            size = sum(blobs[digest].size for digest in exclusive)
+            if not size:
+                continue
+            last_used = max(blobs[digest].last_used for digest in digests)
+            reference = roles[(project_id, role)]
+            units.append(EvictionUnit(
+                f"{role} of project {project_id}", "derived", size, last_used,
+                lambda project_id=project_id, role=role, reference=reference, exclusive=exclusive:
+                    self._evict_blobs(project_id, role, reference, exclusive)
+            ))
+        return units
+
+    async def _collect_remote(self, blob_refs, now):
+        """Delete unreferenced blobs from remote storage; returns (bytes, blobs) removed"""
+        driver = self.store.driver
+        listing = await run_in_threadpool(lambda: list(driver.iter_blobs()))
+        orphans = {digest for digest, _, modified in listing
+                   if digest not in blob_refs and now - modified >= self.grace_seconds}
+        if orphans:
+            # Listing a bucket takes a while; projects saved since the pass began may reference these now
+            _, blob_refs, _ = await self._project_references()
+        reclaimed, removed, usage = 0, 0, 0
+        for digest, size, modified in listing:
+            if digest in orphans and digest not in blob_refs:
+                await run_in_threadpool(driver.delete, digest)
+                logger.info(f"Removed orphaned blob {digest} from {driver.name} storage ({size} bytes)")
+                reclaimed += size
+                removed += 1
+            else:
+                usage += size
+        self.stats["remote_usage_bytes"] = usage
+        return reclaimed, removed
+
+    @staticmethod
+    def _category(entry, blob_refs):
+        if entry.kind == "blob" and any(role == "original" for _, role in blob_refs.get(entry.digest, ())):
+            return "original"
+        return entry.category
+
+    async def run_once(self):
+        """One reconciliation pass; returns the bytes reclaimed"""
+        async with self._lock:
+            started = time.monotonic()
+            now = time.time()
+            references, blob_refs, roles = await self._project_references()
+            entries = await run_in_threadpool(scan_uploads, self.upload_dir, self.cache_dirs, self.store)
+
+            reclaimed, removed, orphans = 0, 0, 0
+            kept = []
+            for entry in entries:
+                if self._is_orphan(entry, references, blob_refs, now):
+                    if entry.kind == "blob":
+                        await run_in_threadpool(self.store.remove, entry.digest)
+                    else:
+                        await run_in_threadpool(_remove, entry.path)
+                    logger.info(f"Removed orphaned upload artifact {entry.path.name} ({entry.size} bytes)")
+                    reclaimed += entry.size
+                    removed += 1
+                    orphans += 1
+                else:
+                    kept.append(entry)
+
+            if self.store is not None and self.store.remote:
+                remote_reclaimed, remote_orphans = await self._collect_remote(blob_refs, now)
+                reclaimed += remote_reclaimed
+                removed += remote_orphans
+                orphans += remote_orphans
+
+            usage = sum(entry.size for entry in kept)
+            by_category = {}
+            for entry in kept:
+                category = self._category(entry, blob_refs)
+                by_category[category] = by_category.get(category, 0) + entry.size
+
+            evictions = 0
+            if self.quota_bytes and usage > self.quota_bytes:
+                for unit in sorted(self._eviction_units(kept, blob_refs, roles, now), key=lambda unit: unit.last_used):
+                    if usage <= self.quota_bytes:
+                        break
+                    if await unit.evict():
+                        logger.info(f"Evicted {unit.label} ({unit.size} bytes) to stay within the uploads quota")
+                        usage -= unit.size
+                        by_category[unit.category] -= unit.size
+                        reclaimed += unit.size
+                        removed += 1
+                        evictions += 1
+                if usage > self.quota_bytes:
+                    logger.warning(f"Uploads directory is {usage} bytes, over its {self.quota_bytes} byte quota, "
+                                   f"with nothing left to evict")
+
+            self.stats.update({
+                "runs": self.stats["runs"] + 1,
+                "last_run_at": datetime.now(timezone.utc).isoformat(),
+                "last_run_seconds": round(time.monotonic() - started, 3),
+                "last_error": None,
+                "bytes_reclaimed_total": self.stats["bytes_reclaimed_total"] + reclaimed,
+                "files_removed_total": self.stats["files_removed_total"] + removed,
+                "orphans_removed_total": self.stats["orphans_removed_total"] + orphans,
+                "evictions_total": self.stats["evictions_total"] + evictions,
+                "last_bytes_reclaimed": reclaimed,
+                "usage_bytes": usage,
+                "usage_by_category": by_category,
+            })
+            if reclaimed:
+                logger.info(f"Uploads GC reclaimed {reclaimed} bytes ({removed} entries); usage now {usage} bytes")
+            return reclaimed
+
+    async def run_forever(self, interval=UPLOAD_GC_INTERVAL_SECONDS):
+        """Background loop running a reconciliation pass every `interval` seconds"""
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                self.stats["last_error"] = str(e)
+                logger.error(f"Error collecting uploads directory: {str(e)}")
+            await asyncio.sleep(interval)
@@ -0,0 +1,237 @@
+"""
+Streaming audio uploads.
+
+Uploads are read in chunks and written off the event loop, hashed in the
+same pass, size/duration limited as early as possible and header-probed
+before the file is accepted.
+"""
+import os
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timezone
+from pathlib import Path
+
+from starlette.concurrency import run_in_threadpool
+from starlette.exceptions import HTTPException
+
+from audio_processing.probe import probe_audio_header, probe_bytes_needed
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', str(1024 * 1024)))
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', str(200 * 1024 * 1024)))
+MAX_UPLOAD_DURATION_SECONDS = float(os.environ.get('MAX_UPLOAD_DURATION_SECONDS', '900'))
+
+ALLOWED_CONTENT_TYPES = ['audio/mpeg', 'audio/wav', 'audio/mp3', 'audio/x-wav']
+ALLOWED_FORMATS = {"wav", "mp3"}
+
+# Multipart framing around the file part
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+class UploadError(Exception):
+    """An upload was rejected; carries the HTTP status to report"""
+
+    def __init__(self, status_code, detail):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def check_duration(header, size_bytes=None):
+    """Reject audio longer than MAX_UPLOAD_DURATION_SECONDS, using the best duration known so far"""
+    duration = header.get("duration_seconds")
+    if duration is None and size_bytes and header.get("byte_rate"):
+        duration = (size_bytes - (header.get("data_offset") or 0)) / header["byte_rate"]
+
+    if duration is not None and duration > MAX_UPLOAD_DURATION_SECONDS:
+        raise UploadError(
+            413, f"Audio is too long ({duration:.0f}s). Maximum duration is {MAX_UPLOAD_DURATION_SECONDS:.0f}s."
+        )
+
+
+def validate_header(head, total_size=None):
+    """Probe and validate the first bytes of an upload, returning the header info"""
+    header = probe_audio_header(head, total_size)
+    if not header or header["format"] not in ALLOWED_FORMATS:
+        raise UploadError(400, "Invalid file type. Please upload audio files only.")
+    check_duration(header, total_size)
+    return header
+
+
+def build_metadata(header, size_bytes, sha256, content_type, client_filename):
+    """Upload metadata stored on the project"""
+    duration = header.get("duration_seconds")
+    if duration is None and header.get("byte_rate"):
+        duration = (size_bytes - (header.get("data_offset") or 0)) / header["byte_rate"]
+
+    return {
+        "format": header["format"],
+        "sample_rate": header["sample_rate"],
+        "channels": header["channels"],
+        "duration_seconds": round(duration, 3) if duration is not None else None,
+        "size_bytes": size_bytes,
+        "sha256": sha256,
+        "content_type": content_type,
+        "client_filename": client_filename,
+        "uploaded_at": datetime.now(timezone.utc),
+    }
+
+
+def _write_chunk(buffer, hasher, chunk):
+    hasher.update(chunk)
+    buffer.write(chunk)
+
+
+def _remove_quietly(path):
+    try:
+        Path(path).unlink()
+    except FileNotFoundError:
+        pass
+
+
+async def save_upload(upload, store, analyzer=None):
+    """
+    Stream an UploadFile into the blob store.
+    Returns (blob name, metadata); raises UploadError if the upload is rejected.
+    """
+    async def chunks():
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+    return await save_upload_stream(
+        chunks(), store, upload.content_type, upload.filename,
+        declared_size=getattr(upload, "size", None), analyzer=analyzer
+    )
+
+
+def _feed_analyzer(analyzer, chunk):
+    try:
+        analyzer.feed(chunk)
+        return True
+    except Exception as e:
+        logger.warning(f"Streaming analysis disabled for this upload: {str(e)}")
+        analyzer.error = str(e)
+        return False
+
+
+async def save_upload_stream(chunks, store, content_type, client_filename,
+                             declared_size=None, analyzer=None):
+    """
+    Stream raw chunks (an async iterator of bytes) into the blob store as `<sha256>.<format>`.
+    If an analyzer is given, each chunk is also fed to it while the write is in flight.
+    Returns (filename, metadata); raises UploadError if the upload is rejected.
+    """
+    if content_type not in ALLOWED_CONTENT_TYPES:
+        raise UploadError(400, "Invalid file type. Please upload audio files only.")
+
+    if declared_size and declared_size > MAX_UPLOAD_BYTES:
+        raise UploadError(413, f"File too large. Maximum size is {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.")
+
+    temp_path = store.temp_path(".uploading")
+    hasher = hashlib.sha256()
+    size = 0
+    head = bytearray()
+    header = None
+    buffer = await run_in_threadpool(open, temp_path, "wb")
+
+    try:
+        async for chunk in chunks:
+            if not chunk:
+                continue
+
+            size += len(chunk)
+            if size > MAX_UPLOAD_BYTES:
+                raise UploadError(413, f"File too large. Maximum size is {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.")
+
+            # Probe the header as soon as enough bytes have arrived
+            if header is None:
+                head += chunk
+                # Usually PROBE_BYTES; more when the file starts with a large ID3 tag
+                if len(head) >= probe_bytes_needed(head):
+                    header = validate_header(bytes(head), declared_size)
+                    head = bytearray()
+            else:
+                check_duration(header, size)
+
+            if analyzer is not None:
+                # Decode/analyze and write to disk concurrently, both off the event loop
+                _, analyzing = await asyncio.gather(
+                    run_in_threadpool(_write_chunk, buffer, hasher, chunk),
+                    run_in_threadpool(_feed_analyzer, analyzer, chunk)
+                )
+                if not analyzing:
+                    analyzer = None
+            else:
+                await run_in_threadpool(_write_chunk, buffer, hasher, chunk)
+
+        if header is None:
+            if not head:
+                raise UploadError(400, "Uploaded file is empty.")
+            header = validate_header(bytes(head), size)
+
+        await run_in_threadpool(buffer.close)
+
+        filename = await run_in_threadpool(store.ingest, temp_path, hasher.hexdigest(), f".{header['format']}")
+
+    except BaseException:
+        await run_in_threadpool(buffer.close)
+        await run_in_threadpool(_remove_quietly, temp_path)
+        raise
+
+    metadata = build_metadata(header, size, hasher.hexdigest(), content_type, client_filename)
+    logger.info(f"Stored upload {filename}: {size} bytes, sha256={metadata['sha256'][:12]}")
+    return filename, metadata
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Reject oversized upload bodies before they are parsed.
+    Checks Content-Length up front and counts streamed bytes for chunked requests.
+    """
+
+    def __init__(self, app, max_bytes=MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES, path_suffix="/upload"):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_suffix = path_suffix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].endswith(self.path_suffix):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        content_length = headers.get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+            await self._reject(send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Raised while the form is being parsed, so FastAPI turns it into the response
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"File too large. Maximum size is {MAX_UPLOAD_BYTES // (1024 * 1024)} MB."
+                    )
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    async def _reject(self, send):
+        body = b'{"detail":"File too large. Maximum size is %d MB."}' % (MAX_UPLOAD_BYTES // (1024 * 1024))
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
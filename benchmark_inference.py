@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Benchmark Basic Pitch inference runtimes (TensorFlow, TFLite, ONNX) on CPU.
+
+Each backend runs in its own process so model load time and memory are
+measured in isolation. Reports load time, per-call latency, throughput
+(seconds of audio transcribed per wall-clock second) and RSS.
+
+Usage:
+    python3 benchmark_inference.py --backends onnx tflite tensorflow --repeats 5
+"""
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent / "backend"))
+
+import argparse
+import multiprocessing
+import resource
+import statistics
+import tempfile
+import time
+
+import numpy as np
+import soundfile as sf
+
+
+def create_test_tones(duration, sample_rate=22050):
+    """C-E-G chord with an accent every second, as in debug_transform.py"""
+    t = np.linspace(0, duration, int(duration * sample_rate))
+
+    frequencies = [261.6, 329.6, 392.0]
+    audio = sum(np.sin(2 * np.pi * freq * t) * 0.2 for freq in frequencies)
+
+    for i in range(0, len(audio), sample_rate):
+        if i < len(audio) - 1000:
+            audio[i:i+1000] *= 1.5
+
+    return audio.astype(np.float32), sample_rate
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize() / (1024 * 1024)
+    except OSError:
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_backend(backend, audio_path, audio_seconds, repeats, intra_op_threads, inter_op_threads, results):
+    """Benchmark one backend (runs in a child process)"""
+    try:
+        rss_before = current_rss_mb()
+
+        from audio_processing.inference_runtime import get_inference_runtime
+        runtime = get_inference_runtime(backend, intra_op_threads, inter_op_threads)
+
+        start = time.perf_counter()
+        runtime.model
+        load_seconds = time.perf_counter() - start
+
+        # Warm-up call so one-off graph setup is not counted as latency
+        runtime.predict(audio_path)
+
+        latencies = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            runtime.predict(audio_path)
+            latencies.append(time.perf_counter() - start)
+
+        results.put({
+            "backend": backend,
+            "load_s": load_seconds,
+            "p50_s": statistics.median(latencies),
+            "max_s": max(latencies),
+            "throughput_x": audio_seconds / statistics.mean(latencies),
+            "rss_mb": current_rss_mb() - rss_before,
+            "peak_rss_mb": peak_rss_mb(),
+        })
+
+    except Exception as e:
+        results.put({"backend": backend, "error": str(e)})
+
+
+def main():
+    from audio_processing.inference_runtime import available_backends
+
+    parser = argparse.ArgumentParser(description="Benchmark Basic Pitch inference runtimes on CPU")
+    parser.add_argument("--backends", nargs="+", default=None, help="Backends to compare (default: all installed)")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of synthetic audio")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed predictions per backend")
+    parser.add_argument("--intra-op-threads", type=int, default=0, help="0 uses the runtime default")
+    parser.add_argument("--inter-op-threads", type=int, default=0, help="0 uses the runtime default")
+    args = parser.parse_args()
+
+    backends = args.backends or available_backends()
+    if not backends:
+        print("❌ No inference runtime installed (onnxruntime, tflite-runtime or tensorflow)")
+        return 1
+
+    print("🚀 Basic Pitch Inference Runtime Benchmark")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        audio, sr = create_test_tones(args.duration)
+        audio_path = Path(tmp) / "tones.wav"
+        sf.write(audio_path, audio, sr)
+        print(f"Synthetic audio: {args.duration:.1f}s at {sr}Hz, {args.repeats} repeats")
+        print(f"Threads: intra_op={args.intra_op_threads or 'default'}, inter_op={args.inter_op_threads or 'default'}")
+
+        # Fresh interpreter per backend so RSS and load times don't leak between runs
+        ctx = multiprocessing.get_context("spawn")
+        rows = []
+        for backend in backends:
+            print(f"\n🔍 Benchmarking {backend}...")
+            results = ctx.Queue()
+            proc = ctx.Process(
+                target=run_backend,
+                args=(backend, str(audio_path), args.duration, args.repeats,
+                      args.intra_op_threads, args.inter_op_threads, results)
+            )
+            proc.start()
+            proc.join()
+            rows.append(results.get() if not results.empty() else {"backend": backend, "error": f"exit code {proc.exitcode}"})
+
+    print("\n" + "=" * 50)
+    print("📊 RESULTS:")
+    print(f"{'backend':<12}{'load s':>9}{'p50 s':>9}{'max s':>9}{'x realtime':>12}{'RSS MB':>9}{'peak MB':>9}")
+    for row in rows:
+        if "error" in row:
+            print(f"{row['backend']:<12}❌ {row['error']}")
+            continue
+        print(
+            f"{row['backend']:<12}{row['load_s']:>9.2f}{row['p50_s']:>9.3f}{row['max_s']:>9.3f}"
+            f"{row['throughput_x']:>12.1f}{row['rss_mb']:>9.0f}{row['peak_rss_mb']:>9.0f}"
+        )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
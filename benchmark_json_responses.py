@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Benchmark the listing endpoints with each FAST_JSON_RESPONSES mode.
+
+Fills a scratch database with projects and user styles, then requests
+GET /api/projects and GET /api/user-styles in process (no network) with
+the default response path ("off"), then "validated" and "trusted" (see
+backend/services/fast_json.py). Reports p50/p99 latency per mode and
+checks that every mode returns the same JSON.
+
+Usage:
+    python3 benchmark_json_responses.py --mongo-url mongodb://localhost:27017 --documents 1000 --limit 1000
+"""
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent / "backend"))
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+
+from pymongo import MongoClient
+
+MODES = ("off", "validated", "trusted")
+
+
+def make_projects(count, epoch):
+    """Transformed, lyric-bearing projects shaped like the ones the app stores"""
+    docs = []
+    for i in range(count):
+        created = epoch + timedelta(seconds=i)
+        project_id = str(uuid.uuid4())
+        stems = ["vocals", "drums", "bass", "other"]
+        docs.append({
+            "id": project_id,
+            "name": f"Project {i}",
+            "original_file": f"{project_id}_beat.wav",
+            "original_metadata": {
+                "format": "wav", "sample_rate": 44100, "channels": 2, "duration_seconds": 180.5,
+                "size_bytes": 31_752_000, "sha256": uuid.uuid4().hex * 2, "content_type": "audio/wav",
+                "client_filename": "beat.wav", "uploaded_at": created,
+            },
+            "lyrics": "line of lyrics\n" * 16,
+            "lyrics_revision": 1,
+            "style": "trap",
+            "stems_directory": f"{project_id}_stems",
+            "stems_manifest": {stem: uuid.uuid4().hex * 2 for stem in stems},
+            "midi_files": [f"{stem}.mid" for stem in stems],
+            "musicxml_files": [f"{stem}.musicxml" for stem in stems],
+            "main_midi": "main.mid",
+            "stems_created": stems,
+            "transformation_type": "stems",
+            "transformation_complete": True,
+            "transform_state": "done",
+            "created_at": created,
+            "updated_at": created,
+        })
+    return docs
+
+
+def make_user_styles(count, epoch):
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "name": f"Style {i}",
+            "description": "Laid-back storytelling over dusty drums",
+            "sample_lyrics": "sample line\n" * 12,
+            "created_at": epoch + timedelta(seconds=i),
+        }
+        for i in range(count)
+    ]
+
+
+async def time_requests(client, path, repeats):
+    latencies = []
+    body = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        response = await client.get(path)
+        latencies.append((time.perf_counter() - start) * 1000)
+        response.raise_for_status()
+        body = response.json()
+    latencies.sort()
+    return {
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        "body": body,
+    }
+
+
+async def run(args, paths):
+    import httpx
+    from fastapi import FastAPI
+    import api
+    from services.database import mongo
+
+    app = FastAPI()
+    app.include_router(api.api_router)
+    mongo.connect(args.mongo_url, args.db)
+
+    results = {}
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            for mode in MODES:
+                api.FAST_JSON_RESPONSES = mode
+                print(f"🔍 {mode} ({args.requests} requests per endpoint)...")
+                for path in paths:
+                    # Warm up the pool and code paths
+                    await time_requests(client, path, 3)
+                    results[(mode, path)] = await time_requests(client, path, args.requests)
+    finally:
+        mongo.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark listing responses with and without the fast JSON path")
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db", default="lyricsbeats_benchmark", help="Scratch database (its collections are dropped)")
+    parser.add_argument("--documents", type=int, default=1000, help="Projects and user styles to create")
+    parser.add_argument("--limit", type=int, default=1000, help="Page size requested from each listing")
+    parser.add_argument("--requests", type=int, default=200, help="Timed requests per endpoint and mode")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch collections afterwards")
+    args = parser.parse_args()
+
+    client = MongoClient(args.mongo_url)
+    scratch = client[args.db]
+    scratch.projects.drop()
+    scratch.user_styles.drop()
+
+    print("🚀 JSON Response Benchmark")
+    print("=" * 50)
+    epoch = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    scratch.projects.insert_many(make_projects(args.documents, epoch))
+    scratch.user_styles.insert_many(make_user_styles(args.documents, epoch))
+    print(f"  inserted {args.documents:,} projects and {args.documents:,} user styles")
+
+    paths = (f"/api/projects?limit={args.limit}", f"/api/user-styles?limit={args.limit}")
+    results = asyncio.run(run(args, paths))
+
+    print("\n" + "=" * 50)
+    print(f"📊 RESULTS ({args.limit:,} documents per response):")
+    print(f"{'':<12}{'endpoint':<16}{'p50':>12}{'p99':>12}{'vs off':>10}  same JSON")
+    for path in paths:
+        endpoint = path.split("?")[0].replace("/api", "")
+        baseline = results[("off", path)]
+        for mode in MODES:
+            result = results[(mode, path)]
+            speedup = baseline["p50_ms"] / max(result["p50_ms"], 1e-6)
+            print(
+                f"{mode:<12}{endpoint:<16}{result['p50_ms']:>10.2f}ms{result['p99_ms']:>10.2f}ms"
+                f"{speedup:>9.1f}x  {'✅' if result['body'] == baseline['body'] else '❌'}"
+            )
+
+    if not args.keep:
+        scratch.projects.drop()
+        scratch.user_styles.drop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
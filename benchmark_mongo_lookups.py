@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Benchmark MongoDB lookups by `id` with and without the startup indexes.
+
+Fills a scratch collection with project-shaped documents (1M by default),
+times find_one({"id": ...}) and a newest-first listing page as a collection
+scan, then creates the indexes from services/db_indexes.py and times them
+again. Reports p50/p99 latency and the winning query plan.
+
+Usage:
+    python3 benchmark_mongo_lookups.py --mongo-url mongodb://localhost:27017 --documents 1000000
+"""
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent / "backend"))
+
+import argparse
+import os
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+
+from pymongo import MongoClient, DESCENDING
+
+
+def make_documents(start, count, epoch):
+    """Project-shaped documents with increasing created_at"""
+    docs = []
+    for i in range(start, start + count):
+        created = epoch + timedelta(seconds=i)
+        docs.append({
+            "id": str(uuid.uuid4()),
+            "name": f"Project {i}",
+            "style": "trap",
+            "lyrics": "line of lyrics\n" * 8,
+            "created_at": created.isoformat(),
+            "updated_at": created.isoformat(),
+        })
+    return docs
+
+
+def fill(collection, total, batch):
+    epoch = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    ids = []
+    start = time.perf_counter()
+    for offset in range(0, total, batch):
+        docs = make_documents(offset, min(batch, total - offset), epoch)
+        collection.insert_many(docs, ordered=False)
+        ids.extend(doc["id"] for doc in docs)
+        print(f"\r  inserted {offset + len(docs):,}/{total:,}", end="", flush=True)
+    print(f"\r  inserted {total:,} documents in {time.perf_counter() - start:.1f}s")
+    return ids
+
+
+def winning_stage(explained):
+    plan = explained.get("queryPlanner", {}).get("winningPlan", {})
+    stages = []
+    while plan:
+        stages.append(plan.get("stage"))
+        plan = plan.get("inputStage") or plan.get("queryPlan") or {}
+    return " <- ".join(stage for stage in stages if stage)
+
+
+def time_calls(fn, repeats):
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        "max_ms": latencies[-1],
+    }
+
+
+def measure(collection, ids, lookups):
+    lookup = time_calls(lambda: collection.find_one({"id": random.choice(ids)}), lookups)
+    listing = time_calls(
+        lambda: list(collection.find().sort([("created_at", DESCENDING), ("id", DESCENDING)]).limit(50)), lookups
+    )
+    plan = winning_stage(collection.find({"id": ids[0]}).limit(1).explain())
+    return lookup, listing, plan
+
+
+def main():
+    from services.db_indexes import INDEXES
+
+    parser = argparse.ArgumentParser(description="Benchmark MongoDB id lookups with and without indexes")
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db", default="lyricsbeats_benchmark", help="Scratch database (its collection is dropped)")
+    parser.add_argument("--documents", type=int, default=1_000_000)
+    parser.add_argument("--batch", type=int, default=10_000, help="Documents per insert_many")
+    parser.add_argument("--scan-lookups", type=int, default=20, help="Timed lookups without indexes (each is a full scan)")
+    parser.add_argument("--lookups", type=int, default=2000, help="Timed lookups with indexes")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch collection afterwards")
+    args = parser.parse_args()
+
+    client = MongoClient(args.mongo_url)
+    collection = client[args.db]["projects"]
+    collection.drop()
+
+    print("🚀 MongoDB Lookup Benchmark")
+    print("=" * 50)
+    ids = fill(collection, args.documents, args.batch)
+
+    print(f"\n🔍 Without indexes ({args.scan_lookups} lookups)...")
+    before = measure(collection, ids, args.scan_lookups)
+
+    print("🔧 Creating indexes...")
+    start = time.perf_counter()
+    collection.create_indexes(INDEXES["projects"])
+    build_seconds = time.perf_counter() - start
+    print(f"  built in {build_seconds:.1f}s")
+
+    print(f"🔍 With indexes ({args.lookups} lookups)...")
+    after = measure(collection, ids, args.lookups)
+
+    print("\n" + "=" * 50)
+    print(f"📊 RESULTS ({args.documents:,} documents):")
+    print(f"{'':<18}{'lookup p50':>12}{'lookup p99':>12}{'page p50':>12}{'page p99':>12}  plan")
+    for label, (lookup, listing, plan) in (("no indexes", before), ("indexes", after)):
+        print(
+            f"{label:<18}{lookup['p50_ms']:>10.2f}ms{lookup['p99_ms']:>10.2f}ms"
+            f"{listing['p50_ms']:>10.2f}ms{listing['p99_ms']:>10.2f}ms  {plan}"
+        )
+    print(f"Speed-up (lookup p50): {before[0]['p50_ms'] / max(after[0]['p50_ms'], 1e-6):.0f}x")
+
+    if not args.keep:
+        collection.drop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
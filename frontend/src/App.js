@@ -18,21 +18,28 @@ import './App.css';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
+const PROJECTS_PAGE_SIZE = 24;
 
 // Home/Landing Page Component
 const HomePage = () => {
   const navigate = useNavigate();
   const [projects, setProjects] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [isLoading, setIsLoading] = useState(true);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
 
   useEffect(() => {
     fetchProjects();
   }, []);
 
-  const fetchProjects = async () => {
+  // Most recently updated first, a page at a time (the API sends the next page's cursor in X-Next-Cursor)
+  const fetchProjects = async (after = null) => {
     try {
-      const response = await axios.get(`${API}/projects`);
-      setProjects(response.data);
+      const params = { view: 'summary', sort_by: 'updated_at', order: 'desc', limit: PROJECTS_PAGE_SIZE };
+      if (after) params.after = after;
+      const response = await axios.get(`${API}/projects`, { params });
+      setProjects(previous => after ? [...previous, ...response.data] : response.data);
+      setNextCursor(response.headers['x-next-cursor'] || null);
     } catch (error) {
       console.error('Error fetching projects:', error);
       toast.error('Failed to load projects');
@@ -41,6 +48,12 @@ const HomePage = () => {
     }
   };
 
+  const loadMoreProjects = async () => {
+    setIsLoadingMore(true);
+    await fetchProjects(nextCursor);
+    setIsLoadingMore(false);
+  };
+
   const createProject = async () => {
     const name = prompt('Enter project name:');
     if (!name) return;
@@ -214,6 +227,14 @@ const HomePage = () => {
               ))}
             </div>
           )}
+          
+          {nextCursor && (
+            <div className="text-center mt-8">
+              <Button onClick={loadMoreProjects} disabled={isLoadingMore} variant="outline" className="border-white/20 text-white hover:bg-white/10">
+                {isLoadingMore ? 'Loading...' : 'Load More Projects'}
+              </Button>
+            </div>
+          )}
         </div>
       </div>
     </div>
@@ -289,21 +310,19 @@ const StudioPage = () => {
     setIsTransforming(true);
     setTransformProgress(0);
     
+    // Follow the transform's progress as the server reports it
+    const events = new EventSource(`${API}/projects/${projectId}/events`);
+    const showProgress = (percent) => setTransformProgress(prev => Math.max(prev, Math.min(percent, 99)));
+    events.addEventListener('progress', (event) => showProgress(JSON.parse(event.data).percent));
+    // Transforms running on another server process report through the stored project state
+    events.addEventListener('project', (event) => {
+      const { transform_progress: progress } = JSON.parse(event.data).project;
+      if (progress) showProgress(progress.percent);
+    });
+    
     try {
-      // Simulate progress
-      const interval = setInterval(() => {
-        setTransformProgress(prev => {
-          if (prev >= 90) {
-            clearInterval(interval);
-            return 90;
-          }
-          return prev + 10;
-        });
-      }, 200);
-
       await axios.post(`${API}/projects/${projectId}/transform`);
       
-      clearInterval(interval);
       setTransformProgress(100);
       toast.success('Beat transformed successfully!');
       fetchProject();
@@ -311,6 +330,7 @@ const StudioPage = () => {
       console.error('Error transforming beat:', error);
       toast.error('Failed to transform beat');
     } finally {
+      events.close();
       setIsTransforming(false);
       setTransformProgress(0);
     }
@@ -320,18 +340,53 @@ const StudioPage = () => {
     setIsGenerating(true);
     
     try {
-      const response = await axios.post(`${API}/projects/${projectId}/generate-lyrics`, {
-        project_id: projectId,
-        style: selectedStyle,
-        custom_prompt: customPrompt || undefined,
-        user_style_id: selectedStyle === 'custom' ? userStyles[0]?.id : undefined
+      // Lyrics arrive as Server-Sent Events while the model writes them
+      const response = await fetch(`${API}/projects/${projectId}/generate-lyrics/stream`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+          project_id: projectId,
+          style: selectedStyle,
+          custom_prompt: customPrompt || undefined,
+          user_style_id: selectedStyle === 'custom' ? userStyles[0]?.id : undefined
+        })
       });
+      if (!response.ok) throw new Error(`HTTP ${response.status}`);
+      
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffered = '';
+      let lyrics = '';
+      let finished = false;
+      while (!finished) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffered += decoder.decode(value, { stream: true });
+        const messages = buffered.split('\n\n');
+        buffered = messages.pop();
+        for (const message of messages) {
+          const type = message.match(/^event: (.*)$/m)?.[1];
+          const data = message.match(/^data: (.*)$/m)?.[1];
+          if (!type || !data) continue;
+          const event = JSON.parse(data);
+          if (type === 'token') {
+            lyrics += event.text;
+            setProject(prev => ({ ...prev, lyrics }));
+          } else if (type === 'error') {
+            throw new Error(event.detail);
+          } else if (type === 'done') {
+            finished = true;
+          }
+        }
+      }
+      if (!finished) throw new Error('Lyrics stream ended early');
       
       toast.success('Lyrics generated successfully!');
       fetchProject();
     } catch (error) {
       console.error('Error generating lyrics:', error);
       toast.error('Failed to generate lyrics');
+      fetchProject();
     } finally {
       setIsGenerating(false);
     }
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The backend is run from its own directory and imports its packages as top-level modules
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
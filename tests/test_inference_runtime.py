@@ -0,0 +1,27 @@
+import importlib
+
+from audio_processing import inference_runtime
+
+
+def installed(*names):
+    return lambda name: name in names
+
+
+def test_no_backend_without_basic_pitch(monkeypatch):
+    monkeypatch.setattr(inference_runtime, "_module_available", installed("onnxruntime", "tensorflow"))
+    assert inference_runtime.available_backends() == []
+
+
+def test_backends_with_basic_pitch(monkeypatch):
+    monkeypatch.setattr(inference_runtime, "_module_available", installed("basic_pitch", "onnxruntime", "tensorflow"))
+    assert inference_runtime.available_backends() == ["onnx", "tflite", "tensorflow"]
+
+
+def test_processing_unavailable_without_a_backend():
+    # The audio modules import without their optional dependencies and report what they can do
+    audio_processing = importlib.import_module("audio_processing")
+    stem_separation = importlib.import_module("audio_processing.stem_separation")
+    if not inference_runtime.available_backends():
+        assert audio_processing.AUDIO_PROCESSING_AVAILABLE is False
+        assert stem_separation.STEM_PROCESSING_AVAILABLE is False
+        assert stem_separation.extract_stems_and_convert_to_midi("song.wav", "out")["success"] is False
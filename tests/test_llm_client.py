@@ -0,0 +1,141 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+import services
+from services import llm_client, stream_completion
+from services.llm_client import LLMClientPool
+from services.lyrics_cache import LyricsCache
+
+
+class FakeLitellm:
+    def __init__(self, deltas=()):
+        self.deltas = list(deltas)
+        self.calls = []
+        self.aclient_session = None
+
+    async def acompletion(self, **kwargs):
+        self.calls.append({**kwargs, "client": self.aclient_session})
+        if kwargs.get("stream"):
+            return self._chunks()
+        message = SimpleNamespace(content=" " + "".join(self.deltas) + "\n")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    async def _chunks(self):
+        for delta in self.deltas:
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))])
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = LLMClientPool()
+    monkeypatch.setattr(services, "llm_pool", pool)
+    monkeypatch.setattr(services, "lyrics_cache", LyricsCache(variations=0))
+    return pool
+
+
+def use_litellm(monkeypatch, fake, api_base=None, key="sk-emergent-0123456789"):
+    monkeypatch.setattr(llm_client, "litellm", fake, raising=False)
+    monkeypatch.setattr(llm_client, "httpx", httpx, raising=False)
+    monkeypatch.setattr(llm_client, "LITELLM_AVAILABLE", True)
+    monkeypatch.setattr(llm_client, "LLM_API_BASE", api_base)
+    monkeypatch.setenv("EMERGENT_LLM_KEY", key)
+
+
+def collect(chunks):
+    async def run():
+        return [chunk async for chunk in chunks]
+    return asyncio.run(run())
+
+
+def test_emergent_key_without_api_base_is_not_streamed(monkeypatch, pool):
+    fake = FakeLitellm(["never", "sent"])
+    use_litellm(monkeypatch, fake)
+
+    async def complete(prompt, session_id=None):
+        return "whole lyrics"
+
+    monkeypatch.setattr(services, "AI_SERVICES_AVAILABLE", True)
+    monkeypatch.setattr(services, "complete", complete)
+
+    assert collect(stream_completion("prompt")) == ["whole lyrics"]
+    # The proxy-only key is never sent to the provider, and the fallback is counted
+    assert fake.calls == []
+    assert pool.metrics()["stream_fallbacks"] == 1
+
+
+def test_emergent_key_streams_through_api_base(monkeypatch, pool):
+    fake = FakeLitellm(["first ", "", "second"])
+    use_litellm(monkeypatch, fake, api_base="https://proxy.example/v1")
+
+    assert collect(stream_completion("prompt")) == ["first ", "second"]
+    assert len(fake.calls) == 1
+    assert fake.calls[0]["api_base"] == "https://proxy.example/v1"
+    assert fake.calls[0]["stream"] is True
+    assert pool.metrics()["stream_fallbacks"] == 0
+
+
+def test_provider_key_streams_without_api_base(monkeypatch, pool):
+    fake = FakeLitellm(["lyrics"])
+    use_litellm(monkeypatch, fake, key="sk-provider-key")
+
+    assert collect(stream_completion("prompt")) == ["lyrics"]
+    assert fake.calls[0]["api_base"] is None
+
+
+def test_emergent_key_without_api_base_asks_for_takes_in_one_prompt(monkeypatch, pool):
+    fake = FakeLitellm()
+    use_litellm(monkeypatch, fake)
+    prompts = []
+
+    async def complete(prompt, session_id=None):
+        prompts.append(prompt)
+        return "=== TAKE 1 ===\nfirst\n=== TAKE 2 ===\nsecond"
+
+    monkeypatch.setattr(services, "complete", complete)
+
+    assert asyncio.run(services.generate_variants("prompt", 2)) == ["first", "second"]
+    assert fake.calls == []
+    assert len(prompts) == 1
+
+
+def test_completions_share_the_pool_connections(monkeypatch, pool):
+    fake = FakeLitellm(["lyrics"])
+    use_litellm(monkeypatch, fake, api_base="https://proxy.example/v1")
+
+    async def run():
+        pool.start()
+        try:
+            return [await pool.complete("prompt", "system") for _ in range(3)]
+        finally:
+            await pool.stop()
+
+    assert asyncio.run(run()) == ["lyrics"] * 3
+    clients = [call["client"] for call in fake.calls]
+    assert isinstance(clients[0], httpx.AsyncClient)
+    assert all(client is clients[0] for client in clients)
+    # Each call still has its own session
+    assert len({call["user"] for call in fake.calls}) == 3
+    assert fake.aclient_session is None
+
+
+def test_closing_a_lyrics_stream_early_frees_its_slot(monkeypatch, pool):
+    import api
+
+    fake = FakeLitellm(["one ", "two ", "three"])
+    use_litellm(monkeypatch, fake, api_base="https://proxy.example/v1")
+
+    async def run():
+        events = api._lyrics_stream(None, "project", "prompt", "trap")
+        # The client reads the start event and one token, then disconnects
+        assert '"start"' in await events.__anext__()
+        assert '"token"' in await events.__anext__()
+        assert pool.in_flight == 1
+        await events.aclose()
+        # Released by the close itself, not whenever the event loop gets round to finalizing generators
+        assert pool.in_flight == 0
+
+    asyncio.run(run())
+    assert pool.metrics()["stream_fallbacks"] == 0
@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+import services
+from services import split_variants, variants_prompt, generate_variants, VARIANT_HEADING
+from services.lyrics_cache import LyricsCache
+
+
+def test_split_variants():
+    text = "=== TAKE 1 ===\nfirst verse\n\n=== Take 2 ===\nsecond verse\n  ==== TAKE 3 ====  \nthird verse\n"
+    assert split_variants(text, 3) == ["first verse", "second verse", "third verse"]
+
+
+def test_split_variants_keeps_at_most_count():
+    text = "=== TAKE 1 ===\na\n=== TAKE 2 ===\nb\n=== TAKE 3 ===\nc"
+    assert split_variants(text, 2) == ["a", "b"]
+
+
+def test_split_variants_without_headings():
+    assert split_variants("  just one take\n", 3) == ["just one take"]
+
+
+def test_split_variants_ignores_heading_text_inside_a_line():
+    assert split_variants("=== TAKE 1 ===\nI said === TAKE 2 === out loud", 2) == ["I said === TAKE 2 === out loud"]
+
+
+def test_variants_prompt_asks_for_headings():
+    prompt = variants_prompt("Write trap lyrics", 3)
+    assert prompt.startswith("Write trap lyrics")
+    assert "3 distinct takes" in prompt
+    assert VARIANT_HEADING.search('Start each take with a line of the form\n=== TAKE 1 ===\n')
+
+
+def test_takes_needs_enough_cached_variations():
+    cache = LyricsCache(variations=3, max_keys=10, ttl_seconds=60)
+    key = cache.key("prompt")
+    cache.store(key, "one")
+    cache.store(key, "two")
+    assert cache.takes(key, "prompt", 3) is None
+    assert cache.stats["hits"] == 0
+
+
+def test_takes_rotates_through_cached_variations():
+    cache = LyricsCache(variations=3, max_keys=10, ttl_seconds=60)
+    key = cache.key("prompt")
+    for lyrics in ("one", "two", "three"):
+        cache.store(key, lyrics)
+    assert cache.takes(key, "prompt", 2) == ["one", "two"]
+    assert cache.takes(key, "prompt", 2) == ["three", "one"]
+    assert cache.stats["hits"] == 2
+    assert cache.stats["tokens_saved"] > 0
+
+
+def test_takes_when_disabled():
+    cache = LyricsCache(variations=0)
+    assert cache.takes(cache.key("prompt"), "prompt", 1) is None
+
+
+@pytest.fixture
+def variants_cache(monkeypatch):
+    cache = LyricsCache(variations=3, max_keys=10, ttl_seconds=60)
+    monkeypatch.setattr(services, "lyrics_cache", cache)
+    return cache
+
+
+def test_generate_variants_uses_one_multi_choice_call(monkeypatch, variants_cache):
+    calls = []
+
+    async def complete_many(prompt, system_message, n, session_id=None):
+        calls.append(n)
+        return [f"take {i}" for i in range(n)] + [""]
+
+    monkeypatch.setattr(services, "litellm_reachable", lambda: True)
+    monkeypatch.setattr(services.llm_pool, "complete_many", complete_many)
+
+    assert asyncio.run(generate_variants("prompt", 3)) == ["take 0", "take 1", "take 2"]
+    assert calls == [3]
+    # Stored as cached takes, so the same request is answered without calling the model
+    assert asyncio.run(generate_variants("prompt", 2)) == ["take 0", "take 1"]
+    assert calls == [3]
+    # Unless it asks for fresh takes
+    asyncio.run(generate_variants("prompt", 2, fresh=True))
+    assert calls == [3, 2]
+
+
+def test_generate_variants_falls_back_to_a_structured_prompt(monkeypatch, variants_cache):
+    prompts = []
+
+    async def complete(prompt, session_id=None):
+        prompts.append(prompt)
+        return "=== TAKE 1 ===\nfirst\n=== TAKE 2 ===\nsecond"
+
+    monkeypatch.setattr(services, "litellm_reachable", lambda: False)
+    monkeypatch.setattr(services, "complete", complete)
+
+    assert asyncio.run(generate_variants("prompt", 2)) == ["first", "second"]
+    assert len(prompts) == 1 and "=== TAKE 1 ===" in prompts[0]
+    assert variants_cache.takes(variants_cache.key("prompt", services.LLM_MODEL_ID), "prompt", 2) == ["first", "second"]
@@ -0,0 +1,132 @@
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+from services.pagination import (
+    encode_cursor, decode_cursor, after_filter, field_projection, InvalidCursor, InvalidFields
+)
+
+
+def bson_key(value):
+    """BSON sort order for the values used here: strings before dates"""
+    return (0, value) if isinstance(value, str) else (1, value)
+
+
+def compare(value, op, bound):
+    # Like MongoDB, $lt/$gt only match values of the same type bracket
+    if isinstance(value, str) != isinstance(bound, str):
+        return False
+    return value < bound if op == "$lt" else value > bound
+
+
+def matches(doc, query):
+    """Evaluate the subset of the query language that after_filter produces"""
+    if "$or" in query:
+        return any(matches(doc, clause) for clause in query["$or"])
+    for field, condition in query.items():
+        value = doc[field]
+        if isinstance(condition, dict):
+            for op, bound in condition.items():
+                if op == "$type":
+                    if (bound == "string") != isinstance(value, str):
+                        return False
+                elif not compare(value, op, bound):
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+def walk(docs, order, limit):
+    """Page through `docs` by (created_at, id) the way paginate() does, returning every page"""
+    reverse = order == "desc"
+    ordered = sorted(docs, key=lambda doc: (bson_key(doc["created_at"]), doc["id"]), reverse=reverse)
+    pages, cursor = [], None
+    while True:
+        remaining = ordered
+        if cursor:
+            value, doc_id = decode_cursor(cursor, "created_at", order)
+            query = after_filter("created_at", order, value, doc_id)
+            remaining = [doc for doc in ordered if matches(doc, query)]
+        page = remaining[:limit]
+        pages.append([doc["id"] for doc in page])
+        if len(remaining) <= limit:
+            return pages
+        last = page[-1]
+        cursor = encode_cursor("created_at", order, last["created_at"], last["id"])
+
+
+@pytest.mark.parametrize("value", [
+    "2024-01-01T00:00:00+00:00",
+    datetime(2024, 1, 1, 12, 30, tzinfo=timezone.utc),
+    datetime(2024, 1, 1, 12, 30, 15, 123000),
+    42,
+    None,
+])
+def test_cursor_round_trip(value):
+    cursor = encode_cursor("created_at", "desc", value, "doc-1")
+    assert decode_cursor(cursor, "created_at", "desc") == (value, "doc-1")
+
+
+def test_cursor_is_url_safe():
+    cursor = encode_cursor("name", "asc", "??>>" * 10, "id/with+chars")
+    assert "=" not in cursor and "+" not in cursor and "/" not in cursor
+
+
+def test_cursor_for_another_ordering():
+    cursor = encode_cursor("created_at", "asc", "x", "1")
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, "created_at", "desc")
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, "updated_at", "asc")
+
+
+@pytest.mark.parametrize("cursor", ["", "not a cursor", "e30", "bnVsbA"])
+def test_malformed_cursor(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, "created_at", "asc")
+
+
+def test_after_filter_brackets():
+    date = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    # Descending from a date: earlier dates, then every string
+    assert after_filter("created_at", "desc", date, "a") == {"$or": [
+        {"created_at": {"$lt": date}},
+        {"created_at": date, "id": {"$lt": "a"}},
+        {"created_at": {"$type": "string"}},
+    ]}
+    # Ascending from a string: later strings, then every date
+    assert after_filter("created_at", "asc", "2024", "a")["$or"][-1] == {"created_at": {"$type": "date"}}
+    # Nothing follows the last bracket
+    assert len(after_filter("created_at", "asc", date, "a")["$or"]) == 2
+    assert len(after_filter("created_at", "desc", "2024", "a")["$or"]) == 2
+
+
+@pytest.mark.parametrize("order", ["asc", "desc"])
+@pytest.mark.parametrize("limit", [1, 2, 3, 7, 20])
+def test_pages_cover_mixed_timestamps(order, limit):
+    epoch = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    docs = []
+    for i in range(8):
+        # Older documents stored timestamps as ISO strings; some share a timestamp
+        created = epoch + timedelta(hours=i // 2)
+        docs.append({"id": f"d{i}", "created_at": created})
+        docs.append({"id": f"s{i}", "created_at": created.isoformat()})
+
+    pages = walk(docs, order, limit)
+    seen = [doc_id for page in pages for doc_id in page]
+    assert sorted(seen) == sorted(doc["id"] for doc in docs)
+    assert len(seen) == len(set(seen))
+    assert all(len(page) <= limit for page in pages)
+    # Strings sort before dates in BSON
+    brackets = [doc_id[0] for doc_id in seen]
+    assert brackets == sorted(brackets, reverse=order == "asc")
+
+
+def test_field_projection():
+    allowed = {"id": None, "name": None, "style": None, "created_at": None}
+    assert field_projection("name, style", allowed, required=("id", "created_at")) == {
+        "_id": 0, "id": 1, "created_at": 1, "name": 1, "style": 1
+    }
+    with pytest.raises(InvalidFields):
+        field_projection("name,lyrics", allowed)
@@ -0,0 +1,130 @@
+import asyncio
+import io
+import random
+import struct
+import zipfile
+
+import pytest
+
+from audio_processing.probe import probe_audio_header, probe_bytes_needed, PROBE_BYTES, MAX_ID3_TAG_BYTES
+from services.blob_store import BlobStore
+from services.uploads import save_upload_stream
+
+
+def wav_file(seconds=1.0, sample_rate=22050, channels=2):
+    data = b"\0\0" * channels * int(seconds * sample_rate)
+    fmt = struct.pack("<HHIIHH", 1, channels, sample_rate, sample_rate * 2 * channels, 2 * channels, 16)
+    body = b"WAVE" + b"fmt " + struct.pack("<I", 16) + fmt + b"data" + struct.pack("<I", len(data)) + data
+    return b"RIFF" + struct.pack("<I", len(body)) + body
+
+
+def mp3_frame(padding=0):
+    """An MPEG-1 Layer III frame: 128 kbps, 44.1 kHz, stereo"""
+    header = bytes([0xFF, 0xFB, 0x90 | (padding << 1), 0x00])
+    return header + b"\0" * (144 * 128000 // 44100 + padding - 4)
+
+
+def mp3_file(frames=100):
+    return b"".join(mp3_frame(padding=i % 2) for i in range(frames))
+
+
+def id3_tag(size=100):
+    syncsafe = bytes([(size >> shift) & 0x7F for shift in (21, 14, 7, 0)])
+    return b"ID3\x03\x00\x00" + syncsafe + b"\0" * size
+
+
+def test_wav():
+    data = wav_file(seconds=2.0)
+    header = probe_audio_header(data[:PROBE_BYTES], len(data))
+    assert header["format"] == "wav"
+    assert header["sample_rate"] == 22050
+    assert header["channels"] == 2
+    assert header["data_offset"] == 44
+    assert header["duration_seconds"] == pytest.approx(2.0)
+
+
+def test_mp3():
+    data = mp3_file()
+    header = probe_audio_header(data[:PROBE_BYTES], len(data))
+    assert header["format"] == "mp3"
+    assert header["sample_rate"] == 44100
+    assert header["channels"] == 2
+    assert header["bitrate_kbps"] == 128
+    assert header["data_offset"] == 0
+    assert header["duration_seconds"] == pytest.approx(100 * 1152 / 44100, rel=0.01)
+
+
+def test_mp3_after_id3_tag():
+    data = id3_tag(100) + mp3_file()
+    header = probe_audio_header(data[:PROBE_BYTES], len(data))
+    assert header["format"] == "mp3"
+    assert header["data_offset"] == 110
+
+
+def test_single_frame_mp3():
+    frame = mp3_frame()
+    assert probe_audio_header(frame, len(frame))["format"] == "mp3"
+
+
+def test_mp3_needs_a_second_frame():
+    data = mp3_frame() + b"\0" * 1000
+    assert probe_audio_header(data, len(data)) is None
+
+
+def test_mp3_frame_must_start_the_file():
+    data = b"\0" * 10 + mp3_file()
+    assert probe_audio_header(data[:PROBE_BYTES], len(data)) is None
+
+
+def test_random_bytes_are_rejected():
+    rng = random.Random(1234)
+    for _ in range(200):
+        data = bytes(rng.getrandbits(8) for _ in range(4096))
+        assert probe_audio_header(data, len(data)) is None
+
+
+def test_sync_word_inside_binary_is_rejected():
+    # A plausible frame header, but not at the start and not followed by another one
+    data = b"\x7fELF" + b"\0" * 60 + mp3_frame() + b"\x01" * 2000
+    assert probe_audio_header(data, len(data)) is None
+
+
+def test_zip_is_rejected():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("stems/vocals.wav", wav_file())
+        archive.writestr("notes.txt", "not audio")
+    data = buffer.getvalue()
+    assert probe_audio_header(data[:PROBE_BYTES], len(data)) is None
+
+
+def test_mp3_after_id3_tag_larger_than_probe_bytes():
+    # Embedded cover art: the first frame starts well past PROBE_BYTES
+    data = id3_tag(200 * 1024) + mp3_file()
+    assert probe_audio_header(data[:PROBE_BYTES], len(data)) is None
+    needed = probe_bytes_needed(data[:PROBE_BYTES])
+    assert PROBE_BYTES < needed < len(data)
+    header = probe_audio_header(data[:needed], len(data))
+    assert header["format"] == "mp3"
+    assert header["data_offset"] == 10 + 200 * 1024
+
+
+def test_probe_bytes_needed_is_capped():
+    assert probe_bytes_needed(wav_file()) == PROBE_BYTES
+    assert probe_bytes_needed(mp3_file()) == PROBE_BYTES
+    assert probe_bytes_needed(id3_tag(100) + mp3_file()) == PROBE_BYTES
+    assert probe_bytes_needed(id3_tag(0x0FFFFFFF)[:10]) < MAX_ID3_TAG_BYTES + 3 * 4096
+
+
+def test_upload_stream_waits_for_a_large_id3_tag(tmp_path):
+    data = id3_tag(200 * 1024) + mp3_file()
+
+    async def chunks():
+        for start in range(0, len(data), 16 * 1024):
+            yield data[start:start + 16 * 1024]
+
+    store = BlobStore(tmp_path)
+    filename, metadata = asyncio.run(save_upload_stream(chunks(), store, "audio/mpeg", "cover.mp3"))
+    assert filename.endswith(".mp3")
+    assert metadata["format"] == "mp3"
+    assert metadata["size_bytes"] == len(data)
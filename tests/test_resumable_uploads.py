@@ -0,0 +1,192 @@
+import asyncio
+import hashlib
+import struct
+from datetime import datetime, timezone
+
+import pytest
+
+from services.resumable_uploads import (
+    merge_ranges, missing_ranges, session_status, write_chunk, complete_session, part_path, _hash_file
+)
+from services.uploads import UploadError, validate_header
+
+
+class FakeSessions:
+    """The slice of an upload_sessions collection that the session functions use, holding one session"""
+
+    def __init__(self, session):
+        self.session = session
+
+    def _matches(self, query):
+        for field, condition in query.items():
+            value = self.session.get(field)
+            if isinstance(condition, dict):
+                if value not in condition["$in"]:
+                    return False
+            elif value != condition:
+                return False
+        return True
+
+    async def find_one_and_update(self, query, update, return_document=None):
+        if not self._matches(query):
+            return None
+        before = dict(self.session)
+        for field, delta in update.get("$inc", {}).items():
+            self.session[field] = self.session.get(field, 0) + delta
+        for field, value in update.get("$push", {}).items():
+            self.session[field] = self.session[field] + [value]
+        self.session.update(update.get("$set", {}))
+        return dict(self.session) if return_document else before
+
+    async def update_one(self, query, update):
+        await self.find_one_and_update(query, update)
+
+    async def delete_one(self, query):
+        self.session = {}
+
+
+class FakeDatabase:
+    def __init__(self, session):
+        self.upload_sessions = FakeSessions(session)
+
+
+def make_session(tmp_path, total_size=100):
+    session = {
+        "id": "session", "project_id": "project", "status": "open", "total_size": total_size,
+        "filename": "beat.wav", "content_type": "audio/wav",
+        "received": [], "writers": 0, "expires_at": datetime.now(timezone.utc),
+    }
+    with open(part_path(tmp_path, session["id"]), "wb") as f:
+        f.truncate(total_size)
+    return session
+
+
+async def chunks(*parts):
+    for part in parts:
+        yield part
+
+
+def test_merge_ranges():
+    assert merge_ranges([]) == []
+    assert merge_ranges([[50, 60], [0, 10], [10, 20], [15, 30]]) == [[0, 30], [50, 60]]
+    assert merge_ranges([[0, 100], [20, 30]]) == [[0, 100]]
+
+
+def test_missing_ranges():
+    assert missing_ranges([], 100) == [[0, 100]]
+    assert missing_ranges([[0, 30], [50, 60]], 100) == [[30, 50], [60, 100]]
+    assert missing_ranges([[10, 100]], 100) == [[0, 10]]
+    assert missing_ranges([[0, 100]], 100) == []
+
+
+def test_session_status_counts_overlaps_once():
+    status = session_status({
+        "id": "s", "project_id": "p", "status": "open", "total_size": 100,
+        "received": [[0, 40], [20, 60], [80, 100]], "expires_at": None,
+    })
+    assert status["received_bytes"] == 80
+    assert status["received_ranges"] == [[0, 60], [80, 100]]
+    assert status["missing_ranges"] == [[60, 80]]
+
+
+def test_chunks_out_of_order(tmp_path):
+    session = make_session(tmp_path)
+    db = FakeDatabase(session)
+
+    async def upload():
+        await write_chunk(db, tmp_path, session, 60, chunks(b"c" * 40))
+        await write_chunk(db, tmp_path, session, 0, chunks(b"a" * 10, b"a" * 20))
+        # A retried chunk overlapping what already arrived
+        return await write_chunk(db, tmp_path, session, 20, chunks(b"b" * 40))
+
+    updated = asyncio.run(upload())
+    assert updated["received"] == [[60, 100], [0, 30], [20, 60]]
+    assert session_status(updated)["missing_ranges"] == []
+    assert part_path(tmp_path, "session").read_bytes() == b"a" * 20 + b"b" * 40 + b"c" * 40
+
+
+@pytest.mark.parametrize("offset, data, status_code", [
+    (-1, b"x", 416),
+    (100, b"x", 416),
+    (90, b"x" * 11, 416),
+    (10, b"", 400),
+])
+def test_rejected_chunks(tmp_path, offset, data, status_code):
+    session = make_session(tmp_path)
+    with pytest.raises(UploadError) as error:
+        asyncio.run(write_chunk(FakeDatabase(session), tmp_path, session, offset, chunks(data)))
+    assert error.value.status_code == status_code
+    assert session["received"] == []
+    assert session["writers"] == 0
+
+
+def test_closed_session(tmp_path):
+    session = make_session(tmp_path)
+    session["status"] = "completing"
+    with pytest.raises(UploadError) as error:
+        asyncio.run(write_chunk(FakeDatabase(session), tmp_path, session, 0, chunks(b"x")))
+    assert error.value.status_code == 409
+
+
+def test_finalize_probe_reads_past_a_large_id3_tag(tmp_path):
+    tag = b"ID3\x03\x00\x00" + bytes([0, 0x0C, 0x40, 0]) + b"\0" * (200 * 1024)
+    frame = bytes([0xFF, 0xFB, 0x90, 0x00]) + b"\0" * (144 * 128000 // 44100 - 4)
+    data = tag + frame * 50
+    path = tmp_path / "upload.part"
+    path.write_bytes(data)
+
+    head, digest = _hash_file(path)
+    assert digest == hashlib.sha256(data).hexdigest()
+    assert validate_header(head, len(data))["format"] == "mp3"
+
+
+class FakeStore:
+    def __init__(self):
+        self.ingested = {}
+
+    def ingest(self, path, digest, ext):
+        self.ingested[digest] = path.read_bytes()
+        return f"{digest}{ext}"
+
+
+def wav_bytes(frames=1000):
+    data = b"\x01\x00" * frames
+    fmt = struct.pack("<HHIIHH", 1, 1, 22050, 44100, 2, 16)
+    body = b"WAVE" + b"fmt " + struct.pack("<I", 16) + fmt + b"data" + struct.pack("<I", len(data)) + data
+    return b"RIFF" + struct.pack("<I", len(body)) + body
+
+
+def test_finalize_waits_for_chunks_in_flight(tmp_path):
+    data = wav_bytes()
+    session = make_session(tmp_path, total_size=len(data))
+    db = FakeDatabase(session)
+    store = FakeStore()
+
+    async def upload():
+        await write_chunk(db, tmp_path, session, 0, chunks(data))
+        writing = asyncio.Event()
+        finish = asyncio.Event()
+
+        async def slow_retry():
+            yield data[:10]
+            writing.set()
+            await finish.wait()
+            yield data[10:20]
+
+        # A retried chunk is still being written when the client finalizes
+        retry = asyncio.create_task(write_chunk(db, tmp_path, session, 0, slow_retry()))
+        await writing.wait()
+        with pytest.raises(UploadError) as error:
+            await complete_session(db, tmp_path, dict(session), store)
+        assert error.value.status_code == 409
+        assert store.ingested == {}
+
+        finish.set()
+        await retry
+        return await complete_session(db, tmp_path, dict(db.upload_sessions.session), store)
+
+    filename, metadata = asyncio.run(upload())
+    digest = hashlib.sha256(data).hexdigest()
+    assert filename == f"{digest}.wav"
+    assert store.ingested[digest] == data
+    assert metadata["sha256"] == digest
@@ -0,0 +1,45 @@
+import pytest
+
+from services.static_files import parse_range
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-199", (100, 199)),
+    ("bytes=990-2000", (990, 999)),
+    # Open-ended
+    ("bytes=500-", (500, 999)),
+    ("bytes=0-", (0, 999)),
+    # Suffix: the last N bytes
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+])
+def test_satisfiable(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", [
+    None,
+    "",
+    "items=0-10",
+    "bytes=0-10,20-30",
+    "bytes=abc",
+    "bytes=-",
+    "bytes=a-10",
+    "bytes=10-5",
+    " bytes=1-2",
+])
+def test_whole_file(header):
+    assert parse_range(header, 1000) is None
+
+
+@pytest.mark.parametrize("header, size", [
+    ("bytes=1000-", 1000),
+    ("bytes=1000-1100", 1000),
+    ("bytes=-0", 1000),
+    ("bytes=-10", 0),
+    ("bytes=0-", 0),
+])
+def test_unsatisfiable(header, size):
+    with pytest.raises(ValueError):
+        parse_range(header, size)
@@ -0,0 +1,42 @@
+import asyncio
+import io
+import zipfile
+
+from starlette.requests import Request
+
+import services.stems_archive as stems_archive
+from services.stems_archive import StemsArchiveCache
+
+
+def download_request():
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": []})
+
+
+async def body(response):
+    return b"".join([chunk async for chunk in response.body_iterator])
+
+
+def test_requests_joining_a_build_before_its_file_exists(tmp_path, monkeypatch):
+    stem = b"\x01" * 200_000
+    (tmp_path / "vocals.wav").write_bytes(stem)
+    cache = StemsArchiveCache(tmp_path / "cache")
+    run_in_threadpool = stems_archive.run_in_threadpool
+
+    async def slow_open(fn, *args):
+        # Leave time for other requests to join before the partial file is created
+        if fn is open and args[1] == "wb":
+            await asyncio.sleep(0.05)
+        return await run_in_threadpool(fn, *args)
+
+    monkeypatch.setattr(stems_archive, "run_in_threadpool", slow_open)
+
+    async def download_concurrently():
+        responses = await asyncio.gather(*[
+            cache.response(download_request(), "project", [("vocals.wav", tmp_path / "vocals.wav")], "a" * 64, "x.zip")
+            for _ in range(3)
+        ])
+        return [await body(response) for response in responses]
+
+    for archive in asyncio.run(download_concurrently()):
+        with zipfile.ZipFile(io.BytesIO(archive)) as zipf:
+            assert zipf.read("vocals.wav") == stem
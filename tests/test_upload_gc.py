@@ -0,0 +1,63 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from services.upload_gc import UploadsGarbageCollector
+
+REFERENCED = "a" * 64
+ADOPTED = "b" * 64
+ORPHAN = "c" * 64
+
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    async def to_list(self, length):
+        return list(self.documents)
+
+
+class FakeProjects:
+    def __init__(self, projects):
+        self.projects = projects
+
+    def find(self, query, projection):
+        return FakeCursor(self.projects)
+
+
+class FakeDriver:
+    """A bucket whose listing takes long enough for a project to adopt one of its blobs"""
+
+    name = "fake"
+
+    def __init__(self, blobs, during_listing=None):
+        self.blobs = blobs
+        self.during_listing = during_listing or (lambda: None)
+        self.deleted = []
+
+    def iter_blobs(self):
+        self.during_listing()
+        for digest in self.blobs:
+            yield digest, 10, time.time() - 7200
+
+    def delete(self, digest):
+        self.deleted.append(digest)
+
+
+def test_remote_collection_rechecks_references_before_deleting(tmp_path):
+    projects = [{"id": "old", "original_file": f"{REFERENCED}.wav"}]
+    # Uploading the same content again skipped the upload, so the adopted blob still looks old
+    driver = FakeDriver(
+        [REFERENCED, ADOPTED, ORPHAN],
+        during_listing=lambda: projects.append({"id": "new", "original_file": f"{ADOPTED}.wav"}),
+    )
+    gc = UploadsGarbageCollector(SimpleNamespace(projects=FakeProjects(projects)), tmp_path,
+                                 store=SimpleNamespace(driver=driver), grace_seconds=3600)
+
+    async def run():
+        _, blob_refs, _ = await gc._project_references()
+        return await gc._collect_remote(blob_refs, time.time())
+
+    assert asyncio.run(run()) == (10, 1)
+    assert driver.deleted == [ORPHAN]
+    assert gc.stats["remote_usage_bytes"] == 20